@@ -0,0 +1,65 @@
+import sys
+import time
+
+from comando_llama.prompt import MODOS_SAIDA
+from utils.cache_prefixo import separar_template
+from utils.processador_llama import dividir_texto_por_prompt_seguro
+from utils.decodificacao_lote import criar_contexto_lote, fechar_contexto_lote, gerar_em_lote
+from utils.ingestao import iterar_narrativas
+
+# Compara tokens/s agregados da geração sequencial com a decodificação em lote (requer o modelo real)
+def executar(caminho_modelo, pasta_narrativas, max_narrativas=8, sequencias=(2, 4, 8), max_tokens=512, n_ctx=8192,
+             modo_saida="completo"):
+    from llama_cpp import Llama
+
+    llm = Llama(model_path=caminho_modelo, n_ctx=n_ctx, verbose=False)
+    config = MODOS_SAIDA[modo_saida]
+    prefixo, _ = separar_template(config["template"])
+    prompts = []
+    for i, (nome, texto) in enumerate(iterar_narrativas(pasta_narrativas)):
+        if i >= max_narrativas:
+            break
+        if texto:
+            for bloco in dividir_texto_por_prompt_seguro(texto, llm, config["template"], max_tokens_saida=max_tokens):
+                prompts.append(config["template"].format(textoClinico=bloco))
+
+    # Sequencial: um bloco por vez (o llama_cpp já reaproveita o prefixo comum entre chamadas)
+    inicio = time.perf_counter()
+    sequenciais = []
+    tokens_sequencial = 0
+    for prompt in prompts:
+        result = llm(prompt=prompt, max_tokens=max_tokens, temperature=0.0, stop=config["stop"])
+        sequenciais.append(result["choices"][0]["text"].strip())
+        tokens_sequencial += result["usage"]["completion_tokens"]
+    tempo_sequencial = time.perf_counter() - inicio
+
+    print(f"\n{len(prompts)} blocos, max_tokens={max_tokens}")
+    print("+-------------+--------+-----------+----------+------------------+")
+    print("| Modo        | Tokens | Tempo (s) | Tokens/s | Saídas idênticas |")
+    print("+-------------+--------+-----------+----------+------------------+")
+    print(f"| {'sequencial':<11} | {tokens_sequencial:6} | {tempo_sequencial:9.1f} | {tokens_sequencial / tempo_sequencial:8.1f} | {'-':>16} |")
+    resultados = {"sequencial": {"tokens": tokens_sequencial, "tempo": tempo_sequencial}}
+    for n_sequencias in sequencias:
+        contexto = criar_contexto_lote(llm, n_sequencias)
+        try:
+            saidas, estatisticas = gerar_em_lote(llm, contexto, prompts, max_tokens=max_tokens, temperature=0.0,
+                                                 stop=config["stop"], prefixo=prefixo)
+        finally:
+            fechar_contexto_lote(contexto)
+        iguais = sum(saida["texto"] == esperado for saida, esperado in zip(saidas, sequenciais))
+        modo = f"lote x{n_sequencias}"
+        print(f"| {modo:<11} | {estatisticas['tokens_gerados']:6} | {estatisticas['tempo']:9.1f} | "
+              f"{estatisticas['tokens_por_segundo']:8.1f} | {f'{iguais}/{len(prompts)}':>16} |")
+        resultados[modo] = estatisticas
+    print("+-------------+--------+-----------+----------+------------------+")
+    return resultados
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python -m benchmarks.bench_decodificacao_lote <modelo.gguf> [pasta_narrativas] [max_narrativas]")
+        sys.exit(1)
+    executar(
+        sys.argv[1],
+        sys.argv[2] if len(sys.argv) > 2 else "narrativas",
+        int(sys.argv[3]) if len(sys.argv) > 3 else 8,
+    )
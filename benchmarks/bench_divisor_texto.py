@@ -0,0 +1,100 @@
+import sys
+import time
+import random
+
+from comando_llama.prompt import PROMPT_TEMPLATE
+from utils.processador_llama import dividir_texto_por_prompt_seguro
+from benchmarks.llm_stub import LlmStub
+
+FRASES = [
+    "Paciente com HAS e ICC diagnosticada.",
+    "Apresenta dispneia aos esforços e edema em MMII.",
+    "Nega dor torácica.",
+    "Afebril, BEG, corada.",
+    "Refere tontura e cefaleia há 3 dias.",
+    "Ecocardiograma mostrou FE=35% e hipertrofia VE.",
+    "Mucosas úmidas e hipocoradas.",
+    "Em uso de ancoron e svt.",
+]
+
+# Gera uma narrativa sintética com o número pedido de sentenças
+def gerar_narrativa(n_sentencas, semente=0):
+    aleatorio = random.Random(semente)
+    linhas = []
+    for i in range(n_sentencas):
+        separador = "\n" if i % 5 == 4 else " "
+        linhas.append(aleatorio.choice(FRASES) + separador)
+    return "".join(linhas)
+
+# Implementação anterior (janela decrescente de 50 em 50 tokens), mantida só para comparação
+def dividir_texto_referencia(texto, llm, prompt_template, max_tokens_saida=256):
+    n_ctx = llm.n_ctx()
+    tokens = llm.tokenize(texto.encode())
+    blocos = []
+    inicio = 0
+    while inicio < len(tokens):
+        fim = len(tokens)
+        while fim > inicio:
+            bloco_texto = llm.detokenize(tokens[inicio:fim]).decode('utf-8', errors='ignore')
+            prompt = prompt_template.format(textoClinico=bloco_texto)
+            if len(llm.tokenize(prompt.encode())) + max_tokens_saida <= n_ctx:
+                blocos.append(bloco_texto)
+                inicio = fim
+                break
+            fim -= 50
+        else:
+            corte = (n_ctx - max_tokens_saida) // 2
+            bloco_tokens = tokens[inicio:inicio + corte]
+            blocos.append(llm.detokenize(bloco_tokens).decode('utf-8', errors='ignore'))
+            inicio += len(bloco_tokens)
+    return blocos
+
+# Mede tempo e chamadas ao tokenizador de uma função de divisão
+def medir(funcao, texto, llm, max_tokens_saida):
+    llm.chamadas_tokenize = 0
+    inicio = time.perf_counter()
+    blocos = funcao(texto, llm, PROMPT_TEMPLATE, max_tokens_saida=max_tokens_saida)
+    duracao = time.perf_counter() - inicio
+    return duracao, llm.chamadas_tokenize, blocos
+
+# Confere se nenhum bloco estoura a janela de contexto
+def verificar_blocos(blocos, llm, max_tokens_saida):
+    for bloco in blocos:
+        total = len(llm.tokenize(PROMPT_TEMPLATE.format(textoClinico=bloco).encode())) + max_tokens_saida
+        if total > llm.n_ctx():
+            return False
+    return True
+
+def executar(tamanhos=(250, 500, 1000, 2000, 4000, 8000), limite_referencia=2000, n_ctx=8192, max_tokens_saida=512):
+    llm = LlmStub(n_ctx=n_ctx)
+    resultados = []
+
+    print("+-----------+--------+----------+-----------+-------------+-------------+")
+    print("| Sentenças | Blocos | Novo (s) | Tokenize  |  Antigo (s) |  Tokenize   |")
+    print("+-----------+--------+----------+-----------+-------------+-------------+")
+    for n in tamanhos:
+        texto = gerar_narrativa(n)
+        tempo, chamadas, blocos = medir(dividir_texto_por_prompt_seguro, texto, llm, max_tokens_saida)
+        if not verificar_blocos(blocos, llm, max_tokens_saida):
+            raise AssertionError(f"Bloco excede a janela de contexto para {n} sentenças")
+
+        tempo_ref = chamadas_ref = None
+        if n <= limite_referencia:
+            tempo_ref, chamadas_ref, _ = medir(dividir_texto_referencia, texto, llm, max_tokens_saida)
+
+        resultados.append({
+            "sentencas": n, "blocos": len(blocos), "tempo": tempo, "chamadas_tokenize": chamadas,
+            "tempo_referencia": tempo_ref, "chamadas_tokenize_referencia": chamadas_ref,
+        })
+        ref = f"{tempo_ref:11.3f} | {chamadas_ref:11}" if tempo_ref is not None else f"{'-':>11} | {'-':>11}"
+        print(f"| {n:9} | {len(blocos):6} | {tempo:8.3f} | {chamadas:9} | {ref} |")
+    print("+-----------+--------+----------+-----------+-------------+-------------+")
+
+    # Crescimento linear: o tempo por sentença deve ficar aproximadamente constante
+    por_sentenca = [r["tempo"] / r["sentencas"] for r in resultados]
+    print(f"\nTempo por sentença (novo): min {min(por_sentenca) * 1e6:.1f} µs, max {max(por_sentenca) * 1e6:.1f} µs")
+    return resultados
+
+if __name__ == "__main__":
+    tamanhos = tuple(int(t) for t in sys.argv[1:]) or (250, 500, 1000, 2000, 4000, 8000)
+    executar(tamanhos)
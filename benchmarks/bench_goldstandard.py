@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import xml.etree.ElementTree as ET
+
+import pandas as pd
+
+from utils.processador_narrativa import comparar_com_goldstandard
+from utils.processador_xml import padronizar_string, relacoes
+from utils.processador_relacoes import tagDesejada
+
+TERMOS = [
+    ("dor", "Sign or Symptom"), ("dispneia", "Sign or Symptom"), ("edema", "Sign or Symptom"),
+    ("tontura", "Sign or Symptom"), ("cefaleia", "Sign or Symptom"), ("febre", "Sign or Symptom"),
+    ("has", "Disease or Syndrome"), ("icc", "Disease or Syndrome"), ("obeso", "Disease or Syndrome"),
+    ("angina", "Sign or Symptom|Disease or Syndrome"), ("diabetes", "Disease or Syndrome"),
+    ("cintilografia", "Diagnostic Procedure"), ("nega", "Negation"), ("peito", "Body Location or Region"),
+]
+
+# Gera narrativas XML sintéticas e um CSV mestre com achados do modelo (parte acerta, parte erra, com repetições)
+def gerar_corpus(pasta, n_narrativas, n_anotacoes, semente=0):
+    aleatorio = random.Random(semente)
+    linhas_csv = []
+    for n in range(n_narrativas):
+        nome = f"{1000 + n}.xml"
+        raiz = ET.Element("ANNOTATIONS")
+        ET.SubElement(raiz, "TEXT").text = "texto sintético"
+        tags = ET.SubElement(raiz, "TAGS")
+        rels = ET.SubElement(raiz, "RELATIONS")
+        termos_gold = []
+        for i in range(n_anotacoes):
+            termo, tag = aleatorio.choice(TERMOS)
+            ET.SubElement(tags, "annotation", id=str(i), tag=tag, text=termo)
+            termos_gold.append(termo)
+            if i and aleatorio.random() < 0.3:
+                ET.SubElement(rels, "rel", annotation1=str(aleatorio.randrange(i)), annotation2=str(aleatorio.randrange(i + 1)),
+                              reltype=aleatorio.choice(["associated_with", "negation_of"]))
+        ET.ElementTree(raiz).write(os.path.join(pasta, nome), encoding="utf-8")
+
+        for _ in range(n_anotacoes):
+            termo = aleatorio.choice(termos_gold) if aleatorio.random() < 0.7 else aleatorio.choice(TERMOS)[0] + " leve"
+            linhas_csv.append({
+                "nomeNarrativa": nome, "textoPrompt": "prompt", "textoAnalisado": termo,
+                "abreviacao": "", "categoria": "Sinal ou Sintoma",
+                "SCTID": aleatorio.choice(["NotFound", str(aleatorio.randint(10 ** 6, 10 ** 8))]),
+            })
+    caminho_csv = os.path.join(pasta, "mestre.csv")
+    pd.DataFrame(linhas_csv).to_csv(caminho_csv, index=False)
+    return caminho_csv
+
+# Implementação anterior de dados_relacionados (buscas XPath e duas varreduras das relações por anotação)
+def dados_relacionados_referencia(dicionarioRelacao, id, root, dado):
+    dadoFinal = ""
+    verNegado = False
+    anotacaoPrincipal = root.find(f".//annotation[@id='{id}']")
+    if anotacaoPrincipal is None:
+        return "", False
+    tagPrincipal = anotacaoPrincipal.get('tag')
+    for key, value_list in dicionarioRelacao.items():
+        for value in value_list:
+            if id == value['id_relacionado']:
+                anotRel = root.find(f".//annotation[@id='{key}']")
+                if anotRel is not None and "Diagnostic Procedure" in anotRel.get('tag'):
+                    return "", False
+    if "Diagnostic Procedure" in tagPrincipal:
+        return "", False
+    if "Negation" in tagPrincipal:
+        verNegado = True
+    for key, value_list in dicionarioRelacao.items():
+        for value in value_list:
+            if id == value['id_relacionado']:
+                anotRel = root.find(f".//annotation[@id='{key}']")
+                if anotRel is None:
+                    continue
+                tagRel = anotRel.get('tag')
+                if "Diagnostic Procedure" in tagRel:
+                    continue
+                if "Negation" in tagRel:
+                    verNegado = True
+                if tagDesejada(tagRel) or value['tipo_relacionamento'] == 'negation_of':
+                    dadoFinal += padronizar_string(anotRel.get('text')) + " "
+                    if value['tipo_relacionamento'] == 'negation_of':
+                        verNegado = True
+    dadoFinal += dado
+    return dadoFinal, verNegado
+
+# Implementação anterior (pd.concat por linha e laço aninhado), mantida só para comparação
+def comparar_referencia(csv_mestre, pasta_narrativas):
+    df_prompts = pd.read_csv(csv_mestre)
+    df_resultado = pd.DataFrame(columns=[
+        "nomeNarrativa", "textoPrompt", "categoria", "termoAnalisado",
+        "abreviacao", "SCTID", "semClin_nomeNarrativa", "semClin_textoAnalisado", "semClin_categoria", "classificacao"
+    ])
+    df_prompts = df_prompts.rename(columns={'textoAnalisado': 'termo'})
+    for narrativa_atual in df_prompts['nomeNarrativa'].unique():
+        df_narrativa_atual = df_prompts[df_prompts['nomeNarrativa'] == narrativa_atual].copy()
+        achados_prompt = df_narrativa_atual[['termo', 'textoPrompt', 'categoria', 'abreviacao', 'SCTID']].to_dict('records')
+        narrativa_semclin = os.path.join(pasta_narrativas, f"{narrativa_atual[:4]}.xml")
+        root = ET.parse(narrativa_semclin).getroot()
+        achados_semclin = []
+        relacao = relacoes(root)
+        for annotation in root.find('TAGS'):
+            specific_annotation = annotation.get('tag')
+            dado = padronizar_string(annotation.get('text'))
+            dadoFinal, negado = dados_relacionados_referencia(relacao, annotation.get('id'), root, dado)
+            if dadoFinal and ("Sign or Symptom" in specific_annotation or "Disease or Syndrome" in specific_annotation) and not negado and "Diagnostic Procedure" not in specific_annotation:
+                categoria = "Sinal ou Sintoma" if "Sign or Symptom" in specific_annotation else "Doença ou Síndrome"
+                achados_semclin.append({"narrativa": narrativa_semclin[-8:], "termo": dadoFinal, "categoria": categoria})
+        achados_semclin.sort(key=lambda item: item['termo'])
+        usado_prompt = [False] * len(achados_prompt)
+        usado_semclin = [False] * len(achados_semclin)
+
+        def linha(achado, achado_xml, classificacao):
+            return pd.DataFrame([{
+                "nomeNarrativa": narrativa_atual if achado else "",
+                "textoPrompt": achado["textoPrompt"] if achado else "",
+                "categoria": achado["categoria"] if achado else "",
+                "termoAnalisado": achado["termo"] if achado else "",
+                "abreviacao": achado["abreviacao"] if achado else "",
+                "SCTID": achado["SCTID"] if achado else "",
+                "semClin_nomeNarrativa": achado_xml['narrativa'] if achado_xml else "",
+                "semClin_textoAnalisado": achado_xml['termo'] if achado_xml else "",
+                "semClin_categoria": achado_xml["categoria"] if achado_xml else "",
+                "classificacao": classificacao
+            }])
+
+        for i, achado in enumerate(achados_prompt):
+            for j, achado_xml in enumerate(achados_semclin):
+                if not usado_prompt[i] and not usado_semclin[j] and achado["termo"] == achado_xml["termo"]:
+                    df_resultado = pd.concat([df_resultado, linha(achado, achado_xml, 'VP')], ignore_index=True)
+                    usado_prompt[i] = usado_semclin[j] = True
+                    break
+        for i, achado in enumerate(achados_prompt):
+            if not usado_prompt[i]:
+                df_resultado = pd.concat([df_resultado, linha(achado, None, 'FP')], ignore_index=True)
+        for j, achado_xml in enumerate(achados_semclin):
+            if not usado_semclin[j]:
+                df_resultado = pd.concat([df_resultado, linha(None, achado_xml, 'FN')], ignore_index=True)
+    return df_resultado
+
+# Mede o tempo de uma função de comparação
+def medir(funcao, csv_mestre, pasta):
+    inicio = time.perf_counter()
+    df = funcao(csv_mestre, pasta)
+    return time.perf_counter() - inicio, df
+
+def executar(tamanhos=(10, 50, 100, 200), n_anotacoes=40, limite_referencia=100):
+    print("+-------------+--------+----------+-------------+---------+")
+    print("| Narrativas  | Linhas | Novo (s) |  Antigo (s) | Iguais  |")
+    print("+-------------+--------+----------+-------------+---------+")
+    resultados = []
+    for n in tamanhos:
+        with tempfile.TemporaryDirectory() as pasta:
+            csv_mestre = gerar_corpus(pasta, n, n_anotacoes)
+            tempo, df = medir(comparar_com_goldstandard, csv_mestre, pasta)
+
+            tempo_ref = iguais = None
+            if n <= limite_referencia:
+                tempo_ref, df_ref = medir(comparar_referencia, csv_mestre, pasta)
+                # Mesma classificação, linha a linha e na mesma ordem
+                pd.testing.assert_frame_equal(df.astype(object), df_ref.astype(object), check_dtype=False)
+                iguais = True
+
+        resultados.append({"narrativas": n, "linhas": len(df), "tempo": tempo, "tempo_referencia": tempo_ref})
+        ref = f"{tempo_ref:11.3f} | {'sim':>7}" if iguais else f"{'-':>11} | {'-':>7}"
+        print(f"| {n:11} | {len(df):6} | {tempo:8.3f} | {ref} |")
+    print("+-------------+--------+----------+-------------+---------+")
+    return resultados
+
+if __name__ == "__main__":
+    tamanhos = tuple(int(t) for t in sys.argv[1:]) or (10, 50, 100, 200)
+    executar(tamanhos)
@@ -0,0 +1,73 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import time
+
+# Confere a partida rápida de cli.py e main.py: importá-los não pode carregar nenhum módulo pesado,
+# e subcomandos sem nada a fazer (ajuda, report sem Excel, evaluate sem saída mestre) devem terminar em menos de limite segundos.
+# Cada medição roda em um processo novo, como na linha de comando. Sai com código 1 se algo regredir.
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULOS_PESADOS = ["pandas", "numpy", "llama_cpp", "sklearn", "nltk", "openpyxl", "scipy", "pyarrow"]
+
+# Importa o módulo em um processo novo e retorna os módulos pesados carregados junto
+def modulos_pesados_importados(modulo):
+    codigo = (
+        f"import sys, json; import {modulo}; "
+        f"print(json.dumps(sorted(m for m in {MODULOS_PESADOS!r} if m in sys.modules)))"
+    )
+    saida = subprocess.run([sys.executable, "-c", codigo], cwd=RAIZ, capture_output=True, text=True, check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+# Tempo de parede de `python cli.py <argumentos>` em um processo novo (menor de repeticoes execuções)
+def medir_comando(argumentos, repeticoes=3):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, "cli.py", *argumentos], cwd=RAIZ, capture_output=True, text=True)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos)
+
+def executar(limite=1.0):
+    regressoes = []
+
+    print("\n📦 Módulos pesados carregados na importação")
+    for modulo in ("cli", "main"):
+        pesados = modulos_pesados_importados(modulo)
+        print(f"   import {modulo:<6} {', '.join(pesados) if pesados else 'nenhum'}")
+        if pesados:
+            regressoes.append(f"import {modulo} carrega {', '.join(pesados)}")
+
+    # Caminhos inexistentes: report e evaluate param logo na conferência dos arquivos
+    with tempfile.TemporaryDirectory() as pasta:
+        vazio = ["--resultados", os.path.join(pasta, "Resultados.xlsx"), "--saida-csv", os.path.join(pasta, "csv")]
+        comandos = {
+            "--help": ["--help"],
+            "extract --help": ["extract", "--help"],
+            "report (sem Excel)": ["report", *vazio],
+            "evaluate (sem saída)": ["evaluate", "--sem-metricas", *vazio],
+        }
+        print(f"\n⏱️  Partida a frio (limite {limite:.2f}s)")
+        print("+----------------------+-----------+")
+        print("| Comando              | Tempo (s) |")
+        print("+----------------------+-----------+")
+        for nome, argumentos in comandos.items():
+            tempo = medir_comando(argumentos)
+            marca = " ⚠️" if tempo > limite else ""
+            print(f"| {nome:<20} | {tempo:9.3f} |{marca}")
+            if tempo > limite:
+                regressoes.append(f"{nome} levou {tempo:.3f}s")
+        print("+----------------------+-----------+")
+
+    if regressoes:
+        print("\n❌ Regressões na partida:")
+        for regressao in regressoes:
+            print(f"   - {regressao}")
+        return 1
+    print("\n✅ Partida rápida preservada.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(executar(float(sys.argv[1]) if len(sys.argv) > 1 else 1.0))
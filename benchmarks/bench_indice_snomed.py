@@ -0,0 +1,116 @@
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+
+from utils.indice_snomed import (
+    construir_indice_rf2, abrir_indice_snomed, fechar_indice_snomed, buscar_conceito, buscar_termo, TIPO_FSN, TIPO_SINONIMO
+)
+from utils.mapeamento_snomed import verificar_pares_snomed
+
+CABECALHO_CONCEITOS = "id\teffectiveTime\tactive\tmoduleId\tdefinitionStatusId"
+CABECALHO_DESCRICOES = "id\teffectiveTime\tactive\tmoduleId\tconceptId\tlanguageCode\ttypeId\tterm\tcaseSignificanceId"
+
+# Gera arquivos Concept e Description (snapshot RF2) sintéticos: n_conceitos conceitos (1 em 10 inativo),
+# com FSN em inglês, sinônimos, uma descrição em português e algumas descrições inativas
+def gerar_rf2(pasta, n_conceitos, descricoes_por_conceito=4, semente=0):
+    aleatorio = random.Random(semente)
+    caminho_conceitos = os.path.join(pasta, "sct2_Concept_Snapshot_INT.txt")
+    caminho_descricoes = os.path.join(pasta, "sct2_Description_Snapshot-en_INT.txt")
+    esperado = {}
+    with open(caminho_conceitos, 'w', encoding='utf-8') as fc, open(caminho_descricoes, 'w', encoding='utf-8') as fd:
+        fc.write(CABECALHO_CONCEITOS + "\n")
+        fd.write(CABECALHO_DESCRICOES + "\n")
+        id_descricao = 1000000
+        for n in range(n_conceitos):
+            sctid = str(100000000 + n * 11)
+            ativo = n % 10 != 0
+            fc.write(f"{sctid}\t20240101\t{int(ativo)}\t900000000000207008\t900000000000074008\n")
+            termo_pt = f"termo {n} {aleatorio.choice(['dor', 'febre', 'edema', 'tosse'])}"
+            esperado[sctid] = {"ativo": ativo, "fsn": f"Finding {n} (finding)", "termo_pt": termo_pt}
+            descricoes = [("1", "en", TIPO_FSN, f"Finding {n} (finding)"), ("1", "pt", TIPO_SINONIMO, termo_pt),
+                          ("0", "en", TIPO_FSN, f"Old finding {n} (finding)")]
+            descricoes += [("1", "en", TIPO_SINONIMO, f"Synonym {n}.{i}") for i in range(descricoes_por_conceito - 2)]
+            for ativa, idioma, tipo, termo in descricoes:
+                id_descricao += 1
+                fd.write(f"{id_descricao}\t20240101\t{ativa}\t900000000000207008\t{sctid}\t{idioma}\t{tipo}\t{termo}\t900000000000448009\n")
+    return caminho_conceitos, caminho_descricoes, esperado
+
+# Confere o índice construído contra o esperado e os planos das consultas por SCTID e por termo; retorna a lista de erros
+def conferir_indice(destino, esperado):
+    erros = []
+    indice = abrir_indice_snomed(destino)
+    try:
+        for sctid, dados in list(esperado.items())[:1000]:
+            conceito = buscar_conceito(indice, sctid)
+            if conceito is None or conceito["ativo"] != dados["ativo"] or conceito["fsn"] != dados["fsn"]:
+                erros.append(f"conceito {sctid}: {conceito}")
+            elif dados["termo_pt"] not in conceito["descricoes_pt"]:
+                erros.append(f"descrição em português ausente em {sctid}")
+        plano = " ".join(str(linha) for linha in indice.execute(
+            "EXPLAIN QUERY PLAN SELECT termo FROM descricoes WHERE sctid = ?", ("1",)
+        ))
+        if "idx_descricoes_sctid" not in plano:
+            erros.append(f"consulta por SCTID sem índice: {plano}")
+
+        # Busca por termo normalizado: exata (sem acento nem maiúsculas) e por prefixo
+        for sctid, dados in list(esperado.items())[:1000]:
+            if (sctid, dados["termo_pt"]) not in buscar_termo(indice, dados["termo_pt"].upper()):
+                erros.append(f"busca exata de '{dados['termo_pt']}' sem {sctid}")
+        prefixo = buscar_termo(indice, "Finding 12", limite=50)
+        if not prefixo or any(not termo.lower().startswith("finding 12") for _, termo in prefixo):
+            erros.append(f"busca por prefixo: {prefixo[:3]}")
+        plano = " ".join(str(linha) for linha in indice.execute(
+            "EXPLAIN QUERY PLAN SELECT sctid FROM descricoes WHERE termo_normalizado >= ? AND termo_normalizado < ?",
+            ("a", "b")
+        ))
+        if "idx_descricoes_termo" not in plano:
+            erros.append(f"busca por termo sem índice: {plano}")
+
+        # Vereditos sem modelo: ausente -> 0, inativo -> 1, descrição idêntica -> 2
+        ativo = next(s for s, d in esperado.items() if d["ativo"])
+        inativo = next(s for s, d in esperado.items() if not d["ativo"])
+        pares = [("999", "dor"), (inativo, esperado[inativo]["termo_pt"]), (ativo, esperado[ativo]["termo_pt"])]
+        resultados, resolvidos = verificar_pares_snomed(pares, None, indice)
+        if resultados != [(0, 1.0), (1, 1.0), (2, 1.0)] or resolvidos != 3:
+            erros.append(f"vereditos pelo índice: {resultados}")
+    finally:
+        fechar_indice_snomed(indice)
+    return erros
+
+# Tempo médio de buscar_termo sobre os termos em português do release (em microssegundos)
+def medir_busca_termo(destino, esperado, n_buscas=1000):
+    termos = [dados["termo_pt"] for dados in list(esperado.values())[:n_buscas]]
+    indice = abrir_indice_snomed(destino)
+    try:
+        inicio = time.perf_counter()
+        for termo in termos:
+            buscar_termo(indice, termo)
+        return (time.perf_counter() - inicio) / len(termos) * 1e6
+    finally:
+        fechar_indice_snomed(indice)
+
+def executar(tamanhos=(20000, 100000)):
+    falhas = 0
+    for n_conceitos in tamanhos:
+        with tempfile.TemporaryDirectory() as pasta:
+            conceitos, descricoes, esperado = gerar_rf2(pasta, n_conceitos)
+            destino = os.path.join(pasta, "indice.sqlite")
+            inicio = time.perf_counter()
+            construir_indice_rf2([conceitos], [descricoes], destino)
+            tempo = time.perf_counter() - inicio
+            with sqlite3.connect(destino) as conexao:
+                n_descricoes = conexao.execute("SELECT COUNT(*) FROM descricoes").fetchone()[0]
+            erros = conferir_indice(destino, esperado)
+            falhas += len(erros)
+            print(f"   {n_conceitos:8} conceitos  {n_descricoes:8} descrições  {tempo:8.2f}s  "
+                  f"{n_descricoes / tempo:10.0f} descrições/s  busca por termo {medir_busca_termo(destino, esperado):7.1f} µs  "
+                  f"{'✅' if not erros else '❌'}")
+            for erro in erros[:5]:
+                print(f"      - {erro}")
+    return 1 if falhas else 0
+
+if __name__ == "__main__":
+    sys.exit(executar([int(n) for n in sys.argv[1:]] or (20000, 100000)))
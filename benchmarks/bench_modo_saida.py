@@ -0,0 +1,50 @@
+import sys
+import time
+
+from comando_llama.prompt import MODOS_SAIDA
+from utils.processador_llama import dividir_texto_por_prompt_seguro
+from utils.ingestao import iterar_narrativas
+
+# Compara tokens gerados e latência entre os modos de saída "completo" e "compacto" (requer o modelo real)
+def executar(caminho_modelo, pasta_narrativas, max_narrativas=5, max_tokens=512, n_ctx=8192):
+    from llama_cpp import Llama
+
+    llm = Llama(model_path=caminho_modelo, n_ctx=n_ctx, verbose=False)
+    totais = {modo: {"tokens": 0, "tempo": 0.0, "cortadas": 0} for modo in MODOS_SAIDA}
+
+    for i, (nome, texto) in enumerate(iterar_narrativas(pasta_narrativas)):
+        if i >= max_narrativas:
+            break
+        if texto is None:
+            continue
+        for modo, config in MODOS_SAIDA.items():
+            for bloco in dividir_texto_por_prompt_seguro(texto, llm, config["template"], max_tokens_saida=max_tokens):
+                prompt = config["template"].format(textoClinico=bloco)
+                inicio = time.perf_counter()
+                result = llm(prompt=prompt, max_tokens=max_tokens, temperature=0.0, stop=config["stop"])
+                totais[modo]["tempo"] += time.perf_counter() - inicio
+                totais[modo]["tokens"] += result["usage"]["completion_tokens"]
+                totais[modo]["cortadas"] += result["choices"][0]["finish_reason"] == "length"
+
+    print("+----------+----------------+-----------+----------+")
+    print("| Modo     | Tokens gerados | Tempo (s) | Cortadas |")
+    print("+----------+----------------+-----------+----------+")
+    for modo, total in totais.items():
+        print(f"| {modo:<8} | {total['tokens']:14} | {total['tempo']:9.1f} | {total['cortadas']:8} |")
+    print("+----------+----------------+-----------+----------+")
+
+    completo, compacto = totais["completo"], totais["compacto"]
+    if completo["tokens"] and completo["tempo"]:
+        print(f"\nEconomia do modo compacto: {1 - compacto['tokens'] / completo['tokens']:.1%} dos tokens gerados, "
+              f"{1 - compacto['tempo'] / completo['tempo']:.1%} do tempo.")
+    return totais
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python -m benchmarks.bench_modo_saida <modelo.gguf> [pasta_narrativas] [max_narrativas]")
+        sys.exit(1)
+    executar(
+        sys.argv[1],
+        sys.argv[2] if len(sys.argv) > 2 else "narrativas",
+        int(sys.argv[3]) if len(sys.argv) > 3 else 5,
+    )
@@ -0,0 +1,59 @@
+import sys
+import json
+import time
+import asyncio
+
+from benchmarks.llm_stub import LlmStub
+from benchmarks.bench_streaming import CENARIOS, NARRATIVA
+from utils.servico_extracao import criar_servico, iniciar_servico, encerrar_servico
+
+# Faz um pedido HTTP ao serviço em localhost e retorna (status, corpo JSON)
+async def requisitar(porta, metodo, caminho, dados=None, host="127.0.0.1"):
+    leitor, escritor = await asyncio.open_connection(host, porta)
+    corpo = json.dumps(dados).encode('utf-8') if dados is not None else b""
+    escritor.write(f"{metodo} {caminho} HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(corpo)}\r\n\r\n".encode() + corpo)
+    await escritor.drain()
+    resposta = await leitor.read()
+    escritor.close()
+    cabecalho, _, conteudo = resposta.partition(b"\r\n\r\n")
+    return int(cabecalho.split(b" ", 2)[1]), json.loads(conteudo)
+
+# Dispara pedidos simultâneos (parte com textos repetidos) contra o serviço com um LLM falso
+async def _executar(n_pedidos, tamanho_fila, timeout, latencia_token):
+    llm = LlmStub(resposta=CENARIOS["texto sobrando"], latencia_token=latencia_token)
+    servico = criar_servico(llm, streaming=True, tamanho_fila=tamanho_fila, timeout=timeout)
+    servidor = await iniciar_servico(servico, porta=0)
+    porta = servidor.sockets[0].getsockname()[1]
+
+    inicio = time.perf_counter()
+    pedidos = [
+        requisitar(porta, "POST", "/extrair", {"texto": f"{NARRATIVA} Pedido {i % 6}.", "nome": f"{i:04}.xml"})
+        for i in range(n_pedidos)
+    ]
+    respostas = await asyncio.gather(*pedidos)
+    duracao = time.perf_counter() - inicio
+    _, metricas = await requisitar(porta, "GET", "/metricas")
+    await encerrar_servico(servico, servidor)
+
+    status = {}
+    for codigo, _ in respostas:
+        status[codigo] = status.get(codigo, 0) + 1
+    return duracao, status, metricas, llm.tokens_gerados
+
+def executar(n_pedidos=40, tamanho_fila=16, timeout=5.0, latencia_token=0.0005):
+    duracao, status, metricas, tokens = asyncio.run(_executar(n_pedidos, tamanho_fila, timeout, latencia_token))
+    print(f"\n{n_pedidos} pedidos simultâneos em {duracao:.2f}s ({tokens} tokens gerados pelo LLM falso)")
+    print("Status HTTP:", ", ".join(f"{codigo}: {n}" for codigo, n in sorted(status.items())))
+    print("Contadores:", metricas["contadores"])
+    print("Tamanhos de lote:", metricas["tamanhos_lote"])
+    print("+-------------+-------+-----------+---------+---------+---------+")
+    print("| Latência    | Total | Média (s) | p50 (s) | p95 (s) | p99 (s) |")
+    print("+-------------+-------+-----------+---------+---------+---------+")
+    for nome, resumo in metricas["latencias"].items():
+        if resumo["total"]:
+            print(f"| {nome:<11} | {resumo['total']:5} | {resumo['media']:9.3f} | {resumo['p50']:7} | {resumo['p95']:7} | {resumo['p99']:7} |")
+    print("+-------------+-------+-----------+---------+---------+---------+")
+    return status, metricas
+
+if __name__ == "__main__":
+    executar(int(sys.argv[1]) if len(sys.argv) > 1 else 40)
@@ -0,0 +1,57 @@
+import sys
+import time
+import random
+
+from utils.similaridade import medir_similaridade, parear_similares
+
+TERMOS = [
+    "dor torácica", "dor no tórax", "dispneia aos esforços", "falta de ar", "edema em MMII",
+    "edema de membros inferiores", "hipertensão arterial sistêmica", "HAS", "insuficiência cardíaca",
+    "ICC", "cefaleia", "dor de cabeça", "tontura", "febre", "tosse seca", "náusea", "vômitos",
+]
+
+# Gera listas sintéticas de termos FP e FN de uma narrativa
+def gerar_termos(n, semente):
+    aleatorio = random.Random(semente)
+    return [" ".join(aleatorio.sample(TERMOS, 2)) for _ in range(n)]
+
+# Pareamento anterior: similaridade par a par e escolha gulosa do primeiro par acima do limiar
+def parear_referencia(termos_a, termos_b, limiar=0.7):
+    restantes_b = list(enumerate(termos_b))
+    pares = []
+    for i, t_a in enumerate(termos_a):
+        for posicao, (j, t_b) in enumerate(restantes_b):
+            resultado = medir_similaridade(t_a, t_b)
+            if resultado > limiar:
+                pares.append((i, j, resultado))
+                restantes_b.pop(posicao)
+                break
+    return pares
+
+def executar(tamanhos=(5, 10, 20, 40), limite_referencia=20):
+    print("+--------+-------------+-------+----------------+-------+")
+    print("| Termos | Matriz (s)  | Pares | Par a par (s)  | Pares |")
+    print("+--------+-------------+-------+----------------+-------+")
+    resultados = []
+    for n in tamanhos:
+        termos_a, termos_b = gerar_termos(n, 1), gerar_termos(n, 2)
+        inicio = time.perf_counter()
+        pares = parear_similares(termos_a, termos_b)
+        tempo = time.perf_counter() - inicio
+
+        tempo_ref = pares_ref = None
+        if n <= limite_referencia:
+            inicio = time.perf_counter()
+            pares_ref = parear_referencia(termos_a, termos_b)
+            tempo_ref = time.perf_counter() - inicio
+
+        resultados.append({"termos": n, "tempo": tempo, "pares": len(pares),
+                           "tempo_referencia": tempo_ref, "pares_referencia": None if pares_ref is None else len(pares_ref)})
+        ref = f"{tempo_ref:14.3f} | {len(pares_ref):5}" if tempo_ref is not None else f"{'-':>14} | {'-':>5}"
+        print(f"| {n:6} | {tempo:11.4f} | {len(pares):5} | {ref} |")
+    print("+--------+-------------+-------+----------------+-------+")
+    return resultados
+
+if __name__ == "__main__":
+    tamanhos = tuple(int(t) for t in sys.argv[1:]) or (5, 10, 20, 40)
+    executar(tamanhos)
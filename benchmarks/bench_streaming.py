@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import tempfile
+
+import pandas as pd
+
+from benchmarks.llm_stub import LlmStub
+from utils.processador_llama import PesquisaClin_Llama, PesquisaClin_Llama_streaming
+from utils.processador_csv import criar_dataframe_e_exportar_csv
+
+NARRATIVA = "Paciente com HAS e ICC. Apresenta dispneia aos esforços e edema em MMII. Nega dor torácica."
+
+ANOTADO = (
+    "Paciente com HAS [Texto analisado: HAS | Abreviação: Hipertensão Arterial Sistêmica | Categoria: Doença ou Síndrome | SCTID: 38341003] "
+    "e ICC [Texto analisado: ICC | Abreviação: Insuficiência Cardíaca Congestiva | Categoria: Doença ou Síndrome | SCTID: 42343007]. "
+    "Apresenta dispneia [Texto analisado: dispneia | Abreviação: None | Categoria: Sinal ou Sintoma | SCTID: 267036007] aos esforços "
+    "e edema em MMII [Texto analisado: edema em MMII | Abreviação: None | Categoria: Sinal ou Sintoma | SCTID: 271808008]. Nega dor torácica.\n\n"
+)
+SINAIS = "Sinais ou Sintomas: ([dispneia | None | Sinal ou Sintoma | 267036007], [edema em MMII | None | Sinal ou Sintoma | 271808008])\n"
+DOENCAS = ("Doenças ou Síndromes: ([HAS | Hipertensão Arterial Sistêmica | Doença ou Síndrome | 38341003], "
+           "[ICC | Insuficiência Cardíaca Congestiva | Doença ou Síndrome | 42343007])")
+
+# Respostas simuladas: listas seguidas de texto sobrando até max_tokens, e uma saída em laço
+CENARIOS = {
+    "texto sobrando": ANOTADO + SINAIS + DOENCAS + "\n\nObservação: " + "o paciente segue em acompanhamento ambulatorial. " * 40,
+    "laço": ANOTADO + SINAIS + "Doenças ou Síndromes: (" + "[HAS | Hipertensão Arterial Sistêmica | Doença ou Síndrome | 38341003], " * 40,
+}
+
+# Executa uma extração e retorna tokens gerados, tempo total, tempo até a primeira entidade e o texto da resposta
+def medir(funcao_extracao, resposta, max_tokens, latencia_token):
+    llm = LlmStub(resposta=resposta, latencia_token=latencia_token)
+    inicio = time.perf_counter()
+    primeira = None
+    resultado = funcao_extracao(NARRATIVA, llm, max_tokens=max_tokens, temperature=0.0)
+    if not isinstance(resultado, str):
+        fluxo = resultado
+        while True:
+            try:
+                next(fluxo)
+            except StopIteration as fim:
+                resultado = fim.value
+                break
+            if primeira is None:
+                primeira = time.perf_counter() - inicio
+    total = time.perf_counter() - inicio
+    return llm.tokens_gerados, total, primeira if primeira is not None else total, resultado
+
+# Linhas extraídas do texto da resposta, como no CSV individual
+def linhas_extraidas(resposta, pasta):
+    df = criar_dataframe_e_exportar_csv(resposta, os.path.join(pasta, "saida.csv"), "0000.xml")
+    return df if df is not None else pd.DataFrame()
+
+def executar(max_tokens=512, latencia_token=0.002):
+    print("+----------------+----------+--------+-----------+---------------------+---------------+")
+    print("| Cenário        | Modo     | Tokens | Total (s) | 1ª entidade (s)     | Linhas no CSV |")
+    print("+----------------+----------+--------+-----------+---------------------+---------------+")
+    resultados = []
+    with tempfile.TemporaryDirectory() as pasta:
+        for cenario, resposta in CENARIOS.items():
+            for modo, funcao in (("bloqueio", PesquisaClin_Llama), ("fluxo", PesquisaClin_Llama_streaming)):
+                tokens, total, primeira, texto = medir(funcao, resposta, max_tokens, latencia_token)
+                linhas = len(linhas_extraidas(texto, pasta))
+                resultados.append({"cenario": cenario, "modo": modo, "tokens": tokens, "tempo": total,
+                                   "primeira_entidade": primeira, "linhas": linhas})
+                print(f"| {cenario:<14} | {modo:<8} | {tokens:6} | {total:9.3f} | {primeira:19.3f} | {linhas:13} |")
+    print("+----------------+----------+--------+-----------+---------------------+---------------+")
+    return resultados
+
+if __name__ == "__main__":
+    executar(int(sys.argv[1]) if len(sys.argv) > 1 else 512)
@@ -0,0 +1,206 @@
+import os
+import sys
+import zlib
+import random
+from xml.sax.saxutils import escape, quoteattr
+
+from benchmarks.llm_stub import LlmStub
+from comando_llama.prompt import MODOS_SAIDA, MARCADOR_FIM_LISTAS
+from utils.cache_prefixo import separar_template
+
+# Corpus sintético no esquema das narrativas anotadas (<ANNOTATIONS>/<TEXT>/<TAGS>/<RELATIONS>), com offsets
+# consistentes com o texto, relações de localização/negação/procedimento e, opcionalmente, o *_goldstandard.xml
+# (Annotation_v1) ao lado de cada narrativa, como na pasta narrativas/.
+
+# A avaliação associa cada narrativa ao XML pelos 4 primeiros caracteres do nome, então os nomes têm 4 caracteres
+# em base 36 (até 36^4 = 1.679.616 documentos)
+DIGITOS_NOME = "0123456789abcdefghijklmnopqrstuvwxyz"
+MAXIMO_DOCUMENTOS = len(DIGITOS_NOME) ** 4
+
+# (texto, tag, expansão da abreviação, SCTID)
+SINTOMAS = [
+    ("dor", "Sign or Symptom", None, "22253000"), ("dispneia", "Sign or Symptom", None, "267036007"),
+    ("edema", "Sign or Symptom", None, "267038008"), ("tontura", "Sign or Symptom", None, "404640003"),
+    ("cefaleia", "Sign or Symptom", None, "25064002"), ("febre", "Sign or Symptom", None, "386661006"),
+    ("tosse", "Sign or Symptom", None, "49727002"), ("náusea", "Sign or Symptom", None, "422587007"),
+    ("palpitação", "Sign or Symptom", None, "80313002"), ("fadiga", "Sign or Symptom", None, "84229001"),
+    ("icterícia", "Sign or Symptom", None, "18165001"), ("sudorese", "Sign or Symptom", None, "415690000"),
+    ("angina", "Sign or Symptom|Disease or Syndrome", None, "194828000"),
+]
+DOENCAS = [
+    ("has", "Abbreviation|Disease or Syndrome", "Hipertensão Arterial Sistêmica", "38341003"),
+    ("icc", "Abbreviation|Disease or Syndrome", "Insuficiência Cardíaca Congestiva", "42343007"),
+    ("dm", "Abbreviation|Disease or Syndrome", "Diabetes Mellitus", "73211009"),
+    ("dac", "Abbreviation|Disease or Syndrome", "Doença Arterial Coronariana", "53741008"),
+    ("dpoc", "Abbreviation|Disease or Syndrome", "Doença Pulmonar Obstrutiva Crônica", "13645005"),
+    ("pneumonia", "Disease or Syndrome", None, "233604007"), ("obesidade", "Disease or Syndrome", None, "414916001"),
+    ("asma", "Disease or Syndrome", None, "195967001"),
+]
+LOCAIS = ["peito", "abdome", "cabeça", "membros inferiores", "dorso", "região lombar"]
+PROCEDIMENTOS = ["cintilografia miocárdica", "ecocardiograma", "cateterismo", "radiografia de tórax"]
+FRASES_NEUTRAS = [
+    "Sem alterações relevantes ao exame.", "Retorna para acompanhamento ambulatorial.",
+    "Em uso regular das medicações.", "Orientado quanto à dieta e atividade física.",
+]
+FRACAO_LONGOS = 0.02  # Parte dos documentos bem mais longa, para exercitar a divisão em blocos
+
+TERMOS_EXTRAIVEIS = {termo: (tag, expansao, sctid) for termo, tag, expansao, sctid in SINTOMAS + DOENCAS}
+
+# Nome de 4 caracteres (base 36) do documento i
+def nome_documento(i):
+    if not 0 <= i < MAXIMO_DOCUMENTOS:
+        raise ValueError(f"O corpus sintético comporta no máximo {MAXIMO_DOCUMENTOS} documentos.")
+    digitos = []
+    for _ in range(4):
+        i, resto = divmod(i, len(DIGITOS_NOME))
+        digitos.append(DIGITOS_NOME[resto])
+    return "".join(reversed(digitos))
+
+# Monta o texto de um documento e suas anotações (offsets no texto) e relações (origem -> destino, tipo)
+def gerar_documento(aleatorio, n_sentencas):
+    partes, anotacoes, relacoes_doc = [], [], []
+    posicao = 0
+
+    # Acrescenta um trecho ao texto; os termos entre {} viram anotações
+    def acrescentar(modelo, *termos):
+        nonlocal posicao
+        indices = []
+        pedacos = modelo.split("{}")
+        for pedaco, termo in zip(pedacos, termos + (None,)):
+            partes.append(pedaco)
+            posicao += len(pedaco)
+            if termo is not None:
+                texto, tag = termo
+                anotacoes.append({"tag": tag, "start": posicao, "end": posicao + len(texto), "text": texto})
+                indices.append(len(anotacoes) - 1)
+                partes.append(texto)
+                posicao += len(texto)
+        return indices
+
+    acrescentar(f"Data de Criação do Documento: {aleatorio.randint(1, 28):02}/{aleatorio.randint(1, 12):02}/20{aleatorio.randint(10, 24)}\n\n")
+    for _ in range(n_sentencas):
+        sintoma = aleatorio.choice(SINTOMAS)
+        forma = aleatorio.random()
+        if forma < 0.25:
+            s, l = acrescentar("Paciente refere {} em {}.", sintoma[:2], (aleatorio.choice(LOCAIS), "Body Location or Region"))
+            relacoes_doc.append((l, s, "associated_with"))
+        elif forma < 0.45:
+            acrescentar("{} há " + str(aleatorio.randint(1, 30)) + " dias.", (sintoma[0].capitalize(), sintoma[1]))
+        elif forma < 0.65:
+            doenca = aleatorio.choice(DOENCAS)
+            acrescentar("Histórico de {}.", doenca[:2])
+        elif forma < 0.78:
+            n, s = acrescentar("{} {}.", (aleatorio.choice(["Nega", "Sem"]), "Negation"), sintoma[:2])
+            relacoes_doc.append((n, s, "negation_of"))
+        elif forma < 0.9:
+            p, s = acrescentar("Realizou {} para avaliar {}.", (aleatorio.choice(PROCEDIMENTOS), "Diagnostic Procedure"), sintoma[:2])
+            relacoes_doc.append((p, s, "associated_with"))
+        else:
+            acrescentar(aleatorio.choice(FRASES_NEUTRAS))
+        acrescentar("\n" if aleatorio.random() < 0.3 else " ")
+    return "".join(partes), anotacoes, relacoes_doc
+
+# XML da narrativa anotada (mesmo esquema de narrativas/9053.xml)
+def xml_narrativa(texto, anotacoes, relacoes_doc, primeiro_id):
+    linhas = ['<?xml version="1.0" encoding="UTF-8" ?>', "<ANNOTATIONS>", f"<TEXT>{escape(texto)}</TEXT>", "<TAGS>"]
+    for i, a in enumerate(anotacoes):
+        linhas.append(f'<annotation id="{primeiro_id + i}" tag={quoteattr(a["tag"])} start="{a["start"]}" '
+                      f'end="{a["end"]}" text={quoteattr(a["text"])} abbr="" />')
+    linhas += ["</TAGS>", "<RELATIONS>"]
+    for origem, destino, tipo in relacoes_doc:
+        linhas.append(f'<rel annotation1="{primeiro_id + origem}" annotation2="{primeiro_id + destino}" reltype="{tipo}" />')
+    linhas += ["</RELATIONS>", "</ANNOTATIONS>", ""]
+    return "\n".join(linhas)
+
+# XML do gold standard no formato Annotation_v1 (ignorado pela ingestão, mas presente na pasta real)
+def xml_goldstandard_v1(texto, anotacoes):
+    linhas = ['<?xml version="1.0" encoding="UTF-8" ?>', "", "<Annotation_v1>", f"<TEXT>{escape(texto)}</TEXT>", "<TAGS>"]
+    for i, a in enumerate(anotacoes):
+        tipo = "Teste" if a["tag"] == "Diagnostic Procedure" else "Problema"
+        linhas.append(f'<EVENT id="E{i}" spans="{a["start"]}~{a["end"]}" text={quoteattr(a["text"])} Tipo="{tipo}" />')
+    linhas += ["</TAGS>", "</Annotation_v1>", ""]
+    return "\n".join(linhas)
+
+# Grava o corpus na pasta, um documento por vez (memória constante mesmo com 100 mil documentos)
+# Determinístico: a mesma semente e o mesmo número de documentos geram os mesmos arquivos
+def gerar_corpus(pasta, n_documentos, sentencas=(4, 12), semente=0, goldstandard_v1=True):
+    os.makedirs(pasta, exist_ok=True)
+    aleatorio = random.Random(semente)
+    estatisticas = {"documentos": 0, "anotacoes": 0, "relacoes": 0, "bytes": 0}
+    for i in range(n_documentos):
+        n_sentencas = aleatorio.randint(*sentencas)
+        if aleatorio.random() < FRACAO_LONGOS:
+            n_sentencas *= 10
+        texto, anotacoes, relacoes_doc = gerar_documento(aleatorio, n_sentencas)
+        nome = nome_documento(i)
+        conteudo = xml_narrativa(texto, anotacoes, relacoes_doc, primeiro_id=i * 10000).encode('utf-8')
+        with open(os.path.join(pasta, f"{nome}.xml"), 'wb') as f:
+            f.write(conteudo)
+        if goldstandard_v1:
+            with open(os.path.join(pasta, f"{nome}_goldstandard.xml"), 'w', encoding='utf-8') as f:
+                f.write(xml_goldstandard_v1(texto, anotacoes))
+        estatisticas["documentos"] += 1
+        estatisticas["anotacoes"] += len(anotacoes)
+        estatisticas["relacoes"] += len(relacoes_doc)
+        estatisticas["bytes"] += len(conteudo)
+    return estatisticas
+
+# Resposta simulada para um trecho de narrativa: extrai os termos do vocabulário que aparecem no texto,
+# com erros determinísticos (omissões, variações que viram VPP, negações não respeitadas e SCTIDs ausentes).
+# No modo compacto a resposta abre e separa as listas com linhas em branco, como o modelo às vezes faz, e termina no marcador
+def resposta_simulada(texto, modo_saida="completo"):
+    anotado, sinais, doencas = [], [], []
+    inicio = 0
+    for palavra_inicio, palavra in _palavras(texto):
+        termo = palavra.lower()
+        if termo not in TERMOS_EXTRAIVEIS:
+            continue
+        tag, expansao, sctid = TERMOS_EXTRAIVEIS[termo]
+        sorteio = zlib.crc32(f"{termo}|{palavra_inicio}|{len(texto)}".encode())
+        negado = texto[max(0, palavra_inicio - 5):palavra_inicio].lower() in ("nega ", "sem ")
+        if (negado and sorteio % 10) or sorteio % 9 == 0:
+            continue  # Respeita a negação (quase sempre) ou simplesmente não encontra o termo
+        texto_analisado = f"{palavra} importante" if sorteio % 6 == 0 else palavra
+        categoria = "Sinal ou Sintoma" if "Sign or Symptom" in tag else "Doença ou Síndrome"
+        codigo = "NotFound" if sorteio % 4 == 0 else sctid
+        fim = palavra_inicio + len(palavra)
+        anotado.append(texto[inicio:fim])
+        anotado.append(f" [Texto analisado: {texto_analisado} | Abreviação: {expansao} | Categoria: {categoria} | SCTID: {codigo}]")
+        inicio = fim
+        (sinais if categoria == "Sinal ou Sintoma" else doencas).append(f"[{texto_analisado} | {expansao} | {categoria} | {codigo}]")
+    anotado.append(texto[inicio:])
+
+    listas = f"Sinais ou Sintomas: ({', '.join(sinais)})\nDoenças ou Síndromes: ({', '.join(doencas)})"
+    if modo_saida == "compacto":
+        return "\n" + listas.replace("\n", "\n\n") + "\n" + MARCADOR_FIM_LISTAS
+    return "".join(anotado).strip() + "\n\n" + listas
+
+# Palavras do texto com a posição inicial de cada uma
+def _palavras(texto):
+    posicao = 0
+    for palavra in texto.replace("\n", " ").split(" "):
+        limpa = palavra.strip(".,;:")
+        if limpa:
+            yield posicao + palavra.index(limpa), limpa
+        posicao += len(palavra) + 1
+
+# LLM falso que responde a cada prompt com a resposta simulada do trecho de narrativa contido nele
+class LlmCorpus(LlmStub):
+
+    def __init__(self, n_ctx=8192, modo_saida="completo", latencia_token=0.0):
+        super().__init__(n_ctx=n_ctx, latencia_token=latencia_token)
+        self.modo_saida = modo_saida
+        self.prefixo, self.sufixo = separar_template(MODOS_SAIDA[modo_saida]["template"])
+
+    def __call__(self, prompt, max_tokens=256, temperature=0.7, stop=None, stream=False, **kwargs):
+        trecho = prompt[len(self.prefixo):len(prompt) - len(self.sufixo)] if prompt.startswith(self.prefixo) else prompt
+        self.resposta = resposta_simulada(trecho, self.modo_saida)
+        return super().__call__(prompt, max_tokens=max_tokens, temperature=temperature, stop=stop, stream=stream, **kwargs)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Uso: python -m benchmarks.corpus_sintetico <pasta> <n_documentos> [semente]")
+        sys.exit(1)
+    stats = gerar_corpus(sys.argv[1], int(sys.argv[2]), semente=int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+    print(f"✅ {stats['documentos']} documentos, {stats['anotacoes']} anotações e {stats['relacoes']} relações "
+          f"({stats['bytes'] / 1e6:.1f} MB) em {sys.argv[1]}")
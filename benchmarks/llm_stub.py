@@ -0,0 +1,60 @@
+import re
+import time
+
+# Separa palavras, espaços e pontuação, aproximando um tokenizador BPE
+REGEX_TOKEN = re.compile(r' ?\w+| ?[^\w\s]|\s+', re.UNICODE)
+
+# LLM falso e determinístico para benchmarks: tokeniza localmente e devolve respostas fixas
+class LlmStub:
+
+    def __init__(self, n_ctx=8192, resposta=None, latencia_token=0.0):
+        self._n_ctx = n_ctx
+        self.resposta = resposta or ""
+        self.latencia_token = latencia_token  # Tempo simulado de decodificação por token
+        self.tokens_gerados = 0
+        self.vocabulario = {}
+        self.inverso = {}
+        self.chamadas_tokenize = 0
+
+    def n_ctx(self):
+        return self._n_ctx
+
+    # Converte bytes em ids, criando novos ids sob demanda
+    def tokenize(self, texto, add_bos=True, special=False):
+        self.chamadas_tokenize += 1
+        tokens = [1] if add_bos else []
+        for pedaco in REGEX_TOKEN.findall(texto.decode('utf-8', errors='ignore')):
+            if pedaco not in self.vocabulario:
+                novo_id = len(self.vocabulario) + 2
+                self.vocabulario[pedaco] = novo_id
+                self.inverso[novo_id] = pedaco
+            tokens.append(self.vocabulario[pedaco])
+        return tokens
+
+    def detokenize(self, tokens):
+        return "".join(self.inverso.get(t, "") for t in tokens).encode('utf-8')
+
+    # Tokens da resposta fixa, respeitando max_tokens e as sequências de parada
+    def _tokens_resposta(self, max_tokens, stop):
+        texto = self.resposta
+        for sequencia in stop or []:
+            if sequencia in texto:
+                texto = texto[:texto.index(sequencia)]
+        pedacos = REGEX_TOKEN.findall(texto)
+        return pedacos[:max_tokens], "length" if len(pedacos) > max_tokens else "stop"
+
+    def _gerar(self, pedacos, motivo):
+        for i, pedaco in enumerate(pedacos):
+            if self.latencia_token:
+                time.sleep(self.latencia_token)
+            self.tokens_gerados += 1
+            yield {"choices": [{"text": pedaco, "finish_reason": motivo if i == len(pedacos) - 1 else None}]}
+
+    def __call__(self, prompt, max_tokens=256, temperature=0.7, stop=None, stream=False, **kwargs):
+        pedacos, motivo = self._tokens_resposta(max_tokens, stop)
+        if stream:
+            return self._gerar(pedacos, motivo)
+        for _ in self._gerar(pedacos, motivo):
+            pass
+        return {"choices": [{"text": "".join(pedacos), "finish_reason": motivo}],
+                "usage": {"completion_tokens": len(pedacos)}}
@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import itertools
+import contextlib
+import subprocess
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+from benchmarks.llm_stub import LlmStub
+from benchmarks.corpus_sintetico import gerar_corpus, resposta_simulada, LlmCorpus
+from comando_llama.prompt import PROMPT_TEMPLATE
+from utils.ingestao import iterar_narrativas, eh_narrativa
+from utils.processador_llama import dividir_texto_por_prompt_seguro
+from utils.processador_csv import criar_dataframe_e_exportar_csv
+from utils.processador_narrativa import processar_narrativas, criar_saida_mestre, comparar_com_goldstandard
+from utils.saida_colunar import abrir_saida_colunar
+from utils.processador_xml import construir_grafo_anotacoes, padronizar_string
+from utils.processador_relacoes import dados_relacionados
+from utils.similaridade import medir_similaridade
+from utils.avaliacao import (
+    marcar_vpp, aplicar_mapeamento_snomed, calcular_metricas, contar_snomed, exportar_resultados,
+    valor_celula, termo_abreviacao, narrativa_linha
+)
+from utils.verificacao_snomed import abrir_verificacoes, fechar_verificacoes, registrar_veredito, normalizar_sctid
+
+# Suíte de desempenho ponta a ponta sobre um corpus sintético e um LLM falso determinístico.
+# Cada etapa do pipeline é medida em separado e o resultado é gravado em benchmarks/resultados/<commit>.json,
+# para que uma regressão apareça na comparação com a execução anterior.
+
+PASTA_RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados")
+ESCALAS_PADRAO = (10, 100, 1000)
+LIMIAR_REGRESSAO = 0.20  # Etapa 20% mais lenta que na execução de referência é regressão
+MINIMO_SEGUNDOS_REGRESSAO = 0.05  # Diferenças menores que isso são ruído de medição
+
+N_CTX_DIVISOR = 4096  # Janela pequena para que os documentos longos sejam divididos em blocos
+MAX_TOKENS_DIVISOR = 512
+N_CTX_EXTRACAO = 16384  # Janela grande o bastante para a narrativa anotada inteira caber na resposta
+MAX_TOKENS_EXTRACAO = 4096
+LIMITE_PARES_SIMILARIDADE = 1000  # Pares FP x FN medidos um a um com medir_similaridade
+LIMITE_LINHAS_EXCEL = 1048575  # Linhas de dados que cabem em uma aba do Excel
+
+# Commit atual (hash curto) e se há alterações não commitadas
+def identificar_commit():
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=raiz, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        sujo = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=raiz,
+                                   capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return "sem-git", False
+    return commit, sujo
+
+# Gera o corpus na pasta, ou reaproveita o que já está lá se foi gerado com a mesma escala e semente
+def preparar_corpus(pasta, n_documentos, semente):
+    caminho_info = os.path.join(pasta, "corpus.json")
+    if os.path.exists(caminho_info):
+        with open(caminho_info, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+        if info["documentos"] == n_documentos and info["semente"] == semente:
+            return info, False
+        shutil.rmtree(pasta)
+    inicio = time.perf_counter()
+    info = gerar_corpus(pasta, n_documentos, semente=semente)
+    info.update({"semente": semente, "segundos_geracao": time.perf_counter() - inicio})
+    with open(caminho_info, 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    return info, True
+
+# Divisão do texto em blocos que cabem na janela de contexto
+def etapa_divisor(ctx):
+    llm = LlmStub(n_ctx=N_CTX_DIVISOR)
+    segundos, documentos, blocos = 0.0, 0, 0
+    for _, texto in iterar_narrativas(ctx["pasta"]):
+        inicio = time.perf_counter()
+        blocos += len(dividir_texto_por_prompt_seguro(texto, llm, PROMPT_TEMPLATE, max_tokens_saida=MAX_TOKENS_DIVISOR))
+        segundos += time.perf_counter() - inicio
+        documentos += 1
+    return {"segundos": segundos, "itens": documentos, "blocos": blocos}
+
+# Extração completa (ingestão, divisão, LLM falso e gravação incremental da saída colunar), como em main.py
+def etapa_extracao(ctx):
+    inicio = time.perf_counter()
+    ctx["saida_colunar"] = abrir_saida_colunar(ctx["pasta_csv"])
+    processar_narrativas(
+        ctx["pasta"], ctx["pasta_csv"], LlmCorpus(n_ctx=N_CTX_EXTRACAO), max_tokens=MAX_TOKENS_EXTRACAO,
+        temperature=0.0, retornar_caminhos=True, saida_colunar=ctx["saida_colunar"]
+    )
+    return {"segundos": time.perf_counter() - inicio, "itens": ctx["saida_colunar"]["narrativas"]}
+
+# Leitura da resposta do modelo e gravação do CSV individual (a resposta simulada não entra na medida)
+def etapa_csv(ctx):
+    pasta = os.path.join(ctx["saida"], "csv_isolado")
+    segundos, documentos, linhas = 0.0, 0, 0
+    for nome, texto in iterar_narrativas(ctx["pasta"]):
+        resposta = resposta_simulada(texto)
+        inicio = time.perf_counter()
+        df = criar_dataframe_e_exportar_csv(resposta, os.path.join(pasta, f"output_{nome}.csv"), nome)
+        segundos += time.perf_counter() - inicio
+        documentos += 1
+        linhas += 0 if df is None else len(df)
+    return {"segundos": segundos, "itens": documentos, "linhas": linhas}
+
+# Fechamento da saída mestre (colunar) gravada durante a extração
+def etapa_csv_mestre(ctx):
+    inicio = time.perf_counter()
+    ctx["saida_mestre"] = criar_saida_mestre([], ctx["pasta_csv"], saida_colunar=ctx["saida_colunar"])
+    return {"segundos": time.perf_counter() - inicio, "itens": ctx["saida_colunar"]["narrativas"]}
+
+# Comparação da saída mestre com as anotações dos XMLs (VP, FP e FN)
+def etapa_goldstandard(ctx):
+    inicio = time.perf_counter()
+    ctx["df_resultado"] = comparar_com_goldstandard(ctx["saida_mestre"], ctx["pasta"])
+    segundos = time.perf_counter() - inicio
+    df = ctx["df_resultado"]
+    narrativas = df.loc[df["nomeNarrativa"] != "", "nomeNarrativa"].nunique()
+    return {"segundos": segundos, "itens": narrativas, "linhas": len(df)}
+
+# Grafo de anotações e dados_relacionados de cada anotação (a leitura do XML não entra na medida)
+def etapa_relacoes(ctx):
+    segundos, anotacoes = 0.0, 0
+    for nome in sorted(os.listdir(ctx["pasta"])):
+        if not eh_narrativa(nome):
+            continue
+        root = ET.parse(os.path.join(ctx["pasta"], nome)).getroot()
+        inicio = time.perf_counter()
+        grafo = construir_grafo_anotacoes(root)
+        for anotacao in grafo["tags"]:
+            dados_relacionados(grafo, anotacao["id"], padronizar_string(anotacao["texto"]))
+        segundos += time.perf_counter() - inicio
+        anotacoes += len(grafo["tags"])
+    return {"segundos": segundos, "itens": anotacoes}
+
+# medir_similaridade sobre pares FP x FN da mesma narrativa (no máximo LIMITE_PARES_SIMILARIDADE pares)
+def etapa_similaridade(ctx):
+    grupos = {}
+    for _, linha in ctx["df_resultado"].iterrows():
+        coluna = {"FP": "termoAnalisado", "FN": "semClin_textoAnalisado"}.get(linha["classificacao"])
+        termo = valor_celula(linha[coluna]) if coluna else None
+        if termo is not None:
+            grupos.setdefault(narrativa_linha(linha), {"FP": [], "FN": []})[linha["classificacao"]].append(str(termo))
+    pares = list(itertools.islice(
+        ((fp, fn) for g in grupos.values() for fp in g["FP"] for fn in g["FN"]), LIMITE_PARES_SIMILARIDADE
+    ))
+    inicio = time.perf_counter()
+    for t1, t2 in pares:
+        medir_similaridade(t1, t2)
+    return {"segundos": time.perf_counter() - inicio, "itens": len(pares)}
+
+# Pós-processamento do relatório: VPP, coluna SNOMED (vereditos já registrados), métricas e Excel
+def etapa_avaliacao(ctx):
+    df = ctx["df_resultado"].copy()
+    verificacoes = abrir_verificacoes(os.path.join(ctx["saida"], "verificacoes.sqlite"))
+    registrados = set()
+    for _, linha in df.iterrows():
+        sctid, termo = valor_celula(linha["SCTID"]), valor_celula(linha["termoAnalisado"])
+        if not sctid or sctid == 'NotFound' or termo is None:
+            continue
+        abreviacao = valor_celula(linha["abreviacao"])
+        par = (normalizar_sctid(sctid), termo_abreviacao(termo, abreviacao) if abreviacao else termo)
+        if par not in registrados:
+            registrados.add(par)
+            registrar_veredito(verificacoes, *par, len(registrados) % 3)
+
+    inicio = time.perf_counter()
+    marcar_vpp(df)
+    aplicar_mapeamento_snomed(df, None, verificacoes)
+    calcular_metricas(df)
+    contar_snomed(df)
+    excel = len(df) <= LIMITE_LINHAS_EXCEL
+    if excel:
+        exportar_resultados(df, os.path.join(ctx["saida"], "resultados.xlsx"))
+    segundos = time.perf_counter() - inicio
+    fechar_verificacoes(verificacoes)
+    return {"segundos": segundos, "itens": len(df), "excel": excel}
+
+# Etapas na ordem do pipeline (cada uma usa o que as anteriores deixaram no contexto)
+ETAPAS = {
+    "divisor": etapa_divisor,
+    "extracao": etapa_extracao,
+    "csv": etapa_csv,
+    "csv_mestre": etapa_csv_mestre,
+    "goldstandard": etapa_goldstandard,
+    "relacoes": etapa_relacoes,
+    "similaridade": etapa_similaridade,
+    "avaliacao": etapa_avaliacao,
+}
+DEPENDENCIAS = {
+    "csv_mestre": ["extracao"], "goldstandard": ["csv_mestre"],
+    "similaridade": ["goldstandard"], "avaliacao": ["goldstandard"],
+}
+
+# Etapas pedidas mais as etapas de que elas dependem, na ordem do pipeline
+def resolver_etapas(nomes):
+    pedidas = set()
+    pendentes = list(nomes)
+    while pendentes:
+        nome = pendentes.pop()
+        if nome not in ETAPAS:
+            raise ValueError(f"Etapa desconhecida: {nome}. Etapas: {', '.join(ETAPAS)}")
+        if nome not in pedidas:
+            pedidas.add(nome)
+            pendentes.extend(DEPENDENCIAS.get(nome, []))
+    return [nome for nome in ETAPAS if nome in pedidas]
+
+# Executa as etapas sobre um corpus de n_documentos; as mensagens do pipeline são descartadas durante a medida
+def executar_escala(n_documentos, etapas=None, pasta_corpus=None, semente=0):
+    with tempfile.TemporaryDirectory() as saida:
+        pasta = pasta_corpus or os.path.join(saida, "corpus")
+        corpus, gerado = preparar_corpus(pasta, n_documentos, semente)
+        if gerado:
+            print(f"\n📄 Corpus com {corpus['documentos']} documentos gerado em {corpus['segundos_geracao']:.2f}s")
+        ctx = {"pasta": pasta, "saida": saida, "pasta_csv": os.path.join(saida, "csv")}
+        resultados = {}
+        for nome in resolver_etapas(etapas or list(ETAPAS)):
+            with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+                resultado = ETAPAS[nome](ctx)
+            resultado["itens_por_segundo"] = resultado["itens"] / resultado["segundos"] if resultado["segundos"] else 0.0
+            resultados[nome] = resultado
+            print(f"   {nome:<13} {resultado['segundos']:9.3f}s  {resultado['itens']:8} itens  "
+                  f"{resultado['itens_por_segundo']:12.1f} itens/s")
+    return {"corpus": {k: corpus[k] for k in ("documentos", "anotacoes", "relacoes", "bytes")}, "etapas": resultados}
+
+# Grava (ou completa) o arquivo de resultados do commit atual e retorna o caminho
+def salvar_resultados(execucoes, pasta_resultados=PASTA_RESULTADOS):
+    commit, sujo = identificar_commit()
+    os.makedirs(pasta_resultados, exist_ok=True)
+    caminho = os.path.join(pasta_resultados, f"{commit}{'-sujo' if sujo else ''}.json")
+    registro = {"escalas": {}}
+    if os.path.exists(caminho):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            registro = json.load(f)
+    registro.update({
+        "commit": commit, "sujo": sujo, "data": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(), "plataforma": platform.platform(),
+    })
+    # Etapas medidas de novo substituem as anteriores; as demais etapas da mesma escala são mantidas
+    for n, resultado in execucoes.items():
+        escala = registro["escalas"].setdefault(str(n), {"etapas": {}})
+        escala["corpus"] = resultado["corpus"]
+        escala["etapas"].update(resultado["etapas"])
+    caminho_temp = f"{caminho}.{os.getpid()}.tmp"
+    with open(caminho_temp, 'w', encoding='utf-8') as f:
+        json.dump(registro, f, ensure_ascii=False, indent=2)
+    os.replace(caminho_temp, caminho)
+    return caminho
+
+# Resultado de referência: o arquivo/commit indicado ou a execução mais recente de outro arquivo
+def carregar_referencia(caminho_atual, referencia=None, pasta_resultados=PASTA_RESULTADOS):
+    if referencia and os.path.isfile(referencia):
+        candidatos = [referencia]
+    else:
+        candidatos = [
+            os.path.join(pasta_resultados, nome) for nome in os.listdir(pasta_resultados)
+            if nome.endswith(".json") and os.path.join(pasta_resultados, nome) != caminho_atual
+            and (not referencia or nome.startswith(referencia))
+        ]
+    registros = []
+    for caminho in candidatos:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            registros.append(json.load(f))
+    return max(registros, key=lambda r: r["data"]) if registros else None
+
+# Compara etapa a etapa com a referência; retorna a lista de regressões (escala, etapa, antes, depois)
+def comparar_resultados(atual, referencia, limiar=LIMIAR_REGRESSAO):
+    regressoes = []
+    print(f"\nComparação com {referencia['commit']}{' (sujo)' if referencia.get('sujo') else ''} de {referencia['data']}:")
+    print("+------------+---------------+------------+------------+----------+")
+    print("| Documentos | Etapa         | Antes (s)  | Depois (s) | Variação |")
+    print("+------------+---------------+------------+------------+----------+")
+    for escala, execucao in atual["escalas"].items():
+        anterior = referencia["escalas"].get(escala)
+        if anterior is None:
+            continue
+        for nome, resultado in execucao["etapas"].items():
+            if nome not in anterior["etapas"]:
+                continue
+            antes, depois = anterior["etapas"][nome]["segundos"], resultado["segundos"]
+            variacao = (depois - antes) / antes if antes else 0.0
+            marca = ""
+            if variacao > limiar and depois - antes > MINIMO_SEGUNDOS_REGRESSAO:
+                marca = " ⚠️"
+                regressoes.append((escala, nome, antes, depois))
+            elif variacao < -limiar and antes - depois > MINIMO_SEGUNDOS_REGRESSAO:
+                marca = " 🚀"
+            print(f"| {escala:>10} | {nome:<13} | {antes:10.3f} | {depois:10.3f} | {variacao:+8.1%} |{marca}")
+    print("+------------+---------------+------------+------------+----------+")
+    return regressoes
+
+def executar(escalas=ESCALAS_PADRAO, etapas=None, pasta_corpus=None, semente=0, referencia=None,
+             pasta_resultados=PASTA_RESULTADOS):
+    execucoes = {}
+    for n in escalas:
+        print(f"\n🔹 {n} documentos")
+        # Com pasta_corpus, cada escala tem a sua subpasta (o corpus é reaproveitado entre execuções)
+        pasta = os.path.join(pasta_corpus, str(n)) if pasta_corpus else None
+        execucoes[n] = executar_escala(n, etapas, pasta, semente)
+
+    caminho = salvar_resultados(execucoes, pasta_resultados)
+    print(f"\n✅ Resultados gravados em {caminho}")
+    with open(caminho, 'r', encoding='utf-8') as f:
+        atual = json.load(f)
+    anterior = carregar_referencia(caminho, referencia, pasta_resultados)
+    if anterior is None:
+        print("\nNenhuma execução anterior para comparar.")
+        return atual, []
+    regressoes = comparar_resultados(atual, anterior)
+    if regressoes:
+        print(f"\n⚠️ {len(regressoes)} etapa(s) mais de {LIMIAR_REGRESSAO:.0%} mais lenta(s) que em {anterior['commit']}.")
+    return atual, regressoes
+
+# Linha de comando da suíte (também usada por `python cli.py bench`); retorna o código de saída
+def principal(argv=None):
+    parser = argparse.ArgumentParser(description="Suíte de desempenho ponta a ponta com corpus sintético e LLM falso.")
+    parser.add_argument("escalas", nargs="*", type=int, default=list(ESCALAS_PADRAO), help="Números de documentos (10 a 100000)")
+    parser.add_argument("--etapas", nargs="+", choices=list(ETAPAS), help="Etapas a medir (as dependências entram junto)")
+    parser.add_argument("--corpus", help="Pasta onde o corpus fica guardado entre execuções")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--referencia", help="Commit (prefixo) ou arquivo JSON usado na comparação")
+    parser.add_argument("--resultados", default=PASTA_RESULTADOS, help="Pasta dos arquivos de resultados")
+    parser.add_argument("--falhar-em-regressao", action="store_true", help="Sai com código 1 se alguma etapa regredir")
+    args = parser.parse_args(argv)
+    _, regressoes = executar(args.escalas, args.etapas, args.corpus, args.semente, args.referencia, args.resultados)
+    return 1 if regressoes and args.falhar_em_regressao else 0
+
+if __name__ == "__main__":
+    sys.exit(principal())
@@ -0,0 +1,189 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import main as pipeline
+
+# Ponto de entrada de linha de comando: python cli.py <subcomando> [opções]
+# A configuração parte das constantes de main.py, recebe por cima um arquivo JSON (--config) e, por fim, as opções.
+# Nada pesado é importado aqui: cada subcomando importa só o que a sua etapa usa.
+
+# Opções que substituem uma chave da configuração: (opção, chave, tipo, ajuda)
+OPCOES_CONFIGURACAO = [
+    ("--narrativas", "PASTA_NARRATIVAS", str, "Pasta das narrativas XML e do gold standard"),
+    ("--origem", "ORIGEM_NARRATIVAS", str, "Narrativas a extrair: pasta, padrão glob, .zip ou .tar(.gz)"),
+    ("--saida-csv", "CSV_OUTPUT_FOLDER", str, "Pasta dos CSVs individuais e da saída mestre"),
+    ("--resultados", "RESULTADOS_EXCEL", str, "Excel final com as classificações"),
+    ("--modo-saida", "MODO_SAIDA", str, "Modo de saída do modelo: completo ou compacto"),
+    ("--trabalhadores", "N_TRABALHADORES", int, "Processos de extração (mais de 1: paralelo)"),
+    ("--sequencias-lote", "N_SEQUENCIAS_LOTE", int, "Sequências da decodificação em lote (mais de 1: lote)"),
+    ("--max-tokens", "MAX_TOKENS", int, "Máximo de tokens gerados por bloco"),
+    ("--limiar-vpp", "LIMIAR_VPP", float, "Similaridade mínima para parear FP e FN como VPP"),
+    ("--metricas", "METRICAS_PATH", str, "Arquivo de métricas (linhas JSON)"),
+]
+
+# Opções liga/desliga: (opção, chave, valor, ajuda)
+CHAVES_CONFIGURACAO = [
+    ("--streaming", "USAR_STREAMING", True, "Decodifica em fluxo, com parada antecipada"),
+    ("--gramatica", "USAR_GRAMATICA", True, "Restringe a saída com a gramática GBNF"),
+    ("--reproduzir", "REPRODUZIR_RESPOSTAS", True, "Usa as respostas gravadas em vez do modelo"),
+    ("--sem-gravar", "GRAVAR_RESPOSTAS", False, "Não grava as respostas do modelo"),
+    ("--sem-metricas", "USAR_METRICAS", False, "Desliga a instrumentação"),
+    ("--exportar-csv", "EXPORTAR_CSV_MESTRE", True, "Exporta também o CSV mestre ao lado da saída colunar"),
+]
+
+# Converte o valor de --definir CHAVE=VALOR: JSON quando possível (números, true/false, null, objetos), senão texto
+def interpretar_valor(texto):
+    try:
+        return json.loads(texto)
+    except json.JSONDecodeError:
+        return texto
+
+# Monta a configuração: constantes de main.py <- arquivo JSON <- opções da linha de comando
+def carregar_configuracao(args):
+    config = pipeline.configuracao_padrao()
+    substituicoes = {}
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            substituicoes.update(json.load(f))
+    for definicao in args.definir or []:
+        chave, separador, valor = definicao.partition("=")
+        if not separador:
+            raise ValueError(f"--definir espera CHAVE=VALOR, recebeu '{definicao}'")
+        substituicoes[chave] = interpretar_valor(valor)
+    for opcao, chave, _, _ in OPCOES_CONFIGURACAO + CHAVES_CONFIGURACAO:
+        valor = getattr(args, opcao[2:].replace("-", "_"))
+        if valor is not None:
+            substituicoes[chave] = valor
+    if args.modelo:
+        substituicoes["CONFIG_MODELO"] = dict(substituicoes.get("CONFIG_MODELO", config["CONFIG_MODELO"]), model_path=args.modelo)
+
+    desconhecidas = sorted(set(substituicoes) - set(config))
+    if desconhecidas:
+        raise ValueError(f"Chaves de configuração desconhecidas: {', '.join(desconhecidas)}")
+    # Objetos (como CONFIG_MODELO) são mesclados: o arquivo pode trocar só o n_ctx, por exemplo
+    for chave, valor in substituicoes.items():
+        if isinstance(config[chave], dict) and isinstance(valor, dict):
+            config[chave] = dict(config[chave], **valor)
+        else:
+            config[chave] = valor
+    return config
+
+# Abre a instrumentação do subcomando, se ativada
+def iniciar_instrumentacao(config):
+    if config["USAR_METRICAS"]:
+        from utils.instrumentacao import iniciar_metricas
+        iniciar_metricas(config["METRICAS_PATH"])
+
+def encerrar_instrumentacao(config):
+    if config["USAR_METRICAS"]:
+        from utils.instrumentacao import encerrar_metricas
+        encerrar_metricas()
+
+# Confere se a saída mestre existe antes de carregar o gold standard ou o modelo
+def saida_mestre_existente(config):
+    saida_mestre = pipeline.caminho_saida_mestre(config)
+    if not os.path.exists(saida_mestre):
+        print(f"\n❌ Saída mestre não encontrada em {saida_mestre}. Rode `python cli.py extract` antes.")
+        return None
+    return saida_mestre
+
+# extract: extrai as narrativas pendentes (o modelo só é carregado se houver alguma) e cria a saída mestre
+def comando_extract(config, args):
+    iniciar_instrumentacao(config)
+    saida_mestre, recursos = pipeline.extrair(config)
+    pipeline.encerrar_recursos(recursos, exibir=saida_mestre is not None)
+    encerrar_instrumentacao(config)
+    if not saida_mestre:
+        print("\nNenhuma saída mestre foi gerada.")
+        return 1
+    return 0
+
+# evaluate: gold standard, VPP, vereditos SNOMED já conhecidos (ou do índice local), Excel e métricas, sem o modelo
+def comando_evaluate(config, args):
+    saida_mestre = saida_mestre_existente(config)
+    if saida_mestre is None:
+        return 1
+    iniciar_instrumentacao(config)
+    df_resultado = pipeline.avaliar(config, saida_mestre)
+    pipeline.imprimir_resultados(df_resultado)
+    encerrar_instrumentacao(config)
+    return 0
+
+# map-snomed: como evaluate, mas os pares SNOMED novos vão ao modelo (carregado só se algum par precisar dele)
+def comando_map_snomed(config, args):
+    saida_mestre = saida_mestre_existente(config)
+    if saida_mestre is None:
+        return 1
+    iniciar_instrumentacao(config)
+    df_resultado = pipeline.avaliar(config, saida_mestre, carregar_modelo_snomed=lambda: pipeline.carregar_modelo(config))
+    pipeline.imprimir_resultados(df_resultado)
+    encerrar_instrumentacao(config)
+    return 0
+
+# report: exibe as métricas do Excel já gravado, sem recalcular nada
+def comando_report(config, args):
+    if not os.path.exists(config["RESULTADOS_EXCEL"]):
+        print(f"\n❌ Relatório não encontrado em {config['RESULTADOS_EXCEL']}. Rode `python cli.py evaluate` antes.")
+        return 1
+    from utils.avaliacao import carregar_resultados
+    pipeline.imprimir_resultados(carregar_resultados(config["RESULTADOS_EXCEL"]))
+    return 0
+
+# run: pipeline completo, como `python main.py`
+def comando_run(config, args):
+    pipeline.main(config)
+    return 0
+
+# bench: suíte ponta a ponta (argumentos repassados a benchmarks/suite.py)
+def comando_bench(config, args):
+    from benchmarks.suite import principal
+    return principal(args.argumentos_suite)
+
+# Cria o parser com os subcomandos; as opções de configuração valem para todos (exceto bench)
+def criar_parser():
+    configuracao = argparse.ArgumentParser(add_help=False)
+    configuracao.add_argument("--config", help="Arquivo JSON com chaves de main.py (ex.: {\"MODO_SAIDA\": \"compacto\"})")
+    configuracao.add_argument("--definir", action="append", metavar="CHAVE=VALOR",
+                              help="Substitui uma chave da configuração (pode repetir)")
+    configuracao.add_argument("--modelo", help="Arquivo GGUF (CONFIG_MODELO['model_path'])")
+    for opcao, chave, tipo, ajuda in OPCOES_CONFIGURACAO:
+        configuracao.add_argument(opcao, type=tipo, help=f"{ajuda} ({chave})")
+    for opcao, chave, valor, ajuda in CHAVES_CONFIGURACAO:
+        configuracao.add_argument(opcao, action="store_const", const=valor, help=f"{ajuda} ({chave})")
+
+    parser = argparse.ArgumentParser(description="Extração e avaliação de termos clínicos em narrativas XML.")
+    subcomandos = parser.add_subparsers(dest="subcomando", required=True)
+    for nome, funcao, ajuda in [
+        ("extract", comando_extract, "Extrai as narrativas pendentes e cria a saída mestre"),
+        ("evaluate", comando_evaluate, "Compara com o gold standard e grava o Excel, sem o modelo"),
+        ("map-snomed", comando_map_snomed, "Avalia e classifica os pares SNOMED novos com o modelo"),
+        ("report", comando_report, "Exibe as métricas do Excel já gravado"),
+        ("run", comando_run, "Pipeline completo (como python main.py)"),
+    ]:
+        subparser = subcomandos.add_parser(nome, parents=[configuracao], help=ajuda, description=ajuda)
+        subparser.set_defaults(funcao=funcao)
+    bench = subcomandos.add_parser("bench", help="Suíte de desempenho ponta a ponta (benchmarks/suite.py)",
+                                   description="Repassa os argumentos a benchmarks/suite.py (ex.: bench 10 200 --etapas csv).")
+    bench.add_argument("argumentos_suite", nargs=argparse.REMAINDER)
+    bench.set_defaults(funcao=comando_bench)
+    return parser
+
+def principal(argv=None):
+    inicio = time.perf_counter()
+    args = criar_parser().parse_args(argv)
+    config = None
+    if args.funcao is not comando_bench:
+        try:
+            config = carregar_configuracao(args)
+        except (OSError, ValueError) as e:
+            print(f"\n❌ Configuração inválida: {e}")
+            return 2
+    codigo = args.funcao(config, args)
+    print(f"\n⏱️  {args.subcomando} concluído em {time.perf_counter() - inicio:.2f}s")
+    return codigo
+
+if __name__ == "__main__":
+    sys.exit(principal())
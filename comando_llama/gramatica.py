@@ -0,0 +1,34 @@
+# Gramáticas GBNF (llama.cpp) que forçam o formato de saída esperado por processador_csv.py
+# Tuplas: [Termo | Abrev | Categoria | SCTID], categoria fixa por lista e SCTID numérico ou NotFound
+
+# Regras comuns às listas de resumo
+_LISTAS = r'''
+listas ::= lista-sinais "\n" lista-doencas
+lista-sinais ::= "Sinais ou Sintomas: (" (tupla-sinal (", " tupla-sinal)*)? ")"
+lista-doencas ::= "Doenças ou Síndromes: (" (tupla-doenca (", " tupla-doenca)*)? ")"
+tupla-sinal ::= "[" campo " | " campo " | Sinal ou Sintoma | " sctid "]"
+tupla-doenca ::= "[" campo " | " campo " | Doença ou Síndrome | " sctid "]"
+campo ::= [^|\[\]\n]+
+categoria ::= "Sinal ou Sintoma" | "Doença ou Síndrome"
+sctid ::= [0-9]+ | "NotFound"
+'''
+
+# Modo completo: narrativa com anotações [Texto analisado: ...] seguida das duas listas
+GRAMATICA_COMPLETA = r'''
+root ::= texto-anotado "\n"+ listas
+texto-anotado ::= linha ("\n"+ linha)*
+linha ::= (caractere | anotacao)+
+caractere ::= [^\n\[\]]
+anotacao ::= "[Texto analisado: " campo " | Abreviação: " campo " | Categoria: " categoria " | SCTID: " sctid "]"
+''' + _LISTAS
+
+# Modo compacto: apenas as duas listas
+GRAMATICA_COMPACTA = r'''
+root ::= listas
+''' + _LISTAS
+
+# Gramática de cada modo de saída (mesmas chaves de MODOS_SAIDA)
+GRAMATICAS_SAIDA = {
+    "completo": GRAMATICA_COMPLETA,
+    "compacto": GRAMATICA_COMPACTA,
+}
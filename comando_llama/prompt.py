@@ -81,4 +81,59 @@ Doenças ou Síndromes: ([HAS | Hipertensão Arterial Sistêmica | Doença ou S
 
 **Documento Clínico:**
 {textoClinico}
-"""
\ No newline at end of file
+"""
+# Regras compartilhadas com o modo compacto (mesmas definições e restrições do prompt completo)
+_REGRAS = PROMPT_TEMPLATE[
+    PROMPT_TEMPLATE.index("**Regras e Observações Específicas:**"):PROMPT_TEMPLATE.index("**Restrições Importantes:**")
+]
+
+# Linha que o modelo escreve depois da segunda lista no modo compacto; é a sequência de parada desse modo.
+# Uma linha em branco não serve: o modelo às vezes abre a resposta com ela ou a põe entre as duas listas.
+MARCADOR_FIM_LISTAS = "FIM DAS LISTAS"
+
+# Modo compacto: o modelo não repete a narrativa anotada e gera apenas as duas listas de tuplas
+PROMPT_TEMPLATE_COMPACTO = """
+**Objetivo:** Identificar achados clínicos e diagnósticos no texto clínico, classificá-los como "Sinal ou Sintoma" ou "Doença ou Síndrome" seguindo as definições e regras abaixo (com foco restrito em achados clínicos e diagnósticos conforme Regra 8). Para cada achado informe o código SNOMED CT (SCTID) correspondente, ou "NotFound" se não souber, e gere APENAS as duas listas de resumo em formato de tuplas.
+
+**Definições:**
+*   **Sinal ou Sintoma**: observação do médico ou relato do paciente de uma condição (Ex: icterícia, dor, febre), incluindo achados de exame físico (Ex: `Mucosas úmidas e hipocoradas`) mas exclui achados auscultatórios ou percussórios detalhados (Ver Regra 8).
+*   **Doença ou Síndrome**: Alteração do estado normal de saúde, diagnosticada clinicamente (Ex: HAS, ICC, DM, DAC, pneumonia). Inclui síndromes reconhecidas (Ex: síndrome metabólica). Exclui achados descritivos de exames complementares (Ver Regra 8).
+
+**Formato das Tuplas:** `[TermoPrincipal | Abreviação | Categoria | SCTID]`
+*   Se o termo for uma abreviação conhecida de Doença/Síndrome (ex: HAS, DM), use a abreviação como 'TermoPrincipal' e a expansão em 'Abreviação'. Caso contrário, use `None` em 'Abreviação'.
+*   'Categoria' é exatamente "Sinal ou Sintoma" ou "Doença ou Síndrome".
+*   'SCTID' é o código numérico ou `NotFound`.
+
+""" + _REGRAS + """**Restrições Importantes:**
+*   NÃO repita o texto clínico e NÃO insira anotações no texto.
+*   NÃO retorne NENHUMA informação adicional, comentários, explicações ou CUIs.
+*   Retorne EXATAMENTE duas linhas consecutivas, sem linha em branco entre elas:
+    *   `Sinais ou Sintomas: ([Termo1 | Abrev1 | Cat1 | SCTID1], ...)`
+    *   `Doenças ou Síndromes: ([TermoA | AbrevA | CatA | SCTIDA], ...)`
+*   Use `()` se nenhuma entidade permitida for encontrada para uma categoria.
+*   Depois da segunda lista, escreva uma linha com `""" + MARCADOR_FIM_LISTAS + """` e encerre.
+
+**Exemplo de Execução:**
+
+***** Texto original de Exemplo:
+Paciente com HAS e ICC diagnosticada. Apresenta dispneia aos esforços e edema em MMII. Nega dor torácica. Afebril. BEG. Exame Pulmonar: MV diminuído em bases. Ecocardiograma mostrou FE=35% e hipertrofia VE. Ex-tabagista. Realizou angioplastia prévia.
+
+***** Saída Esperada:
+Sinais ou Sintomas: ([dispneia | None | Sinal ou Sintoma | 267036007], [edema em MMII | None | Sinal ou Sintoma | 271808008])
+Doenças ou Síndromes: ([HAS | Hipertensão Arterial Sistêmica | Doença ou Síndrome | 38341003], [ICC | Insuficiência Cardíaca Congestiva | Doença ou Síndrome | 42343007])
+""" + MARCADOR_FIM_LISTAS + """
+
+---------- FIM DO EXEMPLO ----------
+
+**Tarefa:** Agora, aplique TODAS essas definições e regras **restritivas** ao seguinte documento clínico. Retorne APENAS as duas listas de resumo, seguidas de `""" + MARCADOR_FIM_LISTAS + """`.
+
+**Documento Clínico:**
+{textoClinico}
+"""
+
+# Modos de saída disponíveis: template usado e sequências de parada da geração
+MODOS_SAIDA = {
+    "completo": {"template": PROMPT_TEMPLATE, "stop": None},
+    # O marcador após a segunda lista encerra a geração (e não entra na resposta)
+    "compacto": {"template": PROMPT_TEMPLATE_COMPACTO, "stop": [MARCADOR_FIM_LISTAS]},
+}
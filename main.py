@@ -1,201 +1,280 @@
-import pandas as pd
-import openpyxl
+import os
+import copy
 import time
-from llama_cpp import Llama
-
-from utils.processador_narrativa import processar_narrativas, criar_csv_mestre, comparar_com_goldstandard
-from utils.similaridade import medir_similaridade
-from utils.mapeamento_snomed import prompt_avmap
-from utils.processador_excel import carregar_dicionario, salvar_dicionario
-
 
+# Só bibliotecas leves no topo: pandas, llama_cpp, scikit-learn, nltk e openpyxl são importados dentro da etapa que
+# precisa deles, para que `python cli.py report` (ou uma extração sem nada pendente) comece em bem menos de 1 segundo.
 
 # Pastas e arquivos principais
-PASTA_NARRATIVAS = 'narrativas'  # Narrativas XML de entrada
-CSV_OUTPUT_FOLDER = 'data/csv_output'  # Saída CSV individual e mestre
-DICIONARIO_PATH = 'data/dicionario.json'  # Dicionário SNOMED persistido
+PASTA_NARRATIVAS = 'narrativas'  # Narrativas XML de entrada e gold standard
+ORIGEM_NARRATIVAS = None  # Narrativas a extrair: pasta, padrão glob, .zip ou .tar(.gz) (None: PASTA_NARRATIVAS)
+CSV_OUTPUT_FOLDER = 'data/csv_output'  # Saída mestre (extracao_colunar/) e, sem pyarrow, CSVs individuais
+EXPORTAR_CSV_MESTRE = False  # Exporta também o CSV mestre (textoPrompt repetido em cada linha) ao lado da saída colunar
+DICIONARIO_PATH = 'data/dicionario.json'  # Dicionário SNOMED antigo (importado para as verificações)
+VERIFICACOES_SNOMED_PATH = 'data/verificacoes_snomed.sqlite'  # Vereditos SNOMED (SCTID, termo) -> 0, 1 ou 2
+INDICE_SNOMED_PATH = 'data/snomed_indice.sqlite'  # Índice local do release RF2 (python -m utils.indice_snomed)
 RESULTADOS_EXCEL = 'data/Resultados.xlsx'  # Excel final com métricas
-
-# Inicializa lista para armazenar DataFrames de cada narrativa
-lista_dataframes_individuais = []
-
-inicio = time.time()  # Marca início da execução total
-
-# Inicializa modelo LLaMA
-llm = Llama(
-    model_path="modelo/Llama-3.2-3B-Instruct-Q4_K_M.gguf",
-    n_ctx=8192,  # Tamanho máximo de contexto
-    n_threads=8,  # Ajuste conforme CPU
-    n_gpu_layers=20,  # Para acelerar se houver GPU
-)
-
-# Processa todas as narrativas XML em blocos, gera CSVs individuais
-lista_dataframes_individuais = processar_narrativas(
-    PASTA_NARRATIVAS, CSV_OUTPUT_FOLDER, llm, max_tokens=512, temperature=0.0
-)
-
-# Cria CSV mestre unindo todos os CSVs individuais
-csv_mestre = criar_csv_mestre(lista_dataframes_individuais, CSV_OUTPUT_FOLDER)
-
-if csv_mestre:
-    # Compara CSV mestre com gold standard e salva métricas iniciais em Excel
-    df_resultado = comparar_com_goldstandard(csv_mestre, PASTA_NARRATIVAS, RESULTADOS_EXCEL)
-
-    # Carrega Excel para análise de similaridade entre termos FP e FN
-    workbook = openpyxl.load_workbook(RESULTADOS_EXCEL)
-    planilha = workbook['Resultados']
-
-    limiar_similaridade = 0.7  # Limite de similaridade para considerar correspondência
-
-    achados_prompt_for_sim = []
-    achados_semclin_for_sim = []
-    index_semclin = []
-    index_prompt = []
-    narrativa_anterior = ""
-
-    # Percorre linhas do Excel, realizando análise de similaridade
-    for index in range(2, planilha.max_row + 1):
-        n1 = ''
-        n2 = ''
-        if planilha[f'A{index}'].value:
-            n1 = str(planilha[f'A{index}'].value)[:4]
-        elif planilha[f'G{index}'].value:
-            n2 = str(planilha[f'G{index}'].value)[:4]
-
-        narrativa_atual = n1 if n1 else n2
-
-        # Quando muda a narrativa ou chega na última linha, realiza comparação
-        if narrativa_atual and (narrativa_atual != narrativa_anterior or index == planilha.max_row):
-            if achados_semclin_for_sim and achados_prompt_for_sim:
-                for i_p, t_prompt in enumerate(achados_prompt_for_sim):
-                    for i_s, t_semclin in enumerate(achados_semclin_for_sim):
-                        t_prompt_str = str(t_prompt)
-                        t_semclin_str = str(t_semclin)
-
-                        if not t_prompt_str or not t_semclin_str:
-                            continue
-
-                        # Calcula similaridade entre termos
-                        resultado = medir_similaridade(t_prompt_str, t_semclin_str)
-
-                        if resultado > limiar_similaridade:
-                            print(f"\n{resultado:.3f} -> {t_prompt_str} + {t_semclin_str}")
-
-                            # Atualiza classificação para VPP se necessário
-                            classificacao_atual = planilha[f'J{index_prompt[i_p]}'].value
-                            if classificacao_atual in ['FN', 'FP']:
-                                planilha[f'J{index_prompt[i_p]}'] = 'VPP'
-                            planilha[f'J{index_semclin[i_s]}'] = ''
-
-                            # Remove termos já processados
-                            achados_prompt_for_sim.pop(i_p)
-                            achados_semclin_for_sim.pop(i_s)
-                            index_prompt.pop(i_p)
-                            index_semclin.pop(i_s)
-                            break
-
-            # Reseta listas para próxima narrativa
-            achados_prompt_for_sim = []
-            achados_semclin_for_sim = []
-            index_semclin = []
-            index_prompt = []
-
-        # Armazena termos FP e FN para análise de similaridade
-        if not (index == planilha.max_row and narrativa_atual == narrativa_anterior):
-            avaliacao = planilha[f'J{index}'].value
-            if avaliacao == 'FN':
-                termo = planilha[f'H{index}'].value
-                if termo is not None:
-                    achados_semclin_for_sim.append(str(termo))
-                    index_semclin.append(index)
-            elif avaliacao == 'FP':
-                termo = planilha[f'D{index}'].value
-                if termo is not None:
-                    achados_prompt_for_sim.append(str(termo))
-                    index_prompt.append(index)
-
-        narrativa_anterior = narrativa_atual
-
-    # Salva Excel atualizado com VPP
-    workbook.save(RESULTADOS_EXCEL)
-
-    # Mapeamento SNOMED
-    dicionario = carregar_dicionario(DICIONARIO_PATH)
-    workbook = openpyxl.load_workbook(RESULTADOS_EXCEL)
-    planilha = workbook['Resultados']
-
-    def termo_abreviacao(termo, abreviacao):
-        # Junta termo e abreviação para exibição
-        return f'{termo} ({abreviacao})'
-
-    # Atualiza coluna de correspondência SNOMED no Excel
-    index = 2
-    while planilha[f'A{index}'].value or planilha[f'G{index}'].value:
-        termo_analisado = planilha[f'D{index}'].value
-        sctid_valor = planilha[f'F{index}'].value
-
-        if sctid_valor and sctid_valor != 'NotFound':
-            try:
-                SCTID = int(sctid_valor)
-                abreviacao = planilha[f'E{index}'].value
-                termo = termo_abreviacao(termo_analisado, abreviacao) if abreviacao else termo_analisado
-
-                # Atualiza dicionário SNOMED e Excel
-                if SCTID in dicionario:
-                    if termo in dicionario[SCTID]:
-                        planilha[f'K{index}'] = 2
-                    else:
-                        resposta = prompt_avmap(SCTID, termo, llm)
-                        planilha[f'K{index}'] = resposta
-                        if resposta == 2:
-                            dicionario[SCTID].append(termo)
-                else:
-                    # Chama prompt_avmap passando o modelo LLaMA
-                    resposta = prompt_avmap(SCTID, termo, llm)
-                    planilha[f'K{index}'] = resposta
-                    if resposta == 2:
-                        dicionario[SCTID] = [termo]
-            except ValueError:
-                planilha[f'K{index}'] = 'Error'
-            except Exception as e:
-                planilha[f'K{index}'] = 'Error'
-
-        index += 1
-
-    # Salva Excel e dicionário SNOMED atualizado
-    workbook.save(RESULTADOS_EXCEL)
-    salvar_dicionario(dicionario, DICIONARIO_PATH)
+TABELA_RADICAIS_PATH = 'data/cache/radicais_rslp.json'  # Palavra -> radical (RSLP) de execuções anteriores
+CACHE_GOLDSTANDARD_PATH = 'data/cache/goldstandard.parquet'  # Achados já extraídos dos XMLs do gold standard
+CACHE_PREFIXO_PATH = 'data/cache/prefixo_prompt.pkl'  # Snapshot do estado do prefixo do prompt
+MANIFESTO_PATH = 'data/manifesto_extracao.json'  # Narrativas já extraídas (permite retomar execuções)
+CACHE_COMPLETIONS_PATH = 'data/cache/completions.sqlite'  # Cache persistente de respostas do modelo
+TAMANHO_MAXIMO_CACHE_COMPLETIONS_MB = 512  # Acima disso, as respostas menos usadas são removidas (LRU)
+METRICAS_PATH = 'data/metricas.jsonl'  # Métricas por bloco e por etapa (linhas JSON, uma execução após a outra)
+USAR_METRICAS = True  # Com False, a instrumentação fica desligada e nada é gravado
+RESPOSTAS_GRAVADAS_PATH = 'data/respostas_gravadas.sqlite'  # Respostas brutas do modelo por narrativa e bloco
+GRAVAR_RESPOSTAS = True  # Grava as respostas de cada extração para reproduzi-las depois
+REPRODUZIR_RESPOSTAS = False  # Refaz CSVs, métricas e relatório das respostas gravadas, sem carregar o modelo
+
+# Similaridade mínima para parear um FP e um FN da mesma narrativa como VPP (padrão de utils/avaliacao.py)
+LIMIAR_VPP = 0.7
+
+# Configuração do modelo LLaMA (usada pelo processo principal e pelos trabalhadores)
+CONFIG_MODELO = {
+    "model_path": "modelo/Llama-3.2-3B-Instruct-Q4_K_M.gguf",
+    "n_ctx": 8192,  # Tamanho máximo de contexto
+    "n_threads": 8,  # Ajuste conforme CPU
+    "n_gpu_layers": 20,  # Para acelerar se houver GPU
+}
+
+# Parâmetros de geração da extração
+MAX_TOKENS = 512
+TEMPERATURE = 0.0  # Determinístico: permite o cache de completions e CSVs idênticos entre execuções
+
+# Modo de saída do modelo: "completo" (narrativa anotada + listas) ou "compacto" (apenas as listas de tuplas)
+MODO_SAIDA = "completo"
+USAR_GRAMATICA = False  # Restringe a saída ao formato das tuplas com uma gramática GBNF
+USAR_STREAMING = False  # Decodifica em fluxo: entidades chegam durante a geração, que para quando as listas terminam
+
+# Processamento paralelo: com mais de 1 trabalhador, cada processo abre o modelo via mmap
+N_TRABALHADORES = 1
+N_THREADS_TOTAL = os.cpu_count()  # Threads divididas igualmente entre os trabalhadores
+
+# Decodificação em lote (um processo): com mais de 1 sequência, blocos de várias narrativas são gerados juntos
+N_SEQUENCIAS_LOTE = 1
+CONTEXTO_LOTE = None  # Tokens do cache KV compartilhado pelas sequências (padrão: 2 x n_ctx)
+
+
+# Configuração padrão: as constantes acima, pelo nome (cli.py substitui valores por um arquivo JSON ou por opções)
+def configuracao_padrao():
+    return copy.deepcopy({nome: valor for nome, valor in globals().items() if nome.isupper()})
+
+# Origem das narrativas a extrair (por padrão, a própria pasta do gold standard)
+def origem_narrativas(config):
+    return config["ORIGEM_NARRATIVAS"] or config["PASTA_NARRATIVAS"]
+
+# Caminho da saída mestre gerada pela extração: a pasta colunar ou, se só ele existir, o CSV mestre
+def caminho_saida_mestre(config):
+    from utils.saida_colunar import NOME_SAIDA_COLUNAR, e_saida_colunar
+    caminho = os.path.join(config["CSV_OUTPUT_FOLDER"], NOME_SAIDA_COLUNAR)
+    if e_saida_colunar(caminho):
+        return caminho
+    from utils.processador_narrativa import NOME_CSV_MESTRE
+    caminho_csv = os.path.join(config["CSV_OUTPUT_FOLDER"], NOME_CSV_MESTRE)
+    return caminho_csv if os.path.exists(caminho_csv) else caminho
+
+# Carrega o modelo LLaMA (llama_cpp só é importado aqui e nos processos trabalhadores)
+def carregar_modelo(config):
+    from llama_cpp import Llama
+    from utils.instrumentacao import etapa
+    with etapa("carregar_modelo"):
+        return Llama(**config["CONFIG_MODELO"])
+
+# Confere, antes de carregar o modelo, se alguma narrativa ainda não foi extraída com os mesmos parâmetros
+def narrativas_pendentes(config):
+    from utils.processador_narrativa import chave_execucao_narrativas, existem_narrativas_pendentes
+    if not os.path.exists(config["MANIFESTO_PATH"]):
+        return existem_narrativas_pendentes(origem_narrativas(config))
+    chave_exec = chave_execucao_narrativas(
+        config["CONFIG_MODELO"]["model_path"], config["MAX_TOKENS"], config["TEMPERATURE"], config["MODO_SAIDA"],
+        config["USAR_GRAMATICA"], config["USAR_STREAMING"], config["CONFIG_MODELO"]["n_ctx"]
+    )
+    return existem_narrativas_pendentes(origem_narrativas(config), config["MANIFESTO_PATH"], chave_exec,
+                                        config["CSV_OUTPUT_FOLDER"])
+
+# Carrega o modelo e extrai as narrativas (em paralelo, em lote ou uma a uma)
+# Retorna o modelo, o cache de completions e os caminhos dos CSVs individuais (vazio com saida_colunar, que recebe
+# cada narrativa assim que ela termina)
+def extrair_com_modelo(config, respostas_gravadas, saida_colunar=None):
+    from comando_llama.prompt import MODOS_SAIDA
+    from utils.processador_narrativa import processar_narrativas
+    from utils.processador_paralelo import processar_narrativas_paralelo
+    from utils.decodificacao_lote import processar_narrativas_lote
+    from utils.cache_prefixo import preparar_cache_prefixo
+    from utils.cache_completions import abrir_cache_completions
+    from utils.instrumentacao import etapa
+
+    # Inicializa modelo LLaMA
+    llm = carregar_modelo(config)
+
+    # Abre o cache de completions (respostas com temperature > 0 não são guardadas)
+    config_cache_completions = {
+        "caminho": config["CACHE_COMPLETIONS_PATH"],
+        "tamanho_maximo_mb": config["TAMANHO_MAXIMO_CACHE_COMPLETIONS_MB"],
+    }
+    cache_completions = abrir_cache_completions(**config_cache_completions)
+
+    # Avalia o prefixo fixo do prompt uma única vez (ou carrega o snapshot salvo em disco)
+    with etapa("prefixo"):
+        cache_prefixo = preparar_cache_prefixo(llm, MODOS_SAIDA[config["MODO_SAIDA"]]["template"], config["CACHE_PREFIXO_PATH"])
+
+    # Processa as narrativas XML em fluxo e grava cada uma na saída colunar (ou em um CSV individual, sem pyarrow)
+    with etapa("extracao"):
+        if config["N_TRABALHADORES"] > 1:
+            csvs_individuais = processar_narrativas_paralelo(
+                origem_narrativas(config), config["CSV_OUTPUT_FOLDER"], config["CONFIG_MODELO"],
+                n_trabalhadores=config["N_TRABALHADORES"], n_threads_total=config["N_THREADS_TOTAL"],
+                max_tokens=config["MAX_TOKENS"], temperature=config["TEMPERATURE"],
+                caminho_snapshot_prefixo=config["CACHE_PREFIXO_PATH"], caminho_manifesto=config["MANIFESTO_PATH"],
+                config_cache_completions=config_cache_completions, modo_saida=config["MODO_SAIDA"],
+                usar_gramatica=config["USAR_GRAMATICA"], retornar_caminhos=True, streaming=config["USAR_STREAMING"],
+                config_respostas_gravadas={"caminho": config["RESPOSTAS_GRAVADAS_PATH"]} if respostas_gravadas else None,
+                saida_colunar=saida_colunar
+            )
+        elif config["N_SEQUENCIAS_LOTE"] > 1:
+            csvs_individuais = processar_narrativas_lote(
+                origem_narrativas(config), config["CSV_OUTPUT_FOLDER"], llm, n_sequencias=config["N_SEQUENCIAS_LOTE"],
+                n_ctx_lote=config["CONTEXTO_LOTE"], max_tokens=config["MAX_TOKENS"], temperature=config["TEMPERATURE"],
+                caminho_manifesto=config["MANIFESTO_PATH"], cache_completions=cache_completions,
+                modo_saida=config["MODO_SAIDA"], usar_gramatica=config["USAR_GRAMATICA"],
+                streaming=config["USAR_STREAMING"], retornar_caminhos=True, respostas_gravadas=respostas_gravadas,
+                saida_colunar=saida_colunar
+            )
+        else:
+            csvs_individuais = processar_narrativas(
+                origem_narrativas(config), config["CSV_OUTPUT_FOLDER"], llm, max_tokens=config["MAX_TOKENS"],
+                temperature=config["TEMPERATURE"], cache_prefixo=cache_prefixo, caminho_manifesto=config["MANIFESTO_PATH"],
+                cache_completions=cache_completions, modo_saida=config["MODO_SAIDA"],
+                usar_gramatica=config["USAR_GRAMATICA"], retornar_caminhos=True, streaming=config["USAR_STREAMING"],
+                respostas_gravadas=respostas_gravadas, saida_colunar=saida_colunar
+            )
+    return llm, cache_completions, csvs_individuais
+
+# Extrai as narrativas (ou reproduz as respostas gravadas) e cria a saída mestre
+# Retorna o caminho da saída mestre (ou None) e os recursos abertos: modelo, cache de completions e respostas gravadas
+def extrair(config):
+    from utils.processador_narrativa import (
+        processar_narrativas, reproduzir_narrativas, criar_saida_mestre, interromper_saida_mestre
+    )
+    from utils.saida_colunar import saida_colunar_disponivel, abrir_saida_colunar
+    from utils.respostas_gravadas import abrir_respostas_gravadas
+    from utils.instrumentacao import etapa, definir_narrativa
+
+    recursos = {"llm": None, "cache_completions": None, "respostas_gravadas": None}
+    if config["GRAVAR_RESPOSTAS"] or config["REPRODUZIR_RESPOSTAS"]:
+        recursos["respostas_gravadas"] = abrir_respostas_gravadas(config["RESPOSTAS_GRAVADAS_PATH"])
+
+    # Saída colunar gravada durante a extração, uma narrativa por vez; sem pyarrow, CSVs individuais e CSV mestre
+    saida_colunar = None
+    if saida_colunar_disponivel():
+        saida_colunar = abrir_saida_colunar(config["CSV_OUTPUT_FOLDER"])
+    else:
+        print("\n⚠️ pyarrow não instalado; gravando CSVs individuais e só o CSV mestre.")
+
+    try:
+        if config["REPRODUZIR_RESPOSTAS"]:
+            # Sem modelo: as saídas vêm das respostas gravadas; pares SNOMED ainda não verificados ficam sem veredito
+            with etapa("extracao"):
+                csvs_individuais = reproduzir_narrativas(
+                    recursos["respostas_gravadas"], config["CSV_OUTPUT_FOLDER"], retornar_caminhos=True,
+                    origem_narrativas=origem_narrativas(config),
+                    parametros={"modelo": config["CONFIG_MODELO"]["model_path"], "n_ctx": config["CONFIG_MODELO"]["n_ctx"],
+                                "max_tokens": config["MAX_TOKENS"],
+                                "temperature": config["TEMPERATURE"], "usar_gramatica": config["USAR_GRAMATICA"],
+                                "streaming": config["USAR_STREAMING"], "modo_saida": config["MODO_SAIDA"]},
+                    saida_colunar=saida_colunar
+                )
+        elif narrativas_pendentes(config):
+            recursos["llm"], recursos["cache_completions"], csvs_individuais = extrair_com_modelo(
+                config, recursos["respostas_gravadas"], saida_colunar
+            )
+        else:
+            # Nada novo para o modelo: as saídas vêm do manifesto e o modelo nem é carregado
+            print("\n✅ Nenhuma narrativa pendente de extração. Modelo não carregado.")
+            with etapa("extracao"):
+                csvs_individuais = processar_narrativas(
+                    origem_narrativas(config), config["CSV_OUTPUT_FOLDER"], None, max_tokens=config["MAX_TOKENS"],
+                    temperature=config["TEMPERATURE"], caminho_manifesto=config["MANIFESTO_PATH"],
+                    modo_saida=config["MODO_SAIDA"], usar_gramatica=config["USAR_GRAMATICA"], retornar_caminhos=True,
+                    streaming=config["USAR_STREAMING"], caminho_modelo=config["CONFIG_MODELO"]["model_path"],
+                    n_ctx=config["CONFIG_MODELO"]["n_ctx"], saida_colunar=saida_colunar
+                )
+    except BaseException:
+        if saida_colunar is not None:
+            interromper_saida_mestre(saida_colunar)
+        raise
+    definir_narrativa(None)  # As etapas seguintes valem para o corpus inteiro
+
+    # Conclui a saída mestre (colunar) ou, sem pyarrow, une os CSVs individuais no CSV mestre
+    with etapa("csv_mestre"):
+        saida_mestre = criar_saida_mestre(csvs_individuais, config["CSV_OUTPUT_FOLDER"],
+                                          exportar_csv=config["EXPORTAR_CSV_MESTRE"], saida_colunar=saida_colunar)
+    return saida_mestre, recursos
+
+# Compara a saída mestre com o gold standard, marca VPP, preenche a coluna SNOMED e exporta o Excel
+# llm=None e carregar_modelo_snomed=None: pares SNOMED novos só são resolvidos pelo índice local (sem modelo)
+def avaliar(config, saida_mestre, llm=None, carregar_modelo_snomed=None):
+    from utils.processador_narrativa import comparar_com_goldstandard
+    from utils.avaliacao import marcar_vpp, aplicar_mapeamento_snomed, exportar_resultados, LIMIAR_CONFIANCA_SNOMED
+    from utils.processador_xml import carregar_tabela_radicais, salvar_tabela_radicais, estatisticas_radicais
+    from utils.indice_snomed import abrir_indice_snomed, fechar_indice_snomed
+    from utils.verificacao_snomed import abrir_verificacoes, fechar_verificacoes, estatisticas_verificacoes
+    from utils.instrumentacao import etapa, registrar_cache
+
+    # Compara a saída mestre com gold standard; as etapas seguintes trabalham no mesmo DataFrame em memória
+    with etapa("goldstandard"):
+        df_resultado = comparar_com_goldstandard(
+            saida_mestre, config["PASTA_NARRATIVAS"], caminho_cache_goldstandard=config["CACHE_GOLDSTANDARD_PATH"]
+        )
+
+    # Análise de similaridade entre termos FP e FN (VPP)
+    carregar_tabela_radicais(config["TABELA_RADICAIS_PATH"])  # Evita passar as mesmas palavras pelo stemmer de novo
+    with etapa("similaridade"):
+        correspondencias = marcar_vpp(df_resultado, limiar=config["LIMIAR_VPP"])
+    for resultado, t_prompt_str, t_semclin_str in correspondencias:
+        print(f"\n{resultado:.3f} -> {t_prompt_str} + {t_semclin_str}")
+
+    salvar_tabela_radicais(config["TABELA_RADICAIS_PATH"])
+    stats_radicais = estatisticas_radicais()
+    print(f"\n🌱 Radicais: {stats_radicais['acertos']} reaproveitados, {stats_radicais['falhas']} calculados pelo stemmer, "
+          f"taxa de acerto {stats_radicais['taxa_acerto']:.1%}")
+    registrar_cache("radicais", stats_radicais)
+
+    # Mapeamento SNOMED (vereditos já conhecidos vêm do armazenamento, sem chamar o modelo)
+    verificacoes = abrir_verificacoes(config["VERIFICACOES_SNOMED_PATH"], caminho_dicionario_legado=config["DICIONARIO_PATH"])
+    indice_snomed = abrir_indice_snomed(config["INDICE_SNOMED_PATH"])  # None se o índice ainda não foi construído
+    if indice_snomed is None:
+        print(f"\n⚠️ Índice SNOMED CT não encontrado em {config['INDICE_SNOMED_PATH']}; todos os pares novos vão ao modelo.")
+    with etapa("snomed"):
+        mapeamento = aplicar_mapeamento_snomed(df_resultado, llm, verificacoes, indice_snomed,
+                                               carregar_modelo=carregar_modelo_snomed)
+
+    stats_verificacoes = estatisticas_verificacoes(verificacoes)
+    pares_modelo = mapeamento['pares_novos'] - mapeamento['resolvidos_indice'] - mapeamento['sem_veredito']
+    print(f"\n🔎 Verificações SNOMED: {stats_verificacoes['acertos']} reaproveitadas, "
+          f"{mapeamento['resolvidos_indice']} resolvidas pelo índice local, "
+          f"{pares_modelo} pares novos classificados pelo modelo, "
+          f"taxa de acerto {stats_verificacoes['taxa_acerto']:.1%}")
+    if mapeamento['sem_veredito']:
+        print(f"⚠️ {mapeamento['sem_veredito']} pares novos ficaram sem veredito (avaliação sem o modelo).")
+    if mapeamento['incertos']:
+        print(f"⚠️ {mapeamento['incertos']} vereditos do modelo com probabilidade abaixo de {LIMIAR_CONFIANCA_SNOMED:.0%}.")
+    registrar_cache("verificacoes_snomed", dict(stats_verificacoes, **mapeamento))
+    fechar_verificacoes(verificacoes)
+    fechar_indice_snomed(indice_snomed)
+
+    # Exporta o Excel final (classificação, VPP e coluna SNOMED) uma única vez
+    with etapa("excel"):
+        exportar_resultados(df_resultado, config["RESULTADOS_EXCEL"])
+    return df_resultado
+
+# Exibe no terminal as métricas de extração e a contagem do mapeamento SNOMED CT
+def imprimir_resultados(df_resultado):
+    import pandas as pd
+    from utils.avaliacao import calcular_metricas, contar_snomed
 
     # Cálculo das métricas de avaliação
-    workbook = openpyxl.load_workbook(RESULTADOS_EXCEL)
-    planilha = workbook['Resultados']
-
-    index = 2
-    VP = FP = FN = VPP = 0
-
-    # Conta classificações para cálculo de métricas
-    while planilha[f'A{index}'].value or planilha[f'G{index}'].value:
-        classificacao = planilha[f'J{index}'].value
-        if classificacao == 'VP':
-            VP += 1
-        elif classificacao == 'FP':
-            FP += 1
-        elif classificacao == 'FN':
-            FN += 1
-        elif classificacao == 'VPP':
-            VPP += 1
-        index += 1
-
-    # Calcula precisao, Recall e F1-Score
-    precisao = (VP + VPP) / (VP + VPP + FP) if (VP + VPP + FP) > 0 else 0
-    recall = (VP + VPP) / (VP + VPP + FN) if (VP + VPP + FN) > 0 else 0
-    f1 = 2 * (precisao * recall) / (precisao + recall) if (precisao + recall) > 0 else 0
-
-    metricas = {
-        "VP": [VP], "FP": [FP], "FN": [FN], "VPP": [VPP],
-        "precisao": [precisao], "Recall": [recall], "F1-Score": [f1]
-    }
-    df_metricas = pd.DataFrame(metricas)
+    df_metricas = pd.DataFrame(calcular_metricas(df_resultado))
 
     # Exibe métricas no terminal
     print("\n+---------------------------------------------------------------+")
@@ -209,19 +288,7 @@ if csv_mestre:
 
 
     # Contagem SNOMED CT
-    index = 2
-    resultados = [0, 0, 0]  # [não encontrados, existem mas não correspondem, existem e correspondem]
-
-    while planilha[f'A{index}'].value or planilha[f'G{index}'].value:
-        classificacao = planilha[f'K{index}'].value
-        try:
-            # Força conversão para inteiro, mesmo que esteja como string
-            numero = int(classificacao)
-            resultados[numero] += 1
-        except:
-            # Caso o valor não seja numérico, ignora
-            pass
-        index += 1
+    resultados = contar_snomed(df_resultado)  # [não encontrados, existem mas não correspondem, existem e correspondem]
 
     # Monta DataFrame com contagem final
     contagem = {
@@ -243,9 +310,55 @@ if csv_mestre:
         print(f"| {col:<33} | {int(df[col].iloc[0]):5} |")
     print("+-----------------------------------+-------+")
 
-    fim = time.time()
-    tempo_total = fim - inicio
-    print(f"\n⏱️   TEMPO TOTAL DE EXECUÇÃO: {tempo_total:.2f} segundos\n")
-
-else:
-    print("\nNenhum CSV mestre foi gerado.")
+# Exibe o uso do cache de completions e das respostas gravadas e fecha os recursos abertos por extrair()
+def encerrar_recursos(recursos, exibir=True):
+    from utils.cache_completions import fechar_cache_completions, estatisticas_cache
+    from utils.respostas_gravadas import fechar_respostas_gravadas, estatisticas_respostas_gravadas
+    from utils.instrumentacao import registrar_cache
+
+    if recursos["cache_completions"] is not None:
+        if exibir:
+            stats = estatisticas_cache(recursos["cache_completions"])
+            print(f"\n💾 Cache de completions: {stats['acertos']} acertos, {stats['falhas']} falhas, "
+                  f"{stats['ignorados']} ignorados (temperature > 0), taxa de acerto {stats['taxa_acerto']:.1%}")
+            registrar_cache("completions", stats)
+        fechar_cache_completions(recursos["cache_completions"])
+    if recursos["respostas_gravadas"] is not None:
+        if exibir:
+            stats_gravadas = estatisticas_respostas_gravadas(recursos["respostas_gravadas"])
+            print(f"\n⏺️  Respostas gravadas: {stats_gravadas['narrativas']} narrativas ({stats_gravadas['blocos']} blocos); "
+                  f"{stats_gravadas['gravadas']} gravadas e {stats_gravadas['reproduzidas']} reproduzidas nesta execução")
+        fechar_respostas_gravadas(recursos["respostas_gravadas"])
+
+
+# Executa todo o pipeline (protegido para que os processos trabalhadores possam importar este módulo)
+def main(config=None):
+    from utils.instrumentacao import iniciar_metricas, encerrar_metricas
+
+    config = config or configuracao_padrao()
+    inicio = time.time()  # Marca início da execução total
+    if config["USAR_METRICAS"]:
+        iniciar_metricas(config["METRICAS_PATH"])
+
+    saida_mestre, recursos = extrair(config)
+
+    if saida_mestre:
+        # Na reprodução, o modelo nunca é carregado; senão, só se algum par SNOMED novo precisar dele
+        carregar_modelo_snomed = None if config["REPRODUZIR_RESPOSTAS"] else (lambda: carregar_modelo(config))
+        df_resultado = avaliar(config, saida_mestre, recursos["llm"], carregar_modelo_snomed)
+        imprimir_resultados(df_resultado)
+        encerrar_recursos(recursos)
+
+        fim = time.time()
+        tempo_total = fim - inicio
+        print(f"\n⏱️   TEMPO TOTAL DE EXECUÇÃO: {tempo_total:.2f} segundos\n")
+
+    else:
+        print("\nNenhuma saída mestre foi gerada.")
+        encerrar_recursos(recursos, exibir=False)
+
+    encerrar_metricas()  # Exibe o resumo (tokens, tokens/s, etapas e caches) e fecha o arquivo de métricas
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import os
+import math
+
+from .similaridade import parear_similares
+from .mapeamento_snomed import verificar_pares_snomed
+from .verificacao_snomed import buscar_veredito, registrar_veredito, normalizar_sctid
+
+# Etapas de avaliação sobre o DataFrame de comparar_com_goldstandard (uma linha por VP/FP/FN),
+# sem abrir e salvar o Excel entre uma etapa e outra; o relatório é exportado uma única vez no fim
+
+COLUNA_SNOMED = ""  # Coluna K do relatório (veredito SNOMED), sem cabeçalho
+LIMIAR_SIMILARIDADE = 0.7  # Limite de similaridade para considerar correspondência
+LIMIAR_CONFIANCA_SNOMED = 0.6  # Vereditos do modelo com probabilidade menor são contados como incertos
+
+# Células vazias no Excel: None, NaN e texto vazio
+def valor_celula(valor):
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)) or valor == "":
+        return None
+    return valor
+
+# Narrativa da linha: a do modelo (VP/FP) ou a do gold standard (FN), pelos 4 primeiros caracteres do nome do arquivo
+def narrativa_linha(linha):
+    nome = valor_celula(linha["nomeNarrativa"]) or valor_celula(linha["semClin_nomeNarrativa"])
+    return os.path.basename(str(nome))[:4] if nome else None
+
+# Pareia FPs e FNs de cada narrativa por similaridade: o FP vira VPP e o FN correspondente deixa de contar
+# Retorna a lista de (similaridade, termo do modelo, termo do gold standard) pareados
+def marcar_vpp(df_resultado, limiar=LIMIAR_SIMILARIDADE):
+    achados_por_narrativa = {}  # narrativa -> {"FP": [(linha, termo)], "FN": [(linha, termo)]}
+    coluna_termo = {"FP": "termoAnalisado", "FN": "semClin_textoAnalisado"}
+    for indice, linha in df_resultado.iterrows():
+        narrativa = narrativa_linha(linha)
+        avaliacao = linha["classificacao"]
+        if narrativa is None or avaliacao not in coluna_termo:
+            continue
+        termo = valor_celula(linha[coluna_termo[avaliacao]])
+        if termo is not None:
+            grupos = achados_por_narrativa.setdefault(narrativa, {"FP": [], "FN": []})
+            grupos[avaliacao].append((indice, str(termo)))
+
+    # Em cada narrativa, uma única matriz de similaridade FP x FN e o pareamento de maior similaridade total
+    correspondencias = []
+    for grupos in achados_por_narrativa.values():
+        fps, fns = grupos["FP"], grupos["FN"]
+        for i_p, i_s, resultado in parear_similares([t for _, t in fps], [t for _, t in fns], limiar):
+            (linha_prompt, t_prompt), (linha_semclin, t_semclin) = fps[i_p], fns[i_s]
+            df_resultado.at[linha_prompt, "classificacao"] = 'VPP'
+            df_resultado.at[linha_semclin, "classificacao"] = ''
+            correspondencias.append((resultado, t_prompt, t_semclin))
+    return correspondencias
+
+# Junta termo e abreviação para exibição
+def termo_abreviacao(termo, abreviacao):
+    return f'{termo} ({abreviacao})'
+
+# Preenche a coluna SNOMED com o veredito (0, 1 ou 2) de cada par (SCTID, termo)
+# Vereditos já registrados vêm do armazenamento; os novos passam pelo índice local e pelo modelo
+# Com llm=None, os pares que dependeriam do modelo ficam sem veredito (contados em "sem_veredito"), a não ser que
+# carregar_modelo seja informado: nesse caso o modelo é carregado só se algum par precisar dele
+# Vereditos do modelo abaixo de LIMIAR_CONFIANCA_SNOMED entre as três opções são contados em "incertos"
+def aplicar_mapeamento_snomed(df_resultado, llm, verificacoes, indice_snomed=None, carregar_modelo=None):
+    if COLUNA_SNOMED not in df_resultado.columns:
+        df_resultado[COLUNA_SNOMED] = None
+    df_resultado[COLUNA_SNOMED] = df_resultado[COLUNA_SNOMED].astype(object)
+
+    pendentes = {}  # (SCTID, termo) ainda não verificados -> linhas que dependem do par
+    for indice, linha in df_resultado.iterrows():
+        sctid_valor = valor_celula(linha["SCTID"])
+        if not sctid_valor or sctid_valor == 'NotFound':
+            continue
+        try:
+            SCTID = normalizar_sctid(sctid_valor)
+            termo_analisado = valor_celula(linha["termoAnalisado"])
+            abreviacao = valor_celula(linha["abreviacao"])
+            termo = termo_abreviacao(termo_analisado, abreviacao) if abreviacao else termo_analisado
+
+            resposta = buscar_veredito(verificacoes, SCTID, termo)
+            if resposta is None:
+                pendentes.setdefault((SCTID, termo), []).append(indice)
+            else:
+                df_resultado.at[indice, COLUNA_SNOMED] = resposta
+        except Exception:
+            df_resultado.at[indice, COLUNA_SNOMED] = 'Error'
+
+    # Resolve os pares novos pelo índice local e classifica o restante em lotes (um token por par)
+    pares = list(pendentes)
+    resolvidos_indice = 0
+    try:
+        classificacoes, resolvidos_indice = verificar_pares_snomed(pares, llm, indice_snomed, carregar_modelo=carregar_modelo)
+    except Exception as e:
+        print(f"\nErro na classificação SNOMED em lote: {e}")
+        classificacoes = [('Error', None)] * len(pares)
+    sem_veredito, incertos = 0, 0
+    for (SCTID, termo), (resposta, probabilidade) in zip(pares, classificacoes):
+        if resposta is None:
+            sem_veredito += 1
+            continue
+        if probabilidade is not None and probabilidade < LIMIAR_CONFIANCA_SNOMED:
+            incertos += 1
+        if resposta != 'Error':
+            registrar_veredito(verificacoes, SCTID, termo, resposta)
+        for indice in pendentes[(SCTID, termo)]:
+            df_resultado.at[indice, COLUNA_SNOMED] = resposta
+
+    return {"pares_novos": len(pares), "resolvidos_indice": resolvidos_indice, "sem_veredito": sem_veredito,
+            "incertos": incertos}
+
+# Conta VP, FP, FN e VPP e calcula precisão, recall e F1-Score
+def calcular_metricas(df_resultado):
+    contagem = df_resultado["classificacao"].value_counts()
+    VP, FP, FN, VPP = (int(contagem.get(c, 0)) for c in ('VP', 'FP', 'FN', 'VPP'))
+
+    precisao = (VP + VPP) / (VP + VPP + FP) if (VP + VPP + FP) > 0 else 0
+    recall = (VP + VPP) / (VP + VPP + FN) if (VP + VPP + FN) > 0 else 0
+    f1 = 2 * (precisao * recall) / (precisao + recall) if (precisao + recall) > 0 else 0
+    return {
+        "VP": [VP], "FP": [FP], "FN": [FN], "VPP": [VPP],
+        "precisao": [precisao], "Recall": [recall], "F1-Score": [f1]
+    }
+
+# Conta os vereditos SNOMED: [não encontrados, existem mas não correspondem, existem e correspondem]
+def contar_snomed(df_resultado):
+    resultados = [0, 0, 0]
+    if COLUNA_SNOMED not in df_resultado.columns:
+        return resultados
+    for classificacao in df_resultado[COLUNA_SNOMED]:
+        try:
+            resultados[int(classificacao)] += 1
+        except (TypeError, ValueError, IndexError):
+            pass  # Caso o valor não seja numérico, ignora
+    return resultados
+
+# Exporta o relatório final (aba 'Resultados') de uma só vez
+def exportar_resultados(df_resultado, excel_resultados):
+    df_resultado.to_excel(excel_resultados, index=False, sheet_name='Resultados')
+
+# Lê de volta o relatório gravado por exportar_resultados (a coluna SNOMED não tem cabeçalho)
+def carregar_resultados(excel_resultados):
+    import pandas as pd
+    df_resultado = pd.read_excel(excel_resultados, sheet_name='Resultados', dtype=object)
+    colunas_sem_nome = [c for c in df_resultado.columns if str(c).startswith("Unnamed:")]
+    return df_resultado.rename(columns={c: COLUNA_SNOMED for c in colunas_sem_nome[-1:]})
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+
+from .manifesto import hash_modelo
+
+TAMANHO_MAXIMO_PADRAO_MB = 512  # Tamanho máximo padrão das respostas guardadas no cache
+
+# Abre (ou cria) o cache de completions em SQLite e retorna um dicionário com a conexão e os contadores
+def abrir_cache_completions(caminho, tamanho_maximo_mb=TAMANHO_MAXIMO_PADRAO_MB):
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+
+    conexao = sqlite3.connect(caminho, timeout=30)
+    conexao.execute("PRAGMA journal_mode=WAL")  # Permite leituras enquanto outro processo escreve
+    conexao.execute("""
+        CREATE TABLE IF NOT EXISTS completions (
+            chave TEXT PRIMARY KEY,
+            resposta TEXT NOT NULL,
+            tamanho INTEGER NOT NULL,
+            ultimo_acesso REAL NOT NULL
+        )
+    """)
+    conexao.execute("CREATE INDEX IF NOT EXISTS idx_completions_acesso ON completions (ultimo_acesso)")
+    conexao.commit()
+
+    tamanho_atual = conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM completions").fetchone()[0]
+    return {
+        "conexao": conexao,
+        "tamanho_maximo": int(tamanho_maximo_mb * 1024 * 1024),
+        "tamanho_estimado": tamanho_atual,
+        "modelos": {},  # model_path -> hash do arquivo (calculado uma vez)
+        "acertos": 0,
+        "falhas": 0,
+        "ignorados": 0,
+    }
+
+# Fecha a conexão do cache
+def fechar_cache_completions(cache):
+    cache["conexao"].close()
+
+# Só faz sentido guardar respostas de amostragem determinística (greedy)
+def cache_aplicavel(temperature):
+    return temperature == 0
+
+# Identidade do modelo carregado (hash do arquivo GGUF, calculado uma vez por caminho)
+def identidade_modelo(cache, llm):
+    caminho_modelo = getattr(llm, 'model_path', '') or ''
+    if caminho_modelo not in cache["modelos"]:
+        cache["modelos"][caminho_modelo] = hash_modelo(caminho_modelo) if caminho_modelo else type(llm).__name__
+    return cache["modelos"][caminho_modelo]
+
+# Chave do cache: hash do prompt, identidade do modelo e parâmetros de geração
+def chave_completion(prompt, modelo, max_tokens, temperature, extras=None):
+    conteudo = json.dumps({
+        "prompt": hashlib.sha256(prompt.encode('utf-8')).hexdigest(),
+        "modelo": modelo,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "extras": extras or {},
+    }, sort_keys=True)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+# Busca uma resposta no cache; retorna None em caso de falha ou se o cache não se aplica
+def buscar_completion(cache, prompt, llm, max_tokens, temperature, extras=None):
+    if not cache_aplicavel(temperature):
+        cache["ignorados"] += 1
+        return None
+
+    chave = chave_completion(prompt, identidade_modelo(cache, llm), max_tokens, temperature, extras)
+    linha = cache["conexao"].execute("SELECT resposta FROM completions WHERE chave = ?", (chave,)).fetchone()
+    if linha is None:
+        cache["falhas"] += 1
+        return None
+
+    # Atualiza o último acesso para a política LRU
+    with cache["conexao"]:
+        cache["conexao"].execute("UPDATE completions SET ultimo_acesso = ? WHERE chave = ?", (time.time(), chave))
+    cache["acertos"] += 1
+    return linha[0]
+
+# Guarda uma resposta no cache e remove as menos usadas se o tamanho máximo for ultrapassado
+def salvar_completion(cache, prompt, llm, max_tokens, temperature, resposta, extras=None):
+    if not cache_aplicavel(temperature):
+        return
+
+    chave = chave_completion(prompt, identidade_modelo(cache, llm), max_tokens, temperature, extras)
+    tamanho = len(resposta.encode('utf-8'))
+    with cache["conexao"]:
+        cache["conexao"].execute(
+            "INSERT OR REPLACE INTO completions (chave, resposta, tamanho, ultimo_acesso) VALUES (?, ?, ?, ?)",
+            (chave, resposta, tamanho, time.time())
+        )
+    cache["tamanho_estimado"] += tamanho
+
+    if cache["tamanho_estimado"] > cache["tamanho_maximo"]:
+        despejar_completions(cache)
+
+# Remove as entradas menos usadas recentemente até o cache caber no tamanho máximo
+def despejar_completions(cache):
+    conexao = cache["conexao"]
+    with conexao:
+        total = conexao.execute("SELECT COALESCE(SUM(tamanho), 0) FROM completions").fetchone()[0]
+        if total > cache["tamanho_maximo"]:
+            remover = []
+            for chave, tamanho in conexao.execute("SELECT chave, tamanho FROM completions ORDER BY ultimo_acesso ASC"):
+                if total <= cache["tamanho_maximo"]:
+                    break
+                remover.append((chave,))
+                total -= tamanho
+            conexao.executemany("DELETE FROM completions WHERE chave = ?", remover)
+    cache["tamanho_estimado"] = total
+
+# Retorna os contadores do cache e a taxa de acerto
+def estatisticas_cache(cache):
+    consultas = cache["acertos"] + cache["falhas"]
+    return {
+        "acertos": cache["acertos"],
+        "falhas": cache["falhas"],
+        "ignorados": cache["ignorados"],
+        "taxa_acerto": cache["acertos"] / consultas if consultas else 0.0,
+    }
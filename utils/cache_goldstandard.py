@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+
+# Cache dos achados já extraídos dos XMLs do gold standard, em Parquet (uma linha por achado).
+# Cada arquivo é identificado por caminho, tamanho, data de modificação e hash do conteúdo;
+# as impressões digitais ficam nos metadados do próprio arquivo Parquet, então uma leitura carrega tudo.
+# Os metadados guardam também a versão das regras de extração: com outra versão, o cache inteiro é descartado.
+
+COLUNAS_ACHADOS = ["arquivo", "narrativa", "termo", "categoria", "negado"]
+
+# Hash SHA-256 do conteúdo de um arquivo
+def hash_arquivo(caminho):
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+# Abre o cache (ou cria um vazio); sem pyarrow o cache fica desativado e tudo é reprocessado
+# versao_regras: identificador das regras que extraíram os achados (versao_regras_goldstandard())
+def abrir_cache_goldstandard(caminho, versao_regras=None):
+    cache = {"caminho": caminho, "arquivos": {}, "achados": {}, "alterado": False, "acertos": 0, "falhas": 0,
+             "versao_regras": versao_regras}
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("\n⚠️ pyarrow não instalado; cache do gold standard desativado.")
+        cache["caminho"] = None
+        return cache
+
+    if caminho and os.path.exists(caminho):
+        try:
+            tabela = pq.read_table(caminho)
+            metadados = tabela.schema.metadata or {}
+            versao_gravada = metadados.get(b'versao_regras', b'').decode('utf-8') or None
+            if versao_gravada != versao_regras:
+                print(f"\n♻️ Regras de extração do gold standard mudaram; cache em {caminho} descartado.")
+                cache["alterado"] = True
+                return cache
+            cache["arquivos"] = json.loads(metadados.get(b'arquivos', b'{}'))
+            for arquivo in cache["arquivos"]:
+                cache["achados"][arquivo] = []
+            colunas = tabela.to_pydict()
+            for arquivo, narrativa, termo, categoria, negado in zip(*(colunas[c] for c in COLUNAS_ACHADOS)):
+                if arquivo in cache["achados"]:
+                    cache["achados"][arquivo].append(
+                        {"narrativa": narrativa, "termo": termo, "categoria": categoria, "negado": negado}
+                    )
+        except Exception as e:
+            print(f"\n⚠️ Cache do gold standard inválido em {caminho}: {e}. Iniciando um novo.")
+            cache["arquivos"], cache["achados"] = {}, {}
+    return cache
+
+# Retorna os achados em cache de um XML, ou None se o arquivo mudou ou nunca foi processado
+def consultar_goldstandard(cache, caminho_xml):
+    chave = os.path.abspath(caminho_xml)
+    info = os.stat(caminho_xml)  # Levanta FileNotFoundError se o XML não existir
+    registro = cache["arquivos"].get(chave)
+    if registro is None:
+        cache["falhas"] += 1
+        return None
+
+    if registro["tamanho"] != info.st_size or registro["mtime_ns"] != info.st_mtime_ns:
+        # Tamanho ou data mudaram: confere o conteúdo antes de descartar
+        if registro["tamanho"] != info.st_size or registro["hash"] != hash_arquivo(caminho_xml):
+            cache["falhas"] += 1
+            return None
+        registro["mtime_ns"] = info.st_mtime_ns
+        cache["alterado"] = True
+
+    cache["acertos"] += 1
+    return cache["achados"][chave]
+
+# Registra os achados extraídos de um XML junto com sua impressão digital
+def registrar_goldstandard(cache, caminho_xml, achados):
+    chave = os.path.abspath(caminho_xml)
+    info = os.stat(caminho_xml)
+    cache["arquivos"][chave] = {"tamanho": info.st_size, "mtime_ns": info.st_mtime_ns, "hash": hash_arquivo(caminho_xml)}
+    cache["achados"][chave] = [
+        {"narrativa": a["narrativa"], "termo": a["termo"], "categoria": a["categoria"], "negado": bool(a["negado"])}
+        for a in achados
+    ]
+    cache["alterado"] = True
+
+# Grava o cache em Parquet (escrita atômica), descartando arquivos que não existem mais
+def salvar_cache_goldstandard(cache):
+    if not cache["caminho"] or not cache["alterado"]:
+        return
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arquivos = {chave: registro for chave, registro in cache["arquivos"].items() if os.path.exists(chave)}
+    colunas = {c: [] for c in COLUNAS_ACHADOS}
+    for arquivo in arquivos:
+        for achado in cache["achados"][arquivo]:
+            colunas["arquivo"].append(arquivo)
+            for c in COLUNAS_ACHADOS[1:]:
+                colunas[c].append(achado[c])
+
+    esquema = pa.schema(
+        [("arquivo", pa.string()), ("narrativa", pa.string()), ("termo", pa.string()),
+         ("categoria", pa.string()), ("negado", pa.bool_())],
+        metadata={"arquivos": json.dumps(arquivos), "versao_regras": cache["versao_regras"] or ""}
+    )
+    pasta = os.path.dirname(cache["caminho"])
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    caminho_temp = f"{cache['caminho']}.{os.getpid()}.tmp"
+    pq.write_table(pa.Table.from_pydict(colunas, schema=esquema), caminho_temp)
+    os.replace(caminho_temp, cache["caminho"])
+    cache["alterado"] = False
+
+# Retorna acertos, falhas e taxa de acerto do cache
+def estatisticas_cache_goldstandard(cache):
+    consultas = cache["acertos"] + cache["falhas"]
+    return {
+        "acertos": cache["acertos"],
+        "falhas": cache["falhas"],
+        "taxa_acerto": cache["acertos"] / consultas if consultas else 0.0,
+    }
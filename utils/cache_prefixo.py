@@ -0,0 +1,85 @@
+import os
+import pickle
+import hashlib
+
+MARCADOR_TEXTO = "\x00TEXTO_CLINICO\x00"  # Marcador temporário para localizar {textoClinico} no template
+
+# Separa o template em prefixo estático e sufixo (texto antes e depois de {textoClinico})
+def separar_template(prompt_template):
+    formatado = prompt_template.format(textoClinico=MARCADOR_TEXTO)
+    prefixo, sufixo = formatado.split(MARCADOR_TEXTO, 1)
+    return prefixo, sufixo
+
+# Conta quantos tokens iniciais duas sequências têm em comum
+def tokens_em_comum(tokens_a, tokens_b):
+    comum = 0
+    for a, b in zip(tokens_a, tokens_b):
+        if a != b:
+            break
+        comum += 1
+    return comum
+
+# Gera uma chave que identifica o snapshot (modelo + contexto + texto do prefixo)
+def chave_snapshot(llm, prefixo):
+    conteudo = f"{getattr(llm, 'model_path', '')}|{llm.n_ctx()}|{prefixo}"
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+# Avalia o prefixo estático do template uma única vez e guarda o estado do LLaMA
+def preparar_cache_prefixo(llm, prompt_template, caminho_snapshot=None):
+
+    # Retorna um dicionário com o estado salvo, os tokens do prefixo e o template de origem.
+    prefixo, _ = separar_template(prompt_template)
+    tokens_prefixo = llm.tokenize(prefixo.encode('utf-8'))
+    chave = chave_snapshot(llm, prefixo)
+
+    # Tenta reaproveitar um snapshot salvo em disco por uma execução anterior
+    if caminho_snapshot and os.path.exists(caminho_snapshot):
+        try:
+            with open(caminho_snapshot, 'rb') as f:
+                snapshot = pickle.load(f)
+            if snapshot.get('chave') == chave and snapshot.get('tokens') == tokens_prefixo:
+                llm.load_state(snapshot['estado'])
+                print(f"\n♻️  Snapshot do prefixo carregado de {caminho_snapshot} ({len(tokens_prefixo)} tokens).")
+                return {
+                    'template': prompt_template,
+                    'tokens': tokens_prefixo,
+                    'estado': snapshot['estado'],
+                }
+            print("\n⚠️ Snapshot do prefixo desatualizado. Recalculando...")
+        except Exception as e:
+            print(f"\n⚠️ Erro ao carregar snapshot do prefixo {caminho_snapshot}: {e}. Recalculando...")
+
+    # Avalia o prefixo do zero e salva o estado resultante
+    llm.reset()
+    llm.eval(tokens_prefixo)
+    estado = llm.save_state()
+    print(f"\n✅ Prefixo do prompt avaliado uma única vez ({len(tokens_prefixo)} tokens).")
+
+    if caminho_snapshot:
+        try:
+            pasta = os.path.dirname(caminho_snapshot)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            caminho_temp = f"{caminho_snapshot}.{os.getpid()}.tmp"  # Nome único por processo
+            with open(caminho_temp, 'wb') as f:
+                pickle.dump({'chave': chave, 'tokens': tokens_prefixo, 'estado': estado}, f)
+            os.replace(caminho_temp, caminho_snapshot)  # Escrita atômica
+        except Exception as e:
+            print(f"\n⚠️ Erro ao salvar snapshot do prefixo em {caminho_snapshot}: {e}")
+
+    return {'template': prompt_template, 'tokens': tokens_prefixo, 'estado': estado}
+
+# Restaura o estado do prefixo antes de uma chamada, se preciso, e retorna quantos tokens serão reaproveitados
+# O llama_cpp compara o estado atual com os tokens do prompt e só avalia o restante, então o estado salvo
+# (cache KV do prefixo mais os logits, centenas de MB) só é copiado quando o contexto atual aproveita menos que ele
+def restaurar_prefixo(llm, cache_prefixo, tokens_prompt):
+    if not cache_prefixo:
+        return 0
+
+    em_contexto = tokens_em_comum(llm.input_ids[:llm.n_tokens], tokens_prompt)
+    do_prefixo = tokens_em_comum(cache_prefixo['tokens'], tokens_prompt)
+    if do_prefixo <= em_contexto:
+        return em_contexto
+
+    llm.load_state(cache_prefixo['estado'])
+    return do_prefixo
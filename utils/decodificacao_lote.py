@@ -0,0 +1,377 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from comando_llama.prompt import MODOS_SAIDA
+from .processador_llama import dividir_texto_por_prompt_seguro
+from .cache_prefixo import separar_template, tokens_em_comum
+from .cache_completions import buscar_completion, salvar_completion
+from .processador_csv import LeitorTuplas
+from .manifesto import carregar_manifesto
+from .ingestao import iterar_narrativas
+from .instrumentacao import registrar, registrar_bloco
+from .respostas_gravadas import gravar_respostas
+from .processador_narrativa import (
+    processar_narrativas, extrair_resposta_texto, formatar_saida, chave_execucao_narrativas, consultar_manifesto_texto,
+    registrar_saida_manifesto, adicionar_saida, adicionar_saida_registrada, saida_anterior_colunar
+)
+
+# Decodificação em lote: vários blocos de narrativas rodam como sequências paralelas em um único contexto do llama.cpp.
+# A sequência 0 guarda só o prefixo fixo do prompt (avaliado uma vez); as sequências 1..N copiam esse trecho do cache KV
+# (sem recalcular) e cada passo de geração decodifica um token de todas as sequências ativas em uma única chamada,
+# então cada leitura dos pesos serve N sequências. Quando uma sequência termina, o próximo bloco pendente ocupa o lugar.
+
+N_SEQUENCIAS_PADRAO = 4
+SEQUENCIA_PREFIXO = 0
+TOP_K_AMOSTRAGEM = 40  # Só usado com temperature > 0
+
+# Verifica se o objeto é um Llama de verdade (com a API de baixo nível); LLMs falsos usam o caminho sequencial
+def decodificacao_em_lote_disponivel(llm):
+    return hasattr(llm, "_model") and hasattr(llm, "context_params")
+
+# Cria um contexto próprio para o lote sobre os pesos já carregados: n_sequencias + 1 sequências (a 0 é o prefixo)
+# dividindo um cache KV unificado de n_ctx_lote tokens (padrão: o dobro do contexto do modelo)
+def criar_contexto_lote(llm, n_sequencias=N_SEQUENCIAS_PADRAO, n_ctx_lote=None):
+    import llama_cpp
+    from llama_cpp import _internals
+
+    n_ctx_lote = max(n_ctx_lote or 2 * llm.n_ctx(), llm.n_ctx())
+    parametros = llama_cpp.llama_context_params.from_buffer_copy(llm.context_params)
+    parametros.n_ctx = n_ctx_lote
+    parametros.n_seq_max = n_sequencias + 1
+    parametros.kv_unified = True  # Todas as sequências no mesmo cache KV: o prefixo é compartilhado, não copiado
+    contexto = _internals.LlamaContext(model=llm._model, params=parametros, verbose=False)
+    return {
+        "ctx": contexto,
+        "lote": _internals.LlamaBatch(n_tokens=llm.n_batch, embd=0, n_seq_max=1, verbose=False),
+        "n_batch": llm.n_batch,
+        "n_ctx": n_ctx_lote,
+        "n_sequencias": n_sequencias,
+        "n_vocab": llm.n_vocab(),
+        "vocab": llm._model.vocab,
+        "tokens_prefixo": [],  # Prefixo já avaliado na sequência 0 (reaproveitado entre chamadas)
+    }
+
+# Libera o contexto do lote
+def fechar_contexto_lote(contexto):
+    contexto["lote"].close()
+    contexto["ctx"].close()
+
+# Decodifica itens (token, posição, sequência, pede_logits) em chamadas de até n_batch tokens
+# Retorna, para cada item com logits, (sequência, logits)
+def _decodificar(contexto, itens):
+    saidas = []
+    lote = contexto["lote"]
+    for inicio in range(0, len(itens), contexto["n_batch"]):
+        parte = itens[inicio:inicio + contexto["n_batch"]]
+        lote.batch.n_tokens = len(parte)
+        for i, (token, posicao, sequencia, pede_logits) in enumerate(parte):
+            lote.batch.token[i] = token
+            lote.batch.pos[i] = posicao
+            lote.batch.seq_id[i][0] = sequencia
+            lote.batch.n_seq_id[i] = 1
+            lote.batch.logits[i] = pede_logits
+        contexto["ctx"].decode(lote)
+        for i, (_, _, sequencia, pede_logits) in enumerate(parte):
+            if pede_logits:
+                logits = np.ctypeslib.as_array(contexto["ctx"].get_logits_ith(i), shape=(contexto["n_vocab"],))
+                saidas.append((sequencia, logits.copy()))
+    return saidas
+
+# Escolhe o próximo token: o mais provável (temperature 0) ou amostrado entre os TOP_K_AMOSTRAGEM mais prováveis
+def _escolher_token(logits, temperature, aleatorio):
+    if temperature <= 0:
+        return int(np.argmax(logits))
+    candidatos = np.argpartition(logits, -TOP_K_AMOSTRAGEM)[-TOP_K_AMOSTRAGEM:]
+    pesos = np.exp((logits[candidatos] - logits[candidatos].max()) / temperature)
+    return int(aleatorio.choice(candidatos, p=pesos / pesos.sum()))
+
+# Garante que a sequência 0 contenha exatamente tokens_prefixo, reaproveitando o que já foi avaliado
+def _preparar_prefixo(contexto, tokens_prefixo):
+    ctx = contexto["ctx"]
+    for sequencia in range(1, contexto["n_sequencias"] + 1):
+        ctx.kv_cache_seq_rm(sequencia, -1, -1)
+    comum = tokens_em_comum(contexto["tokens_prefixo"], tokens_prefixo)
+    if comum < len(contexto["tokens_prefixo"]):
+        ctx.kv_cache_seq_rm(SEQUENCIA_PREFIXO, comum, -1)
+    novos = [(token, comum + i, SEQUENCIA_PREFIXO, False) for i, token in enumerate(tokens_prefixo[comum:])]
+    if novos:
+        _decodificar(contexto, novos)
+    contexto["tokens_prefixo"] = list(tokens_prefixo)
+    return len(tokens_prefixo) - comum
+
+# Gera as respostas de vários prompts em sequências paralelas de um único contexto
+# Retorna (lista de {"texto", "tokens", "motivo", "tokens_prompt"} na ordem dos prompts, estatísticas da execução)
+# prefixo: texto fixo compartilhado pelos prompts (ex.: parte do template antes de {textoClinico});
+# parada_antecipada=True interrompe cada sequência quando as listas de tuplas terminam ou a saída entra em laço
+def gerar_em_lote(llm, contexto, prompts, max_tokens=256, temperature=0.0, stop=None, prefixo="",
+                  parada_antecipada=False, semente=0):
+    import llama_cpp
+
+    inicio = time.perf_counter()
+    aleatorio = np.random.default_rng(semente)
+    tokens_prompts = [llm.tokenize(prompt.encode('utf-8')) for prompt in prompts]
+    tokens_prefixo = llm.tokenize(prefixo.encode('utf-8')) if prefixo else []
+    # Cada prompt aproveita o trecho do prefixo que tokenizou igual (ao menos um token fica para gerar logits)
+    compartilhados = [min(tokens_em_comum(tokens_prefixo, tokens), len(tokens) - 1) for tokens in tokens_prompts]
+    tokens_prefixo = tokens_prefixo[:max(compartilhados, default=0)]
+    avaliados_prefixo = _preparar_prefixo(contexto, tokens_prefixo)
+
+    resultados = [None] * len(prompts)
+    pendentes = deque(range(len(prompts)))
+    livres = deque(range(1, contexto["n_sequencias"] + 1))
+    ativas = {}  # sequência -> estado do prompt em geração
+    ocupado = len(tokens_prefixo)  # Células do cache KV reservadas
+    chamadas_decode = 0
+    tokens_avaliados = 0
+
+    def concluir(sequencia, motivo):
+        nonlocal ocupado
+        estado = ativas.pop(sequencia)
+        contexto["ctx"].kv_cache_seq_rm(sequencia, -1, -1)
+        livres.append(sequencia)
+        ocupado -= estado["reserva"]
+        texto = estado["texto"]
+        for sequencia_parada in stop or []:
+            if sequencia_parada in texto:
+                texto = texto[:texto.index(sequencia_parada)]
+        resultados[estado["indice"]] = {"texto": texto.strip(), "tokens": len(estado["gerados"]), "motivo": motivo,
+                                        "tokens_prompt": len(tokens_prompts[estado["indice"]])}
+
+    while pendentes or ativas:
+        itens = []
+
+        # Admite novos prompts enquanto houver sequência livre e espaço no cache KV para o prompt e a saída
+        while pendentes and livres:
+            indice = pendentes[0]
+            compartilhado = compartilhados[indice]
+            sufixo = tokens_prompts[indice][compartilhado:]
+            reserva = len(sufixo) + max_tokens
+            if ocupado + reserva > contexto["n_ctx"]:
+                if not ativas and not itens:
+                    raise ValueError(
+                        f"O prompt {indice} ({len(tokens_prompts[indice])} tokens) mais a saída ({max_tokens} tokens) "
+                        f"não cabem no contexto do lote ({contexto['n_ctx']} tokens)."
+                    )
+                break
+            pendentes.popleft()
+            sequencia = livres.popleft()
+            ocupado += reserva
+            contexto["ctx"].kv_cache_seq_cp(SEQUENCIA_PREFIXO, sequencia, 0, compartilhado)
+            ativas[sequencia] = {
+                "indice": indice, "posicao": len(tokens_prompts[indice]), "reserva": reserva, "gerados": [],
+                "bytes": b"", "texto": "", "proximo": None,
+                "leitor": LeitorTuplas() if parada_antecipada else None,
+            }
+            itens.extend((token, compartilhado + i, sequencia, i == len(sufixo) - 1) for i, token in enumerate(sufixo))
+
+        # Um token novo de cada sequência que já está gerando
+        for sequencia, estado in ativas.items():
+            if estado["proximo"] is not None:
+                itens.append((estado["proximo"], estado["posicao"], sequencia, True))
+                estado["posicao"] += 1
+                estado["proximo"] = None
+
+        chamadas_decode += -(-len(itens) // contexto["n_batch"])
+        tokens_avaliados += len(itens)
+        for sequencia, logits in _decodificar(contexto, itens):
+            estado = ativas[sequencia]
+            token = _escolher_token(logits, temperature, aleatorio)
+            if llama_cpp.llama_vocab_is_eog(contexto["vocab"], token):
+                concluir(sequencia, "stop")
+                continue
+
+            estado["bytes"] += llm.detokenize([token], prev_tokens=estado["gerados"])
+            estado["gerados"].append(token)
+            texto = estado["bytes"].decode('utf-8', errors='ignore')
+            novo, estado["texto"] = texto[len(estado["texto"]):], texto
+
+            leitor = estado["leitor"]
+            if leitor is not None:
+                leitor.alimentar(novo)
+
+            if stop and any(sequencia_parada in texto for sequencia_parada in stop):
+                concluir(sequencia, "stop")
+            elif leitor is not None and (leitor.concluido() or leitor.degenerado()):
+                concluir(sequencia, "stop")
+            elif len(estado["gerados"]) >= max_tokens:
+                concluir(sequencia, "length")
+            else:
+                estado["proximo"] = token
+
+    duracao = time.perf_counter() - inicio
+    tokens_gerados = sum(resultado["tokens"] for resultado in resultados)
+    estatisticas = {
+        "prompts": len(prompts),
+        "tokens_gerados": tokens_gerados,
+        "tokens_avaliados": tokens_avaliados,
+        "tokens_prefixo_avaliados": avaliados_prefixo,
+        "chamadas_decode": chamadas_decode,
+        "tempo": duracao,
+        "tokens_por_segundo": tokens_gerados / duracao if duracao else 0.0,
+    }
+    return resultados, estatisticas
+
+# Versão em lote de PesquisaClin_Llama para vários textos: todos os blocos de todos os textos são gerados juntos
+# Retorna a lista de respostas (uma por texto, na mesma ordem) no mesmo formato de PesquisaClin_Llama
+# Com blocos_separados=True, retorna por texto a lista das respostas de cada bloco, sem juntá-las
+def PesquisaClin_Llama_lote(textos, llm, contexto, max_tokens=256, temperature=0.7, cache_completions=None,
+                            modo_saida="completo", parada_antecipada=False, nomes=None, blocos_separados=False):
+    prompt_template = MODOS_SAIDA[modo_saida]["template"]
+    stop = MODOS_SAIDA[modo_saida]["stop"]
+    prefixo, _ = separar_template(prompt_template)
+    if parada_antecipada:
+        extras_cache = {"stop": stop, "gramatica": False, "streaming": True}
+    else:
+        extras_cache = {"stop": stop, "gramatica": False} if stop else None
+
+    # Todos os blocos de todos os textos; os que já estão no cache de completions não vão ao modelo
+    respostas_blocos = []  # Por texto, a lista de respostas de seus blocos
+    prompts, destinos = [], []
+    for i, texto in enumerate(textos):
+        blocos = dividir_texto_por_prompt_seguro(texto, llm, prompt_template, max_tokens_saida=max_tokens)
+        respostas_blocos.append([None] * len(blocos))
+        for j, bloco in enumerate(blocos):
+            prompt = prompt_template.format(textoClinico=bloco)
+            resposta = None
+            if cache_completions is not None:
+                resposta = buscar_completion(cache_completions, prompt, llm, max_tokens, temperature, extras_cache)
+            if resposta is not None:
+                respostas_blocos[i][j] = resposta
+                registrar_bloco(origem="cache_completions", narrativa=nomes[i] if nomes else None)
+            else:
+                prompts.append(prompt)
+                destinos.append((i, j))
+
+    if prompts:
+        print(f"\n🔹 Decodificando {len(prompts)} blocos em lote ({contexto['n_sequencias']} sequências paralelas, "
+              f"{len(textos)} narrativas)...")
+        resultados, estatisticas = gerar_em_lote(
+            llm, contexto, prompts, max_tokens=max_tokens, temperature=temperature, stop=stop, prefixo=prefixo,
+            parada_antecipada=parada_antecipada
+        )
+        print(f"⏱️  {estatisticas['tokens_gerados']} tokens gerados em {estatisticas['tempo']:.2f}s "
+              f"({estatisticas['tokens_por_segundo']:.1f} tokens/s agregados, {estatisticas['chamadas_decode']} chamadas de decode)")
+        registrar("lote", narrativa=None, **estatisticas)
+        for prompt, (i, j), resultado in zip(prompts, destinos, resultados):
+            respostas_blocos[i][j] = resultado["texto"]
+            # As sequências dividem o tempo do lote: por bloco ficam só os tokens e o corte em max_tokens
+            registrar_bloco(resultado["tokens_prompt"], resultado["tokens"], cortada=resultado["motivo"] == "length",
+                            origem="lote", narrativa=nomes[i] if nomes else None)
+            if cache_completions is not None:
+                salvar_completion(cache_completions, prompt, llm, max_tokens, temperature, resultado["texto"], extras_cache)
+
+    if blocos_separados:
+        return respostas_blocos
+    return ["\n".join(respostas) for respostas in respostas_blocos]
+
+# Processa um grupo de narrativas de uma vez; em caso de erro no lote, cada narrativa volta ao caminho sequencial
+def _extrair_grupo(textos, nomes, llm, contexto, max_tokens, temperature, cache_completions, modo_saida, parada_antecipada,
+                   respostas_gravadas=None):
+    try:
+        respostas_blocos = PesquisaClin_Llama_lote(
+            textos, llm, contexto, max_tokens=max_tokens, temperature=temperature, cache_completions=cache_completions,
+            modo_saida=modo_saida, parada_antecipada=parada_antecipada, nomes=nomes, blocos_separados=True
+        )
+    except Exception as e:
+        print(f"\n⚠️ Erro na decodificação em lote: {e}. Processando o grupo sequencialmente.")
+        return [
+            extrair_resposta_texto(texto, nome, llm, max_tokens=max_tokens, temperature=temperature,
+                                   cache_completions=cache_completions, modo_saida=modo_saida, streaming=parada_antecipada,
+                                   respostas_gravadas=respostas_gravadas)
+            for texto, nome in zip(textos, nomes)
+        ]
+    respostas = []
+    for nome, texto, blocos in zip(nomes, textos, respostas_blocos):
+        respostas.append("\n".join(blocos))
+        print(f"\n\n✅ Processado {nome} (lote):\n {respostas[-1][:100]}...")
+        if respostas_gravadas is not None:
+            gravar_respostas(
+                respostas_gravadas, nome, blocos, modo_saida, texto, modelo=getattr(llm, 'model_path', ''),
+                n_ctx=llm.n_ctx(), max_tokens=max_tokens, temperature=temperature, usar_gramatica=False, streaming=parada_antecipada
+            )
+    return respostas
+
+# Processa as narrativas de uma origem em grupos decodificados em lote, com as mesmas saídas do caminho sequencial
+def processar_narrativas_lote(pasta_narrativas, csv_output_folder, llm, n_sequencias=N_SEQUENCIAS_PADRAO, n_ctx_lote=None,
+                              tamanho_grupo=None, max_tokens=256, temperature=0.7, caminho_manifesto=None,
+                              cache_completions=None, modo_saida="completo", usar_gramatica=False, streaming=False,
+                              retornar_caminhos=False, respostas_gravadas=None, saida_colunar=None):
+
+    # tamanho_grupo: narrativas lidas antes de cada lote (padrão: 2 por sequência, para que uma sequência que termine
+    # cedo logo receba outro bloco). streaming=True aplica a mesma parada antecipada da extração em fluxo.
+    # Sem a API de baixo nível do llama_cpp, ou com gramática (ainda não suportada no lote), usa o caminho sequencial.
+    if usar_gramatica or not decodificacao_em_lote_disponivel(llm):
+        motivo = "gramática GBNF ativa" if usar_gramatica else "modelo sem a API de lote do llama_cpp"
+        print(f"\n⚠️ Decodificação em lote indisponível ({motivo}). Usando o processamento sequencial.")
+        return processar_narrativas(
+            pasta_narrativas, csv_output_folder, llm, max_tokens=max_tokens, temperature=temperature,
+            caminho_manifesto=caminho_manifesto, cache_completions=cache_completions, modo_saida=modo_saida,
+            usar_gramatica=usar_gramatica, retornar_caminhos=retornar_caminhos, streaming=streaming,
+            respostas_gravadas=respostas_gravadas, saida_colunar=saida_colunar
+        )
+
+    saidas_individuais = []
+    tamanho_grupo = tamanho_grupo or 2 * n_sequencias
+    manifesto = carregar_manifesto(caminho_manifesto) if caminho_manifesto else None
+    if manifesto is not None:
+        chave_exec = chave_execucao_narrativas(getattr(llm, 'model_path', ''), max_tokens, temperature, modo_saida, False,
+                                               streaming, llm.n_ctx())
+
+    contexto = None
+    grupo = []  # (nome, chave, texto, entrada reaproveitada), na ordem de leitura
+    total_narrativas = 0
+
+    def concluir_grupo():
+        nonlocal contexto
+        novos = [(nome, texto) for nome, _, texto, entrada in grupo if entrada is None and texto]
+        respostas = {}
+        if novos:
+            if contexto is None:
+                contexto = criar_contexto_lote(llm, n_sequencias, n_ctx_lote)
+                print(f"\n\n✅ Decodificação em lote: {n_sequencias} sequências, contexto de {contexto['n_ctx']} tokens, "
+                      f"grupos de até {tamanho_grupo} narrativas.")
+            nomes = [nome for nome, _ in novos]
+            respostas = dict(zip(nomes, _extrair_grupo(
+                [texto for _, texto in novos], nomes, llm, contexto, max_tokens, temperature, cache_completions,
+                modo_saida, streaming, respostas_gravadas
+            )))
+
+        for nome_narrativa, chave, texto, entrada in grupo:
+            if entrada is not None:
+                adicionar_saida_registrada(saidas_individuais, entrada, nome_narrativa, retornar_caminhos, saida_colunar)
+                continue
+            if not texto:
+                print(f"\n⚠️ Elemento TEXT não encontrado, vazio ou XML inválido em {nome_narrativa}. Pulando arquivo.")
+                continue
+            if respostas[nome_narrativa] is None:
+                continue
+            dataframe_resultante = formatar_saida(respostas[nome_narrativa], nome_narrativa, csv_output_folder, modo_saida,
+                                                  saida_colunar)
+            adicionar_saida(saidas_individuais, dataframe_resultante, nome_narrativa, csv_output_folder, retornar_caminhos,
+                            saida_colunar, chave)
+            if chave is not None:
+                registrar_saida_manifesto(manifesto, caminho_manifesto, nome_narrativa, chave, respostas[nome_narrativa],
+                                          dataframe_resultante, csv_output_folder, saida_colunar)
+        grupo.clear()
+
+    print(f"\n\n✅ Lendo narrativas de {pasta_narrativas}. Iniciando processamento em lote...")
+    try:
+        for nome_narrativa, texto in iterar_narrativas(pasta_narrativas):
+            total_narrativas += 1
+            chave = entrada = None
+            if manifesto is not None:
+                chave, entrada = consultar_manifesto_texto(manifesto, chave_exec, nome_narrativa, texto,
+                                                           saida_anterior_colunar(saida_colunar))
+            grupo.append((nome_narrativa, chave, texto, entrada))
+            if sum(1 for item in grupo if item[3] is None) >= tamanho_grupo:
+                concluir_grupo()
+        concluir_grupo()
+    finally:
+        if contexto is not None:
+            fechar_contexto_lote(contexto)
+
+    if not total_narrativas:
+        print("\n❌ Nenhum arquivo XML válido encontrado na pasta de narrativas.")
+    return saidas_individuais
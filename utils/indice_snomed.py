@@ -0,0 +1,160 @@
+import os
+import re
+import sqlite3
+import argparse
+
+from .processador_xml import padronizar_string
+
+TIPO_FSN = '900000000000003001'  # typeId do Fully Specified Name no RF2
+TIPO_SINONIMO = '900000000000013009'  # typeId de sinônimo no RF2
+TAMANHO_LOTE_INSERCAO = 50000
+TAMANHO_MMAP = 1024 * 1024 * 1024  # Até 1 GB do índice mapeado em memória
+
+# Normaliza termos para busca: minúsculas, sem acentos, sem pontuação e com espaços simples
+def normalizar_busca(termo):
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', padronizar_string(termo))).strip()
+
+# Lê um arquivo RF2 (TSV com cabeçalho) linha a linha, devolvendo dicionários por coluna
+def ler_rf2(caminho):
+    with open(caminho, 'r', encoding='utf-8') as f:
+        cabecalho = f.readline().rstrip('\r\n').split('\t')
+        for linha in f:
+            valores = linha.rstrip('\r\n').split('\t')
+            if len(valores) == len(cabecalho):
+                yield dict(zip(cabecalho, valores))
+
+# Constrói o índice SQLite a partir dos arquivos Concept e Description (snapshot) do RF2
+def construir_indice_rf2(arquivos_conceitos, arquivos_descricoes, destino):
+    pasta = os.path.dirname(destino)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    caminho_temp = f"{destino}.{os.getpid()}.tmp"
+    if os.path.exists(caminho_temp):
+        os.remove(caminho_temp)
+
+    conexao = sqlite3.connect(caminho_temp)
+    conexao.executescript("""
+        PRAGMA journal_mode=OFF;
+        PRAGMA synchronous=OFF;
+        CREATE TABLE conceitos (
+            sctid TEXT PRIMARY KEY,
+            ativo INTEGER NOT NULL,
+            fsn TEXT
+        ) WITHOUT ROWID;
+        CREATE TABLE descricoes (
+            sctid TEXT NOT NULL,
+            termo TEXT NOT NULL,
+            termo_normalizado TEXT NOT NULL,
+            idioma TEXT NOT NULL,
+            tipo TEXT NOT NULL
+        );
+    """)
+
+    # Conceitos: SCTID -> ativo
+    lote = []
+    total_conceitos = 0
+    for caminho in arquivos_conceitos:
+        for linha in ler_rf2(caminho):
+            lote.append((linha['id'], int(linha['active'])))
+            if len(lote) >= TAMANHO_LOTE_INSERCAO:
+                conexao.executemany("INSERT OR REPLACE INTO conceitos (sctid, ativo) VALUES (?, ?)", lote)
+                total_conceitos += len(lote)
+                lote = []
+    conexao.executemany("INSERT OR REPLACE INTO conceitos (sctid, ativo) VALUES (?, ?)", lote)
+    total_conceitos += len(lote)
+
+    # Descrições ativas: FSN e sinônimos, em todos os idiomas presentes (inclusive português)
+    lote = []
+    total_descricoes = 0
+    for caminho in arquivos_descricoes:
+        for linha in ler_rf2(caminho):
+            if linha['active'] != '1':
+                continue
+            tipo = 'fsn' if linha['typeId'] == TIPO_FSN else 'sinonimo' if linha['typeId'] == TIPO_SINONIMO else 'outro'
+            lote.append((linha['conceptId'], linha['term'], normalizar_busca(linha['term']), linha['languageCode'], tipo))
+            if len(lote) >= TAMANHO_LOTE_INSERCAO:
+                conexao.executemany("INSERT INTO descricoes VALUES (?, ?, ?, ?, ?)", lote)
+                total_descricoes += len(lote)
+                lote = []
+    conexao.executemany("INSERT INTO descricoes VALUES (?, ?, ?, ?, ?)", lote)
+    total_descricoes += len(lote)
+
+    # FSN (de preferência em inglês) preenchido na tabela de conceitos para consultas rápidas
+    # O índice por SCTID é criado antes: sem ele, a subconsulta varreria todas as descrições para cada conceito
+    conexao.executescript("""
+        CREATE INDEX idx_descricoes_sctid ON descricoes (sctid);
+        UPDATE conceitos SET fsn = (
+            SELECT termo FROM descricoes
+            WHERE descricoes.sctid = conceitos.sctid AND tipo = 'fsn'
+            ORDER BY idioma = 'en' DESC LIMIT 1
+        );
+        CREATE INDEX idx_descricoes_termo ON descricoes (termo_normalizado);
+    """)
+    conexao.commit()
+    conexao.execute("VACUUM")
+    conexao.close()
+    os.replace(caminho_temp, destino)  # O índice só aparece no destino depois de completo
+
+    print(f"\n✅ Índice SNOMED CT criado em {destino}: {total_conceitos} conceitos, {total_descricoes} descrições ativas.")
+    return destino
+
+# Abre o índice somente para leitura, mapeado em memória
+def abrir_indice_snomed(caminho):
+    if not caminho or not os.path.exists(caminho):
+        return None
+    conexao = sqlite3.connect(f"file:{os.path.abspath(caminho)}?mode=ro", uri=True, check_same_thread=False)
+    conexao.execute(f"PRAGMA mmap_size={TAMANHO_MMAP}")
+    return conexao
+
+# Fecha o índice
+def fechar_indice_snomed(indice):
+    if indice is not None:
+        indice.close()
+
+# Busca um conceito pelo SCTID; retorna None se o código não existir no release
+def buscar_conceito(indice, sctid):
+    linha = indice.execute("SELECT sctid, ativo, fsn FROM conceitos WHERE sctid = ?", (str(sctid),)).fetchone()
+    if linha is None:
+        return None
+
+    conceito = {"sctid": linha[0], "ativo": bool(linha[1]), "fsn": linha[2], "sinonimos": [], "descricoes_pt": []}
+    for termo, idioma, tipo in indice.execute(
+        "SELECT termo, idioma, tipo FROM descricoes WHERE sctid = ?", (str(sctid),)
+    ):
+        if idioma == 'pt':
+            conceito["descricoes_pt"].append(termo)
+        elif tipo == 'sinonimo':
+            conceito["sinonimos"].append(termo)
+    return conceito
+
+# Lista todas as descrições de um conceito (FSN, sinônimos e descrições em português)
+def descricoes_conceito(conceito):
+    descricoes = [conceito["fsn"]] if conceito["fsn"] else []
+    return descricoes + conceito["sinonimos"] + conceito["descricoes_pt"]
+
+# Busca conceitos por termo normalizado: correspondência exata primeiro, depois por prefixo
+# Retorna até limite pares (SCTID, descrição), pelo índice idx_descricoes_termo
+def buscar_termo(indice, termo, limite=10):
+    normalizado = normalizar_busca(termo)
+    if not normalizado:
+        return []
+    try:
+        resultados = indice.execute(
+            "SELECT DISTINCT sctid, termo FROM descricoes WHERE termo_normalizado = ? LIMIT ?", (normalizado, limite)
+        ).fetchall()
+        if not resultados:
+            resultados = indice.execute(
+                "SELECT DISTINCT sctid, termo FROM descricoes WHERE termo_normalizado >= ? AND termo_normalizado < ? LIMIT ?",
+                (normalizado, normalizado + '\uffff', limite)
+            ).fetchall()
+    except sqlite3.OperationalError as e:
+        raise ValueError(f"Índice SNOMED CT sem a coluna de termos normalizados; reconstrua-o com construir_indice_rf2 ({e})")
+    return resultados
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Constrói o índice SNOMED CT local a partir de arquivos RF2 (snapshot).")
+    parser.add_argument("destino", help="Arquivo SQLite de saída (ex.: data/snomed_indice.sqlite)")
+    parser.add_argument("--conceitos", nargs="+", required=True, help="Arquivos sct2_Concept_Snapshot_*.txt")
+    parser.add_argument("--descricoes", nargs="+", required=True, help="Arquivos sct2_Description_Snapshot-*.txt")
+    args = parser.parse_args()
+    construir_indice_rf2(args.conceitos, args.descricoes, args.destino)
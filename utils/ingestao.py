@@ -0,0 +1,106 @@
+import os
+import glob
+import posixpath
+import tarfile
+import zipfile
+import xml.etree.ElementTree as ET
+
+# Ingestão das narrativas em fluxo: uma narrativa por vez, sem listar o corpus inteiro nem montar a árvore XML completa.
+# Origens aceitas: pasta, arquivo XML, padrão glob, arquivo .zip, arquivo .tar (.tar.gz, .tgz, .tar.bz2, .tar.xz)
+# ou uma lista dessas origens.
+# O nome de cada narrativa é o caminho relativo à raiz da origem (raiz do arquivo compactado ou parte fixa do glob),
+# então arquivos de mesmo nome em subpastas diferentes não se confundem. Em uma pasta, é o próprio nome do arquivo.
+
+EXTENSOES_TAR = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+# Verifica se o nome é de uma narrativa (XML que não é gold standard)
+def eh_narrativa(nome):
+    return nome.endswith('.xml') and not nome.endswith('_goldstandard.xml')
+
+# Lê apenas o <TEXT> de um XML (caminho ou arquivo aberto) com iterparse, parando assim que ele termina
+# Retorna None se o XML for inválido ou o texto estiver vazio
+def ler_texto_xml(arquivo):
+    try:
+        for _, elemento in ET.iterparse(arquivo, events=('end',)):
+            if elemento.tag == 'TEXT':
+                return elemento.text or None  # TAGS e RELATIONS nem chegam a ser lidos
+            elemento.clear()
+    except (ET.ParseError, OSError):
+        return None
+    return None
+
+# Percorre uma pasta sem montar a lista inteira, na ordem do sistema de arquivos
+# ordenar=True lista e ordena todos os nomes antes da primeira narrativa (memória e espera proporcionais à pasta)
+def _iterar_pasta(pasta, ordenar):
+    if ordenar:
+        nomes = sorted(entrada.name for entrada in os.scandir(pasta) if entrada.is_file() and eh_narrativa(entrada.name))
+        for nome in nomes:
+            caminho = os.path.join(pasta, nome)
+            yield nome, ler_texto_xml(caminho)
+        return
+    with os.scandir(pasta) as entradas:
+        for entrada in entradas:
+            if entrada.is_file() and eh_narrativa(entrada.name):
+                yield entrada.name, ler_texto_xml(entrada.path)
+
+# Nome de um membro de arquivo compactado: caminho relativo à raiz, com "/" (sem "./" ou "/" no início)
+def _nome_membro(caminho_membro):
+    return posixpath.normpath(caminho_membro.replace('\\', '/')).lstrip('/')
+
+# Percorre os membros de um .zip na ordem do arquivo, descompactando um de cada vez
+def _iterar_zip(caminho):
+    with zipfile.ZipFile(caminho) as arquivo_zip:
+        for info in arquivo_zip.infolist():
+            nome = _nome_membro(info.filename)
+            if info.is_dir() or not eh_narrativa(nome):
+                continue
+            with arquivo_zip.open(info) as membro:
+                yield nome, ler_texto_xml(membro)
+
+# Percorre um .tar em modo de fluxo ('r|*'): os membros são lidos em sequência, sem índice em memória
+def _iterar_tar(caminho):
+    with tarfile.open(caminho, mode='r|*') as arquivo_tar:
+        for membro in arquivo_tar:
+            nome = _nome_membro(membro.name)
+            if not membro.isfile() or not eh_narrativa(nome):
+                continue
+            conteudo = arquivo_tar.extractfile(membro)
+            if conteudo is not None:
+                with conteudo:
+                    yield nome, ler_texto_xml(conteudo)
+
+# Parte fixa de um padrão glob (componentes antes do primeiro curinga), usada como raiz dos nomes
+def _raiz_glob(padrao):
+    raiz = []
+    for componente in padrao.replace('\\', '/').split('/')[:-1]:
+        if glob.has_magic(componente):
+            break
+        raiz.append(componente)
+    return '/'.join(raiz) or '.'
+
+# Gera (nome da narrativa, texto) para cada narrativa da origem; o texto é None se o XML for inválido ou vazio
+# A ordem é a da origem (sistema de arquivos, arquivo compactado ou glob); a saída não depende dela, pois a saída
+# mestre é lida em ordem de nome. ordenar=True ordena pastas e globs, ao custo de listar tudo antes de começar
+def iterar_narrativas(origem, ordenar=False):
+    if isinstance(origem, (list, tuple)):
+        for item in origem:
+            yield from iterar_narrativas(item, ordenar)
+        return
+
+    origem = str(origem)
+    if os.path.isdir(origem):
+        yield from _iterar_pasta(origem, ordenar)
+    elif origem.endswith('.zip') and os.path.isfile(origem):
+        yield from _iterar_zip(origem)
+    elif origem.endswith(EXTENSOES_TAR) and os.path.isfile(origem):
+        yield from _iterar_tar(origem)
+    elif os.path.isfile(origem):
+        if eh_narrativa(os.path.basename(origem)):
+            yield os.path.basename(origem), ler_texto_xml(origem)
+    else:
+        # Padrão glob (ex.: "exportacao/**/*.xml"); iglob não monta a lista de arquivos (sorted monta)
+        raiz = _raiz_glob(origem)
+        caminhos = glob.iglob(origem, recursive=True)
+        for caminho in (sorted(caminhos) if ordenar else caminhos):
+            if os.path.isfile(caminho) and eh_narrativa(os.path.basename(caminho)):
+                yield os.path.relpath(caminho, raiz).replace(os.sep, '/'), ler_texto_xml(caminho)
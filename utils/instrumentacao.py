@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import time
+import contextlib
+
+# Instrumentação leve da execução: cada bloco enviado ao modelo (tokens do prompt, tokens gerados, tempo de avaliação
+# do prompt e de decodificação, corte em max_tokens), o tempo de cada etapa do pipeline e o uso dos caches,
+# gravados como linhas JSON. Desativada (padrão), cada chamada só confere uma variável global.
+# Os processos trabalhadores gravam no mesmo arquivo, com o mesmo identificador de execução.
+
+_metricas = None  # Estado da execução instrumentada: None enquanto desativada
+_SEM_MEDICAO = contextlib.nullcontext()
+
+# Ativa a instrumentação gravando em caminho (modo append); retorna a configuração para os trabalhadores
+def iniciar_metricas(caminho, execucao=None):
+    global _metricas
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    _metricas = {
+        "caminho": caminho,
+        "execucao": execucao or f"{time.strftime('%Y%m%d-%H%M%S')}-{os.urandom(3).hex()}",
+        "arquivo": open(caminho, 'a', encoding='utf-8'),
+        "narrativa": None,
+    }
+    if execucao is None:
+        registrar("inicio")
+    return configuracao_metricas()
+
+# Caminho e identificador da execução instrumentada (None se desativada), para repassar a outros processos
+def configuracao_metricas():
+    if _metricas is None:
+        return None
+    return {"caminho": _metricas["caminho"], "execucao": _metricas["execucao"]}
+
+def metricas_ativas():
+    return _metricas is not None
+
+# Grava um evento como uma linha JSON (uma única escrita por linha, então processos diferentes não se misturam)
+def registrar(tipo, **campos):
+    if _metricas is None:
+        return
+    evento = {"execucao": _metricas["execucao"], "tipo": tipo, "instante": round(time.time(), 3), "pid": os.getpid()}
+    if _metricas["narrativa"] is not None:
+        evento["narrativa"] = _metricas["narrativa"]
+    evento.update(campos)
+    _metricas["arquivo"].write(json.dumps(evento, ensure_ascii=False) + "\n")
+    _metricas["arquivo"].flush()
+
+# Narrativa em processamento: os eventos seguintes são atribuídos a ela
+def definir_narrativa(nome_narrativa):
+    if _metricas is not None:
+        _metricas["narrativa"] = nome_narrativa
+
+# Mede o tempo de uma etapa (with etapa("goldstandard"): ...); desativada, não mede nada
+def etapa(nome):
+    if _metricas is None:
+        return _SEM_MEDICAO
+    return _medir_etapa(nome)
+
+@contextlib.contextmanager
+def _medir_etapa(nome):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar("etapa", etapa=nome, segundos=round(time.perf_counter() - inicio, 6))
+
+# Registra um bloco enviado ao modelo (origem "cache_completions" quando a resposta veio do cache)
+def registrar_bloco(tokens_prompt=None, tokens_gerados=None, segundos=None, segundos_prompt=None,
+                    segundos_decodificacao=None, cortada=False, origem="modelo", **extras):
+    if _metricas is None:
+        return
+    tempo_geracao = segundos_decodificacao if segundos_decodificacao is not None else segundos
+    registrar(
+        "bloco", origem=origem, tokens_prompt=tokens_prompt, tokens_gerados=tokens_gerados, segundos=segundos,
+        segundos_prompt=segundos_prompt, segundos_decodificacao=segundos_decodificacao, cortada=cortada,
+        tokens_por_segundo=round(tokens_gerados / tempo_geracao, 2) if tokens_gerados and tempo_geracao else None,
+        **extras
+    )
+
+# Registra os contadores de um cache (acertos, falhas, taxa de acerto...)
+def registrar_cache(nome, estatisticas):
+    registrar("cache", cache=nome, **estatisticas)
+
+# Totais dos blocos de uma origem (modelo, cache_completions, lote)
+def _novo_total_blocos():
+    return {
+        "blocos": 0, "tokens_prompt": 0, "tokens_gerados": 0, "segundos": 0.0, "segundos_prompt": 0.0,
+        "segundos_decodificacao": 0.0, "segundos_lote": 0.0, "cortados": 0,
+    }
+
+# Resume os eventos de uma execução (a última do arquivo, se execucao não for informada)
+def resumir_metricas(caminho, execucao=None):
+    eventos = []
+    with open(caminho, 'r', encoding='utf-8') as f:
+        for linha in f:
+            try:
+                eventos.append(json.loads(linha))
+            except json.JSONDecodeError:
+                continue  # Linha incompleta (processo interrompido no meio da escrita)
+    if execucao is None and eventos:
+        execucao = eventos[-1]["execucao"]
+    eventos = [e for e in eventos if e["execucao"] == execucao]
+
+    blocos = {}  # origem -> totais
+    etapas = {}  # etapa -> totais
+    caches = {}  # cache -> último registro
+    narrativas = set()
+    for evento in eventos:
+        if evento.get("narrativa") is not None:
+            narrativas.add(evento["narrativa"])
+        if evento["tipo"] == "bloco":
+            total = blocos.setdefault(evento["origem"], _novo_total_blocos())
+            total["blocos"] += 1
+            total["cortados"] += bool(evento.get("cortada"))
+            for campo in ("tokens_prompt", "tokens_gerados", "segundos", "segundos_prompt", "segundos_decodificacao"):
+                total[campo] += evento.get(campo) or 0
+        elif evento["tipo"] == "lote":
+            blocos.setdefault("lote", _novo_total_blocos())["segundos_lote"] += evento["tempo"]
+        elif evento["tipo"] == "etapa":
+            total = etapas.setdefault(evento["etapa"], {"chamadas": 0, "segundos": 0.0})
+            total["chamadas"] += 1
+            total["segundos"] += evento["segundos"]
+        elif evento["tipo"] == "cache":
+            caches[evento["cache"]] = {k: v for k, v in evento.items() if k not in ("execucao", "tipo", "instante", "pid", "cache", "narrativa")}
+
+    for total in blocos.values():
+        # Na decodificação em lote as sequências dividem o mesmo tempo: vale o tempo total de cada lote
+        total["segundos_geracao"] = total["segundos_decodificacao"] or total["segundos_lote"] or total["segundos"]
+        total["tokens_por_segundo"] = total["tokens_gerados"] / total["segundos_geracao"] if total["segundos_geracao"] else 0.0
+    return {"execucao": execucao, "narrativas": len(narrativas), "blocos": blocos, "etapas": etapas, "caches": caches}
+
+# Exibe o resumo de uma execução em tabelas no terminal
+def imprimir_resumo(resumo):
+    print(f"\n📈 Métricas da execução {resumo['execucao']} ({resumo['narrativas']} narrativas)")
+    if resumo["blocos"]:
+        print("+-------------------+--------+------------+------------+------------+------------+----------+----------+")
+        print("| Origem            | Blocos | Tok.prompt | Tok.gerad. | Prompt (s) | Decod. (s) | Tokens/s | Cortados |")
+        print("+-------------------+--------+------------+------------+------------+------------+----------+----------+")
+        for origem, t in resumo["blocos"].items():
+            print(f"| {origem:<17} | {t['blocos']:6} | {t['tokens_prompt']:10} | {t['tokens_gerados']:10} | "
+                  f"{t['segundos_prompt']:10.2f} | {t['segundos_geracao']:10.2f} | {t['tokens_por_segundo']:8.1f} | {t['cortados']:8} |")
+        print("+-------------------+--------+------------+------------+------------+------------+----------+----------+")
+    if resumo["etapas"]:
+        print("+-------------------+----------+-------------+")
+        print("| Etapa             | Chamadas | Tempo (s)   |")
+        print("+-------------------+----------+-------------+")
+        for nome, t in resumo["etapas"].items():
+            print(f"| {nome:<17} | {t['chamadas']:8} | {t['segundos']:11.2f} |")
+        print("+-------------------+----------+-------------+")
+    for nome, estatisticas in resumo["caches"].items():
+        taxa = estatisticas.get("taxa_acerto")
+        detalhe = f"taxa de acerto {taxa:.1%}" if taxa is not None else ", ".join(f"{k}: {v}" for k, v in estatisticas.items())
+        print(f"💾 {nome}: {detalhe}")
+
+# Encerra a instrumentação, exibe o resumo da execução e o retorna (None se estava desativada)
+def encerrar_metricas():
+    global _metricas
+    if _metricas is None:
+        return None
+    registrar("fim")
+    _metricas["arquivo"].close()
+    caminho, execucao = _metricas["caminho"], _metricas["execucao"]
+    _metricas = None
+    resumo = resumir_metricas(caminho, execucao)
+    imprimir_resumo(resumo)
+    print(f"\n📝 Métricas gravadas em {caminho}")
+    return resumo
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python -m utils.instrumentacao <metricas.jsonl> [execucao]")
+        sys.exit(1)
+    imprimir_resumo(resumir_metricas(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+
+TAMANHO_AMOSTRA_MODELO = 1024 * 1024  # Bytes lidos do início e do fim do arquivo do modelo
+
+# Calcula o hash SHA-256 de um texto
+def hash_texto(texto):
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+# Impressão digital do arquivo do modelo: tamanho, data de modificação e amostras do início e do fim
+# (ler o GGUF inteiro a cada execução custaria mais que a própria verificação)
+def hash_modelo(caminho_modelo):
+    sha = hashlib.sha256(os.path.abspath(caminho_modelo).encode('utf-8'))
+    try:
+        info = os.stat(caminho_modelo)
+        sha.update(f"{info.st_size}|{info.st_mtime_ns}".encode('utf-8'))
+        with open(caminho_modelo, 'rb') as f:
+            sha.update(f.read(TAMANHO_AMOSTRA_MODELO))
+            if info.st_size > TAMANHO_AMOSTRA_MODELO:
+                f.seek(-TAMANHO_AMOSTRA_MODELO, os.SEEK_END)
+                sha.update(f.read(TAMANHO_AMOSTRA_MODELO))
+    except OSError:
+        pass  # Sem acesso ao arquivo, a chave depende apenas do caminho
+    return sha.hexdigest()
+
+# Chave da execução: tudo que, se mudar, invalida as saídas de todas as narrativas
+def chave_execucao(prompt_template, caminho_modelo, parametros):
+    conteudo = json.dumps({
+        "prompt": hash_texto(prompt_template),
+        "modelo": hash_modelo(caminho_modelo),
+        "parametros": parametros,
+    }, sort_keys=True)
+    return hash_texto(conteudo)
+
+# Chave de uma narrativa: hash do texto combinado com a chave da execução
+def chave_narrativa(texto, chave_exec):
+    return chave_narrativa_hash(hash_texto(texto), chave_exec)
+
+# Mesma chave, a partir do hash do texto já calculado (ex.: o gravado junto com as respostas)
+def chave_narrativa_hash(hash_do_texto, chave_exec):
+    return hash_texto(f"{chave_exec}|{hash_do_texto}")
+
+# Carrega o manifesto (ou cria um vazio): um registro JSON por linha, e o último registro de cada narrativa vale
+# Também lê o formato antigo (um único objeto JSON), que é convertido na próxima gravação
+def carregar_manifesto(caminho):
+    manifesto = {"narrativas": {}, "registros": 0, "reescrever": False}
+    if not caminho or not os.path.exists(caminho):
+        return manifesto
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            conteudo = f.read()
+    except OSError as e:
+        print(f"\n⚠️ Manifesto inválido em {caminho}: {e}. Iniciando um novo.")
+        return manifesto
+
+    try:
+        antigo = json.loads(conteudo)
+    except ValueError:
+        antigo = None
+    if isinstance(antigo, dict) and isinstance(antigo.get('narrativas'), dict):
+        manifesto["narrativas"] = antigo["narrativas"]
+        manifesto["reescrever"] = True
+        return manifesto
+
+    for linha in conteudo.splitlines():
+        try:
+            registro = json.loads(linha)
+            nome_narrativa = registro.pop("nome")
+        except (ValueError, KeyError, AttributeError):
+            continue  # Linha incompleta (execução interrompida no meio da escrita)
+        manifesto["narrativas"][nome_narrativa] = registro
+        manifesto["registros"] += 1
+    # Muitas narrativas registradas mais de uma vez: compacta na próxima gravação
+    manifesto["reescrever"] = manifesto["registros"] > 2 * len(manifesto["narrativas"]) + 1000
+    return manifesto
+
+# Linha do manifesto de uma narrativa
+def _registro(nome_narrativa, entrada):
+    return json.dumps({"nome": nome_narrativa, **entrada}, ensure_ascii=False) + "\n"
+
+# Reescreve o manifesto compactado, com um registro por narrativa, de forma atômica (arquivo temporário + rename)
+def salvar_manifesto(manifesto, caminho):
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    caminho_temp = f"{caminho}.{os.getpid()}.tmp"
+    with open(caminho_temp, 'w', encoding='utf-8') as f:
+        f.writelines(_registro(nome, entrada) for nome, entrada in manifesto["narrativas"].items())
+    os.replace(caminho_temp, caminho)
+    manifesto["registros"] = len(manifesto["narrativas"])
+    manifesto["reescrever"] = False
+
+# Retorna a entrada do manifesto se a narrativa já foi concluída com a mesma chave
+def narrativa_concluida(manifesto, nome_narrativa, chave):
+    entrada = manifesto["narrativas"].get(nome_narrativa)
+    if not entrada or entrada.get("chave") != chave:
+        return None
+    # Registros antigos sem CSV e sem contagem de entidades podem ser falhas da extração: reprocessa
+    if not entrada.get("csv") and "entidades" not in entrada:
+        return None
+    # Se o CSV individual foi apagado, a narrativa precisa ser reprocessada
+    if entrada.get("csv") and not os.path.exists(entrada["csv"]):
+        return None
+    return entrada
+
+# Registra uma narrativa concluída acrescentando uma linha ao manifesto (permite retomar após falhas)
+# Só o registro novo é escrito, então o custo não cresce com o número de narrativas já concluídas
+# saida_colunar: pasta da saída colunar com as entidades da narrativa (em vez de um CSV individual)
+def registrar_narrativa(manifesto, caminho, nome_narrativa, chave, caminho_csv, entidades=0, saida_colunar=None):
+    manifesto["narrativas"][nome_narrativa] = {"chave": chave, "csv": caminho_csv, "entidades": entidades}
+    if saida_colunar:
+        manifesto["narrativas"][nome_narrativa]["saida_colunar"] = saida_colunar
+    if manifesto["reescrever"]:
+        salvar_manifesto(manifesto, caminho)
+        return
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    with open(caminho, 'a', encoding='utf-8') as f:
+        f.write(_registro(nome_narrativa, manifesto["narrativas"][nome_narrativa]))
+    manifesto["registros"] += 1
@@ -1,35 +1,166 @@
-from utils.processador_llama import PesquisaClin_Llama
+import re
 
-def prompt_avmap(codigo, termo, llm):
-    """
-    Verifica se um código SNOMED CT corresponde a um termo clínico.
-    Retorna:
-        0 - Código não encontrado
-        1 - Código existe mas não corresponde
-        2 - Código existe e corresponde
-    """
-    prompt = f"""
+from utils.processador_llama import classificar_token_unico, classificar_em_sequencia
+from utils.indice_snomed import buscar_conceito, descricoes_conceito, normalizar_busca
+
+OPCOES_AVMAP = ("0", "1", "2")  # Vereditos possíveis, cada um gerado como um único token
+TAMANHO_LOTE_AVMAP = 8  # Pares (SCTID, termo) avaliados por chamada em classificar_avmap_lote
+LIMITE_DESCRICOES_PROMPT = 6  # Descrições do índice SNOMED repassadas ao modelo por par
+
+# Instruções comuns aos prompts de verificação
+INSTRUCOES_AVMAP = """
 Dado um termo clínico em português e um código SNOMED CT (SCTID), determine a validade do código em relação ao termo.
 
 Responda apenas com um dos seguintes números:
 0 – O código SNOMED CT fornecido NÃO existe (nenhum resultado retornado);
 1 – O código existe, mas NÃO corresponde ao termo fornecido;
 2 – O código existe E corresponde corretamente ao termo fornecido.
+"""
+
+# Endereço do conceito no navegador SNOMED CT, para os pares sem descrições do índice local
+URL_TERMBROWSER = (
+    "https://termbrowser.nhs.uk/?perspective=full&conceptId1={codigo}&edition=uk-edition&release=v20250604"
+    "&server=https://termbrowser.nhs.uk/sct-browser-api/snomed&langRefset=999001261000000100,999000691000001104"
+)
+
+# Monta o prompt de verificação de um único par (SCTID, termo)
+# Com as descrições do índice local, o modelo só compara o termo com elas (sem depender do navegador)
+def montar_prompt_avmap(codigo, termo, descricoes=None):
+    if descricoes:
+        return INSTRUCOES_AVMAP + f"""
+### Dados fornecidos:
+Código SNOMED CT: {codigo}
+Termo em português: {termo}
+Descrições oficiais do conceito: {"; ".join(descricoes[:LIMITE_DESCRICOES_PROMPT])}
+
+### Instruções:
+- O código existe; compare o termo fornecido com as descrições oficiais do conceito.
+- A comparação deve considerar correspondência clínica ou semântica (tradução precisa e direta).
+- Responda somente com o número correspondente: 1 ou 2. Nenhuma explicação adicional.
 
+Resposta:"""
+    return INSTRUCOES_AVMAP + f"""
 ### Dados fornecidos:
 Código SNOMED CT: {codigo}
 Termo em português: {termo}
 
 ### Instruções:
 - Acesse o navegador SNOMED CT pelo seguinte link:
-https://termbrowser.nhs.uk/?perspective=full&conceptId1={codigo}&edition=uk-edition&release=v20250604&server=https://termbrowser.nhs.uk/sct-browser-api/snomed&langRefset=999001261000000100,999000691000001104
+{URL_TERMBROWSER.format(codigo=codigo)}
 - Verifique se o código retorna algum conceito (caso contrário, é 0).
 - Caso retorne um conceito, traduza o termo principal para o português e compare com o termo fornecido.
 - A comparação deve considerar correspondência clínica ou semântica (tradução precisa e direta).
 - Responda somente com o número correspondente: 0, 1 ou 2. Nenhuma explicação adicional.
-"""
-    resposta = PesquisaClin_Llama(prompt, llm)
-    for char in resposta:
-        if char in "012":
-            return int(char)
-    return 0
+
+Resposta:"""
+
+# Descreve um par do lote: com as descrições oficiais quando vierem do índice local, senão com o link do navegador
+def _linha_par_lote(numero, codigo, termo, descricoes):
+    linha = f"{numero}. Código SNOMED CT: {codigo} | Termo em português: {termo}"
+    if descricoes:
+        linha += f" | Descrições oficiais: {'; '.join(descricoes[:LIMITE_DESCRICOES_PROMPT])}"
+    else:
+        linha += f" | Navegador SNOMED CT: {URL_TERMBROWSER.format(codigo=codigo)}"
+    return linha
+
+# Monta o prompt de verificação de vários pares; as respostas vêm numeradas, uma por linha
+def montar_prompt_avmap_lote(pares, descricoes=None):
+    descricoes = descricoes or [None] * len(pares)
+    linhas = "\n".join(
+        _linha_par_lote(i + 1, codigo, termo, desc) for i, ((codigo, termo), desc) in enumerate(zip(pares, descricoes))
+    )
+    return INSTRUCOES_AVMAP + f"""
+### Pares fornecidos:
+{linhas}
+
+### Instruções:
+- Pares com descrições oficiais: o código existe; compare o termo fornecido com as descrições oficiais do conceito.
+- Pares com link do navegador: acesse o navegador SNOMED CT pelo link do par e verifique se o código retorna algum conceito (caso contrário, é 0). Caso retorne um conceito, traduza o termo principal para o português e compare com o termo fornecido.
+- A comparação deve considerar correspondência clínica ou semântica (tradução precisa e direta).
+- Responda uma linha por par, no formato "número do par: veredito", somente com o número 0, 1 ou 2. Nenhuma explicação adicional.
+
+Respostas:"""
+
+def classificar_avmap(codigo, termo, llm, descricoes=None):
+    """
+    Classifica o par (SCTID, termo) avaliando o prompt uma única vez e comparando
+    apenas os logits dos tokens "0", "1" e "2" (resultado determinístico).
+    Não passa pelo cache de completions (não há texto gerado); os vereditos ficam em verificacao_snomed.
+    Retorna (veredito, probabilidade do veredito entre as três opções).
+    """
+    opcao, probabilidade = classificar_token_unico(montar_prompt_avmap(codigo, termo, descricoes), llm, OPCOES_AVMAP)
+    return int(opcao), probabilidade
+
+def classificar_avmap_lote(pares, llm, tamanho_lote=TAMANHO_LOTE_AVMAP, descricoes=None):
+    """
+    Classifica vários pares (SCTID, termo), avaliando um prompt por lote.
+    Retorna uma lista de (veredito, probabilidade) na mesma ordem dos pares.
+    """
+    descricoes = descricoes or [None] * len(pares)
+    resultados = []
+    for inicio in range(0, len(pares), tamanho_lote):
+        lote = pares[inicio:inicio + tamanho_lote]
+        rotulos = [f"\n{i + 1}:" for i in range(len(lote))]
+        prompt = montar_prompt_avmap_lote(lote, descricoes[inicio:inicio + tamanho_lote])
+        for opcao, probabilidade in classificar_em_sequencia(prompt, rotulos, llm, OPCOES_AVMAP):
+            resultados.append((int(opcao), probabilidade))
+    return resultados
+
+# Variações do termo para busca exata: "Termo (Abreviação)" -> termo completo, termo e abreviação
+def variantes_termo(termo):
+    variantes = {normalizar_busca(termo)}
+    partes = re.match(r'^(.*?)\s*\((.*)\)\s*$', termo)
+    if partes:
+        variantes.update(normalizar_busca(parte) for parte in partes.groups())
+    variantes.discard('')
+    return variantes
+
+def verificar_pares_snomed(pares, llm, indice=None, tamanho_lote=TAMANHO_LOTE_AVMAP, carregar_modelo=None):
+    """
+    Verifica pares (SCTID, termo) consultando primeiro o índice SNOMED CT local:
+    código ausente do release -> 0, conceito inativo (aposentado) -> 1 e termo idêntico a uma descrição -> 2,
+    sem chamar o modelo.
+    Os demais vão ao modelo junto com as descrições reais do conceito; sem modelo (llm=None, reprodução
+    de respostas gravadas), ficam sem veredito (None, None). Com llm=None e carregar_modelo, o modelo só é
+    carregado se algum par realmente precisar dele.
+    Retorna (lista de (veredito, probabilidade) na ordem dos pares, quantidade resolvida pelo índice).
+    Os vereditos do índice local têm probabilidade 1.0.
+    """
+    resultados = [None] * len(pares)
+    indices_modelo, descricoes_modelo = [], []
+    for i, (codigo, termo) in enumerate(pares):
+        conceito = buscar_conceito(indice, codigo) if indice is not None else None
+        if indice is not None and conceito is None:
+            resultados[i] = (0, 1.0)
+            continue
+        if conceito is not None and not conceito["ativo"]:
+            resultados[i] = (1, 1.0)  # Código existe, mas o conceito foi inativado: não é um mapeamento válido
+            continue
+        descricoes = descricoes_conceito(conceito) if conceito else None
+        if descricoes and variantes_termo(termo) & {normalizar_busca(d) for d in descricoes}:
+            resultados[i] = (2, 1.0)
+            continue
+        indices_modelo.append(i)
+        descricoes_modelo.append(descricoes)
+
+    if indices_modelo and llm is None and carregar_modelo is not None:
+        llm = carregar_modelo()
+    if llm is None:
+        classificacoes = [(None, None)] * len(indices_modelo)
+    else:
+        classificacoes = classificar_avmap_lote(
+            [pares[i] for i in indices_modelo], llm, tamanho_lote, descricoes=descricoes_modelo
+        )
+    for i, classificacao in zip(indices_modelo, classificacoes):
+        resultados[i] = classificacao
+    return resultados, len(pares) - len(indices_modelo)
+
+def prompt_avmap(codigo, termo, llm, descricoes=None):
+    """
+    Verifica se um código SNOMED CT corresponde a um termo clínico.
+    Retorna (veredito, probabilidade do veredito entre as três opções), com o veredito:
+        0 - Código não encontrado
+        1 - Código existe mas não corresponde
+        2 - Código existe e corresponde
+    """
+    return classificar_avmap(codigo, termo, llm, descricoes)
@@ -1,7 +1,26 @@
 import pandas as pd
 import re
 import os
-from typing import Optional, List
+from typing import Optional, List, Dict
+
+# Regex que extrai os 4 campos de uma tupla [Termo | Abreviação | Categoria | SCTID]
+REGEX_TUPLA = re.compile(r'\[\s*(.*?)\s*\|\s*(.*?)\s*\|\s*(.*?)\s*\|\s*(.*?)\s*\]')
+
+# Cabeçalhos das duas listas de tuplas da resposta do modelo
+CABECALHOS_LISTAS = ("Sinais ou Sintomas:", "Doenças ou Síndromes:")
+REPETICOES_DEGENERADAS = 3  # Mesma tupla repetida esse número de vezes indica saída em laço
+PERIODO_MAXIMO_LACO = 256  # Maior trecho (em caracteres) procurado como repetição no fim da saída
+INTERVALO_VERIFICACAO_LACO = 64  # Caracteres novos entre duas verificações de repetição
+
+# Função que converte os campos de uma tupla no registro usado nos CSVs (None para none/NotFound)
+def entidade_da_tupla(campos) -> Dict[str, Optional[str]]:
+    texto_analisado, abreviacao, categoria, sctid = (campo.strip() for campo in campos)
+    return {
+        "categoria": categoria,
+        "textoAnalisado": texto_analisado,
+        "abreviacao": abreviacao if abreviacao.lower() != 'none' else None,
+        "SCTID": sctid if sctid.lower() != 'notfound' else None
+    }
 
 # Função que encontra a linha final da última anotação do tipo [...] no texto
 def encontrar_linha_final_anotacao(lines: List[str]) -> int:
@@ -14,10 +33,11 @@ def encontrar_linha_final_anotacao(lines: List[str]) -> int:
             break
     return last_index
 
-# Função principal que cria DataFrame a partir de texto estruturado e exporta para CSV
-def criar_dataframe_e_exportar_csv(input_text: str, csv_filename: str, narrative_name: str) -> Optional[pd.DataFrame]:
+# Função que cria o DataFrame a partir da resposta do modelo, sem gravar arquivos
+def criar_dataframe(input_text: str, narrative_name: str, modo_saida: str = "completo") -> Optional[pd.DataFrame]:
     
-    # Analisa um texto com narrativa + listas de tuplas, extrai informações e salva em CSV.
+    # Analisa um texto com narrativa + listas de tuplas e extrai informações.
+    # No modo "compacto" a resposta contém apenas as listas de tuplas (sem narrativa anotada).
     # Verifica se o texto de entrada está vazio
     if not input_text or not input_text.strip():
         print("\nErro: O texto de entrada está vazio ou contém apenas espaços.")
@@ -28,9 +48,12 @@ def criar_dataframe_e_exportar_csv(input_text: str, csv_filename: str, narrative
         linhas = input_text.strip().split('\n')  # Divide o texto em linhas
         texto_narrativa = ""
         linhas_listas_raw = []
-        indice_fim_narrativa = encontrar_linha_final_anotacao(linhas)  # Pega índice do fim da narrativa
+        indice_fim_narrativa = encontrar_linha_final_anotacao(linhas) if modo_saida != "compacto" else -1  # Pega índice do fim da narrativa
 
-        if indice_fim_narrativa != -1:
+        if modo_saida == "compacto":
+            # Modo compacto: todas as linhas são listas de tuplas
+            linhas_listas_raw = linhas
+        elif indice_fim_narrativa != -1:
             # Se encontrou anotação, separa narrativa das listas
             texto_narrativa = "\n".join(linhas[:indice_fim_narrativa + 1]).strip()
             linhas_listas_raw = linhas[indice_fim_narrativa + 1:]
@@ -50,7 +73,7 @@ def criar_dataframe_e_exportar_csv(input_text: str, csv_filename: str, narrative
 
     # 2. Processar linhas que contêm listas de tuplas
     dados_extraidos = []
-    regex_tupla_interna_4 = re.compile(r'\[\s*(.*?)\s*\|\s*(.*?)\s*\|\s*(.*?)\s*\|\s*(.*?)\s*\]')  # Regex para extrair 4 campos
+    regex_tupla_interna_4 = REGEX_TUPLA  # Regex para extrair 4 campos
 
     for linha_lista in linhas_listas_raw:
         linha_strip = linha_lista.strip()
@@ -61,13 +84,7 @@ def criar_dataframe_e_exportar_csv(input_text: str, csv_filename: str, narrative
 
         for match_tuple in matches_internos:
             try:
-                if len(match_tuple) == 4:
-                    # Extrai cada campo da tupla
-                    texto_analisado = match_tuple[0].strip()
-                    abreviacao = match_tuple[1].strip()
-                    categoria = match_tuple[2].strip()
-                    sctid = match_tuple[3].strip()
-                else:
+                if len(match_tuple) != 4:
                     # Caso inesperado, ignora a tupla
                     print(f"\nAviso: Ignorando item com número incorreto de campos: '{match_tuple}'")
                     continue
@@ -76,10 +93,7 @@ def criar_dataframe_e_exportar_csv(input_text: str, csv_filename: str, narrative
                 dados_extraidos.append({
                     "nomeNarrativa": narrative_name,
                     "textoPrompt": texto_narrativa,
-                    "categoria": categoria,
-                    "textoAnalisado": texto_analisado,
-                    "abreviacao": abreviacao if abreviacao.lower() != 'none' else None,
-                    "SCTID": sctid if sctid.lower() != 'notfound' else None
+                    **entidade_da_tupla(match_tuple)
                 })
             except IndexError as e:
                 print(f"\nErro de índice ao processar item da tupla: '{match_tuple}'. Erro: {e}")
@@ -97,6 +111,13 @@ def criar_dataframe_e_exportar_csv(input_text: str, csv_filename: str, narrative
     except Exception as e:
         print(f"\nErro ao criar o DataFrame para '{narrative_name}': {e}")
         return None
+    return df
+
+# Função principal que cria DataFrame a partir de texto estruturado e exporta para CSV
+def criar_dataframe_e_exportar_csv(input_text: str, csv_filename: str, narrative_name: str, modo_saida: str = "completo") -> Optional[pd.DataFrame]:
+    df = criar_dataframe(input_text, narrative_name, modo_saida)
+    if df is None:
+        return None
 
     # 4. Exportar DataFrame para CSV
     try:
@@ -109,3 +130,95 @@ def criar_dataframe_e_exportar_csv(input_text: str, csv_filename: str, narrative
     except Exception as e:
         print(f"\nErro ao exportar o DataFrame para CSV '{csv_filename}': {e}")
         return None
+
+# Indica se a resposta traz as duas listas fechadas (mesmo vazias): sem entidades, distingue uma narrativa sem achados
+# de uma saída cortada ou fora do formato
+def listas_concluidas(resposta: str) -> bool:
+    leitor = LeitorTuplas()
+    leitor.alimentar(resposta + "\n")
+    return leitor.concluido()
+
+# Leitor incremental da resposta do modelo: recebe o texto em pedaços (streaming) e devolve cada tupla
+# das listas assim que ela fecha. Também indica quando as duas listas terminaram e quando a saída entrou em laço.
+class LeitorTuplas:
+
+    def __init__(self):
+        self.texto = ""
+        self.linha_atual = ""
+        self.tupla_atual = None  # Texto da tupla aberta ([ ainda sem ])
+        self.secao = None  # Cabeçalho da lista em que o leitor está
+        self.lista_aberta = False
+        self.listas_concluidas = set()
+        self.contagem_tuplas = {}
+        self.tupla_repetida = False
+        self.ultima_verificacao_laco = 0
+
+    # Processa um pedaço de texto e retorna as entidades das tuplas que fecharam nele
+    def alimentar(self, pedaco):
+        entidades = []
+        self.texto += pedaco
+        for caractere in pedaco:
+            if self.tupla_atual is not None:
+                self.tupla_atual += caractere
+                if caractere == ']':
+                    entidade = self._fechar_tupla()
+                    if entidade is not None:
+                        entidades.append(entidade)
+                elif caractere == '\n':
+                    self.tupla_atual = None  # Tupla quebrada em duas linhas: descarta
+                continue
+
+            if caractere == '\n':
+                self.linha_atual = ""
+                if self.lista_aberta:
+                    # Lista sem ")" final (como no exemplo do prompt): a quebra de linha também a encerra
+                    self.listas_concluidas.add(self.secao)
+                    self.secao, self.lista_aberta = None, False
+                continue
+            self.linha_atual += caractere
+
+            if caractere == '[':
+                self.tupla_atual = '['
+            elif self.secao is None:
+                for cabecalho in CABECALHOS_LISTAS:
+                    if self.linha_atual.endswith(cabecalho):
+                        self.secao, self.lista_aberta = cabecalho, False
+            elif not self.lista_aberta and caractere == '(':
+                self.lista_aberta = True
+            elif self.lista_aberta and caractere == ')':
+                self.listas_concluidas.add(self.secao)
+                self.secao, self.lista_aberta = None, False
+        return entidades
+
+    # Converte a tupla que acabou de fechar; anotações fora das listas (ex.: [Texto analisado: ...]) são ignoradas
+    def _fechar_tupla(self):
+        tupla, self.tupla_atual = self.tupla_atual, None
+        if not self.lista_aberta:
+            return None
+        encontrada = REGEX_TUPLA.fullmatch(tupla)
+        if encontrada is None:
+            return None
+        chave = tuple(campo.strip().lower() for campo in encontrada.groups())
+        self.contagem_tuplas[chave] = self.contagem_tuplas.get(chave, 0) + 1
+        if self.contagem_tuplas[chave] >= REPETICOES_DEGENERADAS:
+            self.tupla_repetida = True
+        return entidade_da_tupla(encontrada.groups())
+
+    # As duas listas (sinais/sintomas e doenças/síndromes) foram fechadas
+    def concluido(self):
+        return all(cabecalho in self.listas_concluidas for cabecalho in CABECALHOS_LISTAS)
+
+    # A saída entrou em laço: a mesma tupla várias vezes ou o fim do texto repetindo o mesmo trecho
+    def degenerado(self):
+        if self.tupla_repetida:
+            return True
+        if len(self.texto) - self.ultima_verificacao_laco < INTERVALO_VERIFICACAO_LACO:
+            return False
+        self.ultima_verificacao_laco = len(self.texto)
+        for periodo in range(8, PERIODO_MAXIMO_LACO + 1):
+            if len(self.texto) < periodo * REPETICOES_DEGENERADAS:
+                break
+            trecho = self.texto[-periodo:]
+            if trecho.strip() and self.texto.endswith(trecho * REPETICOES_DEGENERADAS):
+                return True
+        return False
@@ -1,9 +1,9 @@
-import openpyxl
 import os
 import json
 
 # Função para carregar uma planilha Excel e retornar o workbook e a sheet desejada
 def carregar_excel(caminho, sheet='Resultados'):
+    import openpyxl  # Importado só aqui: quem usa apenas o dicionário JSON não paga pelo openpyxl
     wb = openpyxl.load_workbook(caminho)  # Abre o arquivo Excel
     ws = wb[sheet]  # Seleciona a aba desejada
     return wb, ws  # Retorna o workbook e a aba
@@ -1,60 +1,388 @@
-from comando_llama.prompt import PROMPT_TEMPLATE 
+import re
+import time
+import numpy as np
+from comando_llama.prompt import MODOS_SAIDA
+from comando_llama.gramatica import GRAMATICAS_SAIDA
+from .cache_prefixo import restaurar_prefixo, separar_template, tokens_em_comum
+from .cache_completions import buscar_completion, salvar_completion
+from .processador_csv import LeitorTuplas
+from .instrumentacao import metricas_ativas, registrar_bloco
+
+_gramaticas = {}  # Gramáticas GBNF já compiladas, por modo de saída
+
+PREFIXO_ERRO_BLOCO = "Erro na chamada LLaMA: "  # Resposta de um bloco cuja chamada ao modelo falhou
+
+MARGEM_FRONTEIRA = 16  # Folga em tokens para junções entre segmentos tokenizados separadamente
+
+# Quebra após pontuação final seguida de espaço ou após cada quebra de linha
+REGEX_FRONTEIRA = re.compile(r'(?<=[.!?;])(?=\s)|(?<=\n)')
+
+# Divide o texto em sentenças/linhas preservando todos os caracteres originais
+def segmentar_sentencas(texto):
+    return [segmento for segmento in REGEX_FRONTEIRA.split(texto) if segmento]
+
+# Corta um segmento maior que o orçamento em pedaços de tokens (último recurso)
+def cortar_segmento_longo(tokens_segmento, llm, orcamento):
+    pedacos = []
+    for inicio in range(0, len(tokens_segmento), orcamento):
+        pedaco_tokens = tokens_segmento[inicio:inicio + orcamento]
+        pedaco_texto = llm.detokenize(pedaco_tokens).decode('utf-8', errors='ignore')
+        pedacos.append((pedaco_texto, len(pedaco_tokens)))
+    return pedacos
+
+# Confere o prompt final de um bloco e, no caso raro de estouro, divide o bloco ao meio
+# Um segmento sozinho que ainda estoura (junção de tokens diferente da tokenização separada) é cortado ao meio por tokens
+def validar_bloco(segmentos_bloco, llm, prompt_template, max_tokens_saida, n_ctx):
+    bloco_texto = "".join(texto for texto, _ in segmentos_bloco)
+    prompt = prompt_template.format(textoClinico=bloco_texto)
+    if len(llm.tokenize(prompt.encode())) + max_tokens_saida <= n_ctx:
+        return [bloco_texto]
+    if len(segmentos_bloco) == 1:
+        tokens_segmento = llm.tokenize(bloco_texto.encode(), add_bos=False)
+        if len(tokens_segmento) <= 1:
+            return [bloco_texto]  # Não há como dividir mais
+        metades = cortar_segmento_longo(tokens_segmento, llm, (len(tokens_segmento) + 1) // 2)
+        return [bloco for metade in metades
+                for bloco in validar_bloco([metade], llm, prompt_template, max_tokens_saida, n_ctx)]
+    meio = len(segmentos_bloco) // 2
+    return (validar_bloco(segmentos_bloco[:meio], llm, prompt_template, max_tokens_saida, n_ctx)
+            + validar_bloco(segmentos_bloco[meio:], llm, prompt_template, max_tokens_saida, n_ctx))
 
 # Função que divide um texto em blocos que cabem na janela de contexto do modelo
-def dividir_texto_por_prompt_seguro(texto, llm, prompt_template, max_tokens_saida=256):
+def dividir_texto_por_prompt_seguro(texto, llm, prompt_template, max_tokens_saida=256, sobreposicao=0):
     
     # Divide o texto em blocos que, combinados com o prompt, cabem na janela de contexto do modelo.
+    # O template é tokenizado uma única vez e cada sentença também, então o custo é linear no tamanho do texto.
     n_ctx = llm.n_ctx()  # Obtém tamanho da janela de contexto do modelo
-    tokens = llm.tokenize(texto.encode())  # Converte o texto em tokens
-    blocos = []
-    inicio = 0
-
-    while inicio < len(tokens):
-        fim = len(tokens)
-        while fim > inicio:
-            # Tenta criar um bloco que caiba na janela de contexto
-            bloco_tokens = tokens[inicio:fim]
-            bloco_texto = llm.detokenize(bloco_tokens).decode('utf-8', errors='ignore')
-            prompt = prompt_template.format(textoClinico=bloco_texto)
-            total_tokens = len(llm.tokenize(prompt.encode())) + max_tokens_saida
-            if total_tokens <= n_ctx:
-                blocos.append(bloco_texto)  # Adiciona bloco válido
-                inicio = fim
-                break
-            fim -= 50  # Reduz tamanho gradualmente até caber
+    prefixo, sufixo = separar_template(prompt_template)
+    tokens_fixos = len(llm.tokenize(prefixo.encode())) + len(llm.tokenize(sufixo.encode(), add_bos=False))
+    orcamento = n_ctx - max_tokens_saida - tokens_fixos - MARGEM_FRONTEIRA  # Tokens disponíveis para o texto
+
+    if orcamento <= 0:
+        raise ValueError(
+            f"O prompt ({tokens_fixos} tokens) mais a saída ({max_tokens_saida} tokens) não cabem na janela de contexto ({n_ctx} tokens)."
+        )
+
+    # Tokeniza cada sentença uma única vez; sentenças maiores que o orçamento são cortadas por tokens
+    segmentos = []
+    for segmento in segmentar_sentencas(texto):
+        tokens_segmento = llm.tokenize(segmento.encode(), add_bos=False)
+        if len(tokens_segmento) > orcamento:
+            segmentos.extend(cortar_segmento_longo(tokens_segmento, llm, orcamento))
         else:
-            # Se nem um pedaço grande couber, corta metade da janela disponível
-            corte = (n_ctx - max_tokens_saida) // 2
-            bloco_tokens = tokens[inicio:inicio + corte]
-            bloco_texto = llm.detokenize(bloco_tokens).decode("utf-8", errors="ignore")
-            blocos.append(bloco_texto)
-            inicio += len(bloco_tokens)
+            segmentos.append((segmento, len(tokens_segmento)))
+
+    # Agrupa sentenças consecutivas enquanto couberem no orçamento
+    grupos = []
+    atual = []
+    soma = 0
+    for segmento, n_tokens in segmentos:
+        if atual and soma + n_tokens > orcamento:
+            grupos.append(atual)
+            # Mantém as últimas sentenças como sobreposição com o próximo bloco
+            mantidos = []
+            soma = 0
+            for anterior in reversed(atual):
+                if soma + anterior[1] > sobreposicao or soma + anterior[1] + n_tokens > orcamento:
+                    break
+                mantidos.insert(0, anterior)
+                soma += anterior[1]
+            atual = mantidos
+        atual.append((segmento, n_tokens))
+        soma += n_tokens
+    if atual:
+        grupos.append(atual)
+
+    # Texto vazio continua gerando um bloco (vazio), como antes da divisão por sentenças
+    if not grupos:
+        return [texto]
+
+    blocos = []
+    for grupo in grupos:
+        blocos.extend(validar_bloco(grupo, llm, prompt_template, max_tokens_saida, n_ctx))
 
     return blocos  # Retorna lista de blocos de texto seguros
 
+# Compila (uma única vez) a gramática GBNF do modo de saída
+def carregar_gramatica(modo_saida):
+    if modo_saida not in _gramaticas:
+        from llama_cpp import LlamaGrammar
+        _gramaticas[modo_saida] = LlamaGrammar.from_string(GRAMATICAS_SAIDA[modo_saida], verbose=False)
+    return _gramaticas[modo_saida]
+
+# Zera os contadores de desempenho do llama.cpp; retorna False se o objeto não expõe o contexto de baixo nível
+def zerar_tempos_llama(llm):
+    ctx = getattr(getattr(llm, "_ctx", None), "ctx", None)
+    if ctx is None:
+        return False
+    import llama_cpp
+    llama_cpp.llama_perf_context_reset(ctx)
+    return True
+
+# Segundos de avaliação do prompt e de decodificação desde o último zerar_tempos_llama
+def tempos_llama(llm):
+    import llama_cpp
+    dados = llama_cpp.llama_perf_context(llm._ctx.ctx)
+    return dados.t_p_eval_ms / 1000, dados.t_eval_ms / 1000
+
+# Função que faz uma única chamada ao LLaMA, reaproveitando o prefixo já avaliado quando possível
+def chamar_llm(prompt, llm, max_tokens=256, temperature=0.7, cache_prefixo=None, tokens_prompt=None, cache_completions=None,
+               stop=None, gramatica=None):
+
+    # Respostas idênticas (mesmo prompt, modelo e parâmetros) vêm direto do cache, sem chamar o modelo
+    extras_cache = {"stop": stop, "gramatica": gramatica is not None} if stop or gramatica is not None else None
+    if cache_completions is not None:
+        resposta = buscar_completion(cache_completions, prompt, llm, max_tokens, temperature, extras_cache)
+        if resposta is not None:
+            print("💾 Resposta obtida do cache de completions.")
+            registrar_bloco(len(tokens_prompt) if tokens_prompt is not None else None, origem="cache_completions")
+            return resposta
+
+    if tokens_prompt is None:
+        tokens_prompt = llm.tokenize(prompt.encode())
+
+    # Restaura o estado do prefixo estático para que só o texto clínico e a saída sejam calculados
+    reaproveitados = restaurar_prefixo(llm, cache_prefixo, tokens_prompt)
+    if cache_prefixo:
+        print(f"♻️  {reaproveitados}/{len(tokens_prompt)} tokens do prompt reaproveitados do cache de prefixo.")
+
+    # Com a instrumentação ativa, os contadores do llama.cpp separam a avaliação do prompt da decodificação
+    medir_tempos = metricas_ativas() and zerar_tempos_llama(llm)
+    inicio = time.perf_counter()
+    parametros = {"grammar": gramatica} if gramatica is not None else {}
+    result = llm(prompt=prompt, max_tokens=max_tokens, temperature=temperature, stop=stop, **parametros)
+    duracao = time.perf_counter() - inicio
+    resposta = result["choices"][0]["text"].strip()
+
+    # Mostra quantos tokens foram gerados e se a saída foi cortada por max_tokens
+    tokens_gerados = result.get("usage", {}).get("completion_tokens")
+    cortada = result["choices"][0].get("finish_reason") == "length"
+    if tokens_gerados is not None:
+        print(f"⏱️  {tokens_gerados} tokens gerados em {duracao:.2f}s{' (cortada em max_tokens)' if cortada else ''}")
+    if metricas_ativas():
+        segundos_prompt, segundos_decodificacao = tempos_llama(llm) if medir_tempos else (None, None)
+        registrar_bloco(len(tokens_prompt), tokens_gerados, duracao, segundos_prompt, segundos_decodificacao, cortada,
+                        tokens_reaproveitados=reaproveitados)
+
+    if cache_completions is not None:
+        salvar_completion(cache_completions, prompt, llm, max_tokens, temperature, resposta, extras_cache)
+    return resposta
+
+# Indica se algum bloco da resposta falhou (os blocos são juntados por "\n", então cada um começa uma linha)
+def resposta_com_erro(resposta):
+    return any(linha.startswith(PREFIXO_ERRO_BLOCO) for linha in resposta.split("\n"))
+
 # Função que processa o texto clínico usando LLaMA
-def PesquisaClin_Llama(textoClinico, llm, max_tokens=256, temperature=0.7):
+def PesquisaClin_Llama(textoClinico, llm, max_tokens=256, temperature=0.7, cache_prefixo=None, cache_completions=None,
+                       modo_saida="completo", usar_gramatica=False, ao_concluir_bloco=None):
     
     # Processa o texto clínico com LLaMA, dividindo automaticamente em blocos que cabem na janela de contexto.
+    # modo_saida="compacto" gera apenas as listas de tuplas, sem repetir a narrativa anotada.
+    # usar_gramatica=True restringe a geração ao formato das tuplas com uma gramática GBNF.
+    # ao_concluir_bloco(i, resposta) recebe a resposta bruta de cada bloco (ex.: para gravá-la).
     respostas = []
+    prompt_template = MODOS_SAIDA[modo_saida]["template"]
+    stop = MODOS_SAIDA[modo_saida]["stop"]
+    gramatica = carregar_gramatica(modo_saida) if usar_gramatica else None
 
     # Divide o texto em blocos seguros para não estourar a janela de contexto
     blocos = dividir_texto_por_prompt_seguro(
         textoClinico,
         llm,
-        PROMPT_TEMPLATE,
+        prompt_template,
         max_tokens_saida=max_tokens
     )
 
     # Processa cada bloco separadamente
     for i, bloco in enumerate(blocos):
-        prompt = PROMPT_TEMPLATE.format(textoClinico=bloco)
+        prompt = prompt_template.format(textoClinico=bloco)
         try:
-            print(f"\n🔹 Processando bloco {i+1}/{len(blocos)} ({len(llm.tokenize(prompt.encode()))} tokens incluindo prompt)...\n")
-            result = llm(prompt=prompt, max_tokens=max_tokens, temperature=temperature)
-            respostas.append(result["choices"][0]["text"].strip())  # Armazena resposta do bloco
+            tokens_prompt = llm.tokenize(prompt.encode())
+            print(f"\n🔹 Processando bloco {i+1}/{len(blocos)} ({len(tokens_prompt)} tokens incluindo prompt)...\n")
+            resposta = chamar_llm(
+                prompt,
+                llm,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                cache_prefixo=cache_prefixo,
+                tokens_prompt=tokens_prompt,
+                cache_completions=cache_completions,
+                stop=stop,
+                gramatica=gramatica
+            )
+            respostas.append(resposta)  # Armazena resposta do bloco
         except Exception as e:
             print(f"\nErro na chamada LLaMA para bloco {i+1}: {e}")
-            respostas.append(f"Erro na chamada LLaMA: {e}")
+            respostas.append(f"{PREFIXO_ERRO_BLOCO}{e}")
+        if ao_concluir_bloco is not None:
+            ao_concluir_bloco(i, respostas[-1])
 
     return "\n".join(respostas)  # Junta todas as respostas em uma string
+
+# Versão em fluxo de chamar_llm: consome llm(..., stream=True), entrega cada tupla das listas assim que ela fecha
+# e interrompe a geração quando as duas listas terminam ou a saída entra em laço. O texto completo é o valor de retorno
+# do gerador (resposta = yield from chamar_llm_streaming(...)).
+def chamar_llm_streaming(prompt, llm, max_tokens=256, temperature=0.7, cache_prefixo=None, tokens_prompt=None,
+                         cache_completions=None, stop=None, gramatica=None):
+    leitor = LeitorTuplas()
+
+    # A saída com parada antecipada pode diferir da completa, então tem chave própria no cache de completions
+    extras_cache = {"stop": stop, "gramatica": gramatica is not None, "streaming": True}
+    if cache_completions is not None:
+        resposta = buscar_completion(cache_completions, prompt, llm, max_tokens, temperature, extras_cache)
+        if resposta is not None:
+            print("💾 Resposta obtida do cache de completions.")
+            registrar_bloco(len(tokens_prompt) if tokens_prompt is not None else None, origem="cache_completions")
+            yield from leitor.alimentar(resposta)
+            return resposta
+
+    if tokens_prompt is None:
+        tokens_prompt = llm.tokenize(prompt.encode())
+
+    reaproveitados = restaurar_prefixo(llm, cache_prefixo, tokens_prompt)
+    if cache_prefixo:
+        print(f"♻️  {reaproveitados}/{len(tokens_prompt)} tokens do prompt reaproveitados do cache de prefixo.")
+
+    medir_tempos = metricas_ativas() and zerar_tempos_llama(llm)
+    inicio = time.perf_counter()
+    primeira_tupla = None
+    pedacos_gerados = 0
+    motivo = None
+    parametros = {"grammar": gramatica} if gramatica is not None else {}
+    fluxo = llm(prompt=prompt, max_tokens=max_tokens, temperature=temperature, stop=stop, stream=True, **parametros)
+    try:
+        for pedaco in fluxo:
+            escolha = pedaco["choices"][0]
+            pedacos_gerados += 1
+            for entidade in leitor.alimentar(escolha["text"]):
+                if primeira_tupla is None:
+                    primeira_tupla = time.perf_counter() - inicio
+                yield entidade
+            if escolha.get("finish_reason") == "length":
+                motivo = "cortada em max_tokens"
+            elif leitor.concluido():
+                motivo = "listas concluídas"
+                break
+            elif leitor.degenerado():
+                motivo = "repetição detectada"
+                break
+    finally:
+        fluxo.close()  # Libera o gerador do modelo; após um break nenhum token a mais é calculado
+
+    duracao = time.perf_counter() - inicio
+    resposta = leitor.texto.strip()
+    detalhe = f" ({motivo})" if motivo else ""
+    primeira = f", primeira tupla em {primeira_tupla:.2f}s" if primeira_tupla is not None else ""
+    print(f"⏱️  {pedacos_gerados} tokens gerados em {duracao:.2f}s{primeira}{detalhe}")
+    if metricas_ativas():
+        segundos_prompt, segundos_decodificacao = tempos_llama(llm) if medir_tempos else (None, None)
+        registrar_bloco(len(tokens_prompt), pedacos_gerados, duracao, segundos_prompt, segundos_decodificacao,
+                        motivo == "cortada em max_tokens", tokens_reaproveitados=reaproveitados,
+                        primeira_tupla=primeira_tupla, parada=motivo)
+
+    if cache_completions is not None:
+        salvar_completion(cache_completions, prompt, llm, max_tokens, temperature, resposta, extras_cache)
+    return resposta
+
+# Versão em fluxo de PesquisaClin_Llama: gera as entidades (dicionários como as linhas do CSV, com o número do bloco)
+# enquanto o modelo ainda decodifica; o texto completo, igual ao de PesquisaClin_Llama, é o valor de retorno do gerador
+def PesquisaClin_Llama_streaming(textoClinico, llm, max_tokens=256, temperature=0.7, cache_prefixo=None,
+                                 cache_completions=None, modo_saida="completo", usar_gramatica=False, ao_concluir_bloco=None):
+    respostas = []
+    prompt_template = MODOS_SAIDA[modo_saida]["template"]
+    stop = MODOS_SAIDA[modo_saida]["stop"]
+    gramatica = carregar_gramatica(modo_saida) if usar_gramatica else None
+
+    blocos = dividir_texto_por_prompt_seguro(textoClinico, llm, prompt_template, max_tokens_saida=max_tokens)
+
+    for i, bloco in enumerate(blocos):
+        prompt = prompt_template.format(textoClinico=bloco)
+        try:
+            tokens_prompt = llm.tokenize(prompt.encode())
+            print(f"\n🔹 Processando bloco {i+1}/{len(blocos)} ({len(tokens_prompt)} tokens incluindo prompt)...\n")
+            fluxo = chamar_llm_streaming(
+                prompt,
+                llm,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                cache_prefixo=cache_prefixo,
+                tokens_prompt=tokens_prompt,
+                cache_completions=cache_completions,
+                stop=stop,
+                gramatica=gramatica
+            )
+            # Repassa as entidades do bloco e recupera o texto completo no fim do gerador
+            while True:
+                try:
+                    entidade = next(fluxo)
+                except StopIteration as fim:
+                    respostas.append(fim.value)
+                    break
+                yield {"bloco": i, **entidade}
+        except Exception as e:
+            print(f"\nErro na chamada LLaMA para bloco {i+1}: {e}")
+            respostas.append(f"{PREFIXO_ERRO_BLOCO}{e}")
+        if ao_concluir_bloco is not None:
+            ao_concluir_bloco(i, respostas[-1])
+
+    return "\n".join(respostas)
+
+# Avalia tokens no contexto reaproveitando o trecho inicial que já está no estado do modelo
+def avaliar_tokens(llm, tokens):
+    # Mantém ao menos um token para avaliar, senão não haveria logits novos
+    comum = min(tokens_em_comum(llm.input_ids[:llm.n_tokens], tokens), len(tokens) - 1)
+    llm.n_tokens = comum
+    llm.eval(tokens[comum:])
+
+# Logits do último token avaliado, lidos do contexto: sem logits_all=True, Llama.eval não preenche llm.scores
+def logits_ultimo_token(llm):
+    return np.ctypeslib.as_array(llm._ctx.get_logits(), shape=(llm.n_vocab(),)).copy()
+
+# Ids dos tokens que representam cada opção (com e sem espaço antes, como o modelo pode gerá-las)
+def tokens_das_opcoes(llm, opcoes):
+    ids_opcoes = []
+    for opcao in opcoes:
+        variantes = set()
+        for texto in (opcao, " " + opcao):
+            tokens = llm.tokenize(texto.encode(), add_bos=False)
+            if len(tokens) == 1:
+                variantes.add(tokens[0])
+        ids_opcoes.append(sorted(variantes))
+    return ids_opcoes
+
+# Escolhe a opção mais provável no próximo token e retorna (opção, probabilidade entre as opções, token)
+def escolher_opcao(llm, ids_opcoes, opcoes):
+    logits = logits_ultimo_token(llm)
+    todos = [token for variantes in ids_opcoes for token in variantes]
+    maximo = logits[todos].max()
+
+    # Softmax restrito às opções; a probabilidade de cada opção soma suas variantes
+    pesos = {token: float(np.exp(logits[token] - maximo)) for token in todos}
+    total = sum(pesos.values())
+    prob_opcoes = [sum(pesos[token] for token in variantes) / total for variantes in ids_opcoes]
+
+    melhor = int(np.argmax(prob_opcoes))
+    token = max(ids_opcoes[melhor], key=lambda t: logits[t])
+    return opcoes[melhor], prob_opcoes[melhor], token
+
+# Classificação em um único token: avalia o prompt uma vez e compara só os logits das opções (determinístico)
+def classificar_token_unico(prompt, llm, opcoes):
+    return classificar_em_sequencia(prompt, [""], llm, opcoes)[0]
+
+# Classifica vários itens com um único prompt: após o prompt, cada rótulo (ex.: "\n1:") é avaliado,
+# a opção mais provável é escolhida e anexada ao contexto antes do próximo rótulo; retorna (opção, probabilidade) de cada um
+def classificar_em_sequencia(prompt, rotulos, llm, opcoes):
+    ids_opcoes = tokens_das_opcoes(llm, opcoes)
+    if any(not variantes for variantes in ids_opcoes):
+        raise ValueError(f"As opções {opcoes} precisam corresponder a um único token cada.")
+
+    avaliar_tokens(llm, llm.tokenize(prompt.encode()))
+    resultados = []
+    for i, rotulo in enumerate(rotulos):
+        if rotulo:
+            llm.eval(llm.tokenize(rotulo.encode(), add_bos=False))
+        opcao, probabilidade, token = escolher_opcao(llm, ids_opcoes, opcoes)
+        resultados.append((opcao, probabilidade))
+        if i < len(rotulos) - 1:
+            llm.eval([token])  # A resposta escolhida entra no contexto para o próximo item
+    return resultados
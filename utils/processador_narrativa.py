@@ -1,95 +1,400 @@
 import os
+import json
 import time
+import hashlib
+from collections import deque
 import xml.etree.ElementTree as ET
 import pandas as pd
-from .processador_csv import criar_dataframe_e_exportar_csv
-from .processador_llama import PesquisaClin_Llama 
-from .processador_xml import padronizar_string
-from .processador_relacoes import relacoes, dados_relacionados
+from .processador_csv import criar_dataframe, criar_dataframe_e_exportar_csv, listas_concluidas
+from .processador_llama import PesquisaClin_Llama, PesquisaClin_Llama_streaming, resposta_com_erro
+from .manifesto import (
+    carregar_manifesto, chave_execucao, chave_narrativa, chave_narrativa_hash, narrativa_concluida, registrar_narrativa
+)
+from comando_llama.prompt import MODOS_SAIDA
+from .processador_xml import padronizar_string, construir_grafo_anotacoes
+from .processador_relacoes import dados_relacionados, tagDesejada
+from .ingestao import iterar_narrativas
+from .instrumentacao import definir_narrativa, etapa, registrar, registrar_cache
+from .respostas_gravadas import gravar_respostas, iterar_respostas_gravadas, hash_texto_narrativa
+from .saida_colunar import (
+    saida_colunar_disponivel, abrir_saida_anterior, narrativa_na_saida_anterior, gravar_narrativa_colunar,
+    copiar_narrativa_anterior, fechar_saida_colunar, descartar_saida_colunar, e_saida_colunar, carregar_saida_colunar,
+    textos_narrativas, iterar_entidades_ordenadas, exportar_csv_mestre
+)
+from .cache_goldstandard import (
+    abrir_cache_goldstandard, consultar_goldstandard, registrar_goldstandard,
+    salvar_cache_goldstandard, estatisticas_cache_goldstandard
+)
 
-# Função principal que processa todas as narrativas XML de uma pasta
-def processar_narrativas(pasta_narrativas, csv_output_folder, llm, max_tokens=256, temperature=0.7):
+NOME_CSV_MESTRE = "todas_narrativas_extraidas_ordenado.csv"  # Gravado na pasta de saída por criar_csv_mestre
+# Versão das regras que extraem os achados do gold standard; incremente ao mudar o que elas produzem fora das funções
+# de versao_regras_goldstandard() (ex.: stemmer, unidecode, mapeamento de categorias em outro módulo)
+VERSAO_REGRAS_GOLDSTANDARD = 1
+
+# Calcula a chave da execução usada no manifesto (prompt, modelo e parâmetros de geração)
+# n_ctx entra na chave porque os limites dos blocos (dividir_texto_em_blocos) dependem do tamanho do contexto
+def chave_execucao_narrativas(caminho_modelo, max_tokens, temperature, modo_saida="completo", usar_gramatica=False,
+                              streaming=False, n_ctx=None):
+    parametros = {
+        "n_ctx": n_ctx,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "modo_saida": modo_saida,
+        "usar_gramatica": usar_gramatica,
+    }
+    if streaming:
+        parametros["streaming"] = True  # A parada antecipada muda a saída; sem streaming as chaves antigas continuam válidas
+    return chave_execucao(MODOS_SAIDA[modo_saida]["template"], caminho_modelo, parametros)
+
+# Consulta o manifesto a partir do texto já lido: retorna a chave da narrativa e a entrada já concluída (ou None)
+# Entradas que apontam para a saída colunar só valem se a saída anterior (abrir_saida_anterior) tiver a narrativa
+# gravada com a mesma chave; senão a narrativa volta a ser extraída
+def consultar_manifesto_texto(manifesto, chave_exec, nome_narrativa, texto, saida_anterior=None):
+    if texto is None:
+        return None, None
+    chave = chave_narrativa(texto, chave_exec)
+    entrada = narrativa_concluida(manifesto, nome_narrativa, chave)
+    if (entrada is not None and entrada.get("saida_colunar") and entrada.get("entidades")
+            and not narrativa_na_saida_anterior(saida_anterior, nome_narrativa, chave)):
+        entrada = None
+    return chave, entrada
+
+# Saída colunar anterior de uma extração que grava na saída colunar (None no modo CSV)
+def saida_anterior_colunar(saida_colunar):
+    return saida_colunar["anterior"] if saida_colunar is not None else None
+
+# Confere, sem o modelo, se alguma narrativa da origem ainda precisa ser extraída (para na primeira encontrada)
+# Sem manifesto, qualquer narrativa com texto conta como pendente
+# pasta_saida: pasta da saída colunar, onde estão as entidades das narrativas registradas no manifesto
+def existem_narrativas_pendentes(pasta_narrativas, caminho_manifesto=None, chave_exec=None, pasta_saida=None):
+    manifesto = carregar_manifesto(caminho_manifesto) if caminho_manifesto else None
+    saida_anterior = abrir_saida_anterior(pasta_saida) if pasta_saida and saida_colunar_disponivel() else None
+    for nome_narrativa, texto in iterar_narrativas(pasta_narrativas):
+        if not texto:
+            continue  # Seria pulada na extração, sem chamar o modelo
+        if manifesto is None or consultar_manifesto_texto(manifesto, chave_exec, nome_narrativa, texto,
+                                                          saida_anterior)[1] is None:
+            return True
+    return False
+
+# Carrega o CSV individual de uma narrativa já concluída em uma execução anterior
+def carregar_saida_registrada(entrada, nome_narrativa):
+    print(f"\n⏭️  {nome_narrativa} já processada com o mesmo texto, prompt, modelo e parâmetros. Reaproveitando saída.")
+    if not entrada.get("csv"):
+        return None
+    # Lê tudo como texto para o CSV mestre sair igual ao de uma extração nova
+    return pd.read_csv(entrada["csv"], dtype=str, keep_default_na=False)
+
+# Mostra uma entidade extraída em fluxo, assim que sua tupla fecha
+def mostrar_entidade(nome_narrativa, entidade):
+    print(f"🧩 {nome_narrativa} [bloco {entidade['bloco'] + 1}] {entidade['categoria']}: {entidade['textoAnalisado']}")
+
+# Consome PesquisaClin_Llama_streaming repassando cada entidade a ao_extrair_entidade; retorna o texto completo
+def pesquisar_em_fluxo(texto, nome_narrativa, llm, ao_extrair_entidade, **parametros):
+    fluxo = PesquisaClin_Llama_streaming(texto, llm, **parametros)
+    while True:
+        try:
+            entidade = next(fluxo)
+        except StopIteration as fim:
+            return fim.value
+        ao_extrair_entidade(nome_narrativa, entidade)
+
+# Obtém a resposta do LLaMA para o texto de uma narrativa, com novas tentativas em caso de erro
+# streaming=True decodifica em fluxo: as entidades chegam a ao_extrair_entidade(nome, entidade) enquanto o modelo
+# ainda gera, e a geração para assim que as listas terminam ou a saída entra em laço
+# Com respostas_gravadas, as respostas brutas de cada bloco são gravadas para reprodução sem o modelo
+def extrair_resposta_texto(texto, nome_narrativa, llm, max_tokens=256, temperature=0.7, cache_prefixo=None,
+                           cache_completions=None, modo_saida="completo", usar_gramatica=False, streaming=False,
+                           ao_extrair_entidade=None, respostas_gravadas=None):
+
+    # Retorna a resposta do modelo ou None se a narrativa não puder ser processada.
+    max_tentativas = 3
+    delay = 2
+    definir_narrativa(nome_narrativa)  # Blocos e etapas seguintes são atribuídos a esta narrativa nas métricas
+
+    if not texto:
+        print(f"\n⚠️ Elemento TEXT não encontrado, vazio ou XML inválido em {nome_narrativa}. Pulando arquivo.")
+        return None
+
+    for tentativa in range(max_tentativas):
+        respostas_blocos = []  # Respostas brutas desta tentativa, bloco a bloco
+        try:
+            parametros = {
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "cache_prefixo": cache_prefixo,
+                "cache_completions": cache_completions,
+                "modo_saida": modo_saida,
+                "usar_gramatica": usar_gramatica,
+                "ao_concluir_bloco": (lambda i, resposta_bloco: respostas_blocos.append(resposta_bloco))
+                                     if respostas_gravadas is not None else None
+            }
+            # Chama LLaMA para processar o texto, dividindo em blocos se necessário
+            with etapa("inferencia"):
+                if streaming:
+                    resposta = pesquisar_em_fluxo(texto, nome_narrativa, llm, ao_extrair_entidade or mostrar_entidade, **parametros)
+                else:
+                    resposta = PesquisaClin_Llama(texto, llm, **parametros)
+            print(f"\n\n✅ Processado {nome_narrativa} (tentativa {tentativa + 1}):\n {resposta[:100]}...")
+            if respostas_gravadas is not None and resposta_com_erro(resposta):
+                print(f"\n⚠️ {nome_narrativa} teve bloco com erro na chamada ao modelo; respostas não gravadas.")
+            elif respostas_gravadas is not None:
+                gravar_respostas(
+                    respostas_gravadas, nome_narrativa, respostas_blocos, modo_saida, texto,
+                    modelo=getattr(llm, 'model_path', ''), n_ctx=llm.n_ctx(), max_tokens=max_tokens,
+                    temperature=temperature, usar_gramatica=usar_gramatica, streaming=streaming
+                )
+            return resposta  # sucesso, sai do loop de retries
+
+        except Exception as e:
+            print(f"\n⚠️ Erro inesperado em {nome_narrativa}: {e}. Retrying...")
+            registrar("erro", tentativa=tentativa + 1, mensagem=str(e))
+            time.sleep(delay)
+            continue
+
+    return None
+
+# Função principal que processa todas as narrativas XML de uma origem (pasta, glob, .zip, .tar ou lista delas)
+def processar_narrativas(pasta_narrativas, csv_output_folder, llm, max_tokens=256, temperature=0.7, cache_prefixo=None,
+                         caminho_manifesto=None, cache_completions=None, modo_saida="completo", usar_gramatica=False,
+                         retornar_caminhos=False, streaming=False, ao_extrair_entidade=None, respostas_gravadas=None,
+                         caminho_modelo=None, n_ctx=None, saida_colunar=None):
     
-    # Processa todos os arquivos XML na pasta usando LLaMA em blocos, salva CSVs individuais e retorna uma lista de DataFrames.
-    lista_dataframes_individuais = []
+    # Processa as narrativas uma a uma usando LLaMA em blocos, salva CSVs individuais e retorna uma lista de DataFrames.
+    # Com retornar_caminhos=True, retorna só os caminhos dos CSVs individuais (memória constante para corpora grandes).
+    # Com saida_colunar (abrir_saida_colunar), cada narrativa vai para a saída colunar assim que termina, sem CSV
+    # individual; as reaproveitadas pelo manifesto são copiadas da saída anterior.
+    # Com um manifesto, narrativas já concluídas com o mesmo texto, prompt, modelo e parâmetros são reaproveitadas.
+    # Com streaming=True, as entidades de cada narrativa chegam a ao_extrair_entidade durante a decodificação.
+    # Com respostas_gravadas, as respostas brutas de cada narrativa extraída são gravadas (ver reproduzir_narrativas).
+    # caminho_modelo, n_ctx: modelo e contexto da chave do manifesto quando llm ainda não foi carregado (llm=None, nada
+    # pendente).
+    saidas_individuais = []
+    total_narrativas = 0
 
-    # Lista todos os arquivos XML válidos (ignora arquivos _goldstandard)
-    arquivos_xml = [f for f in os.listdir(pasta_narrativas)
-                    if f.endswith('.xml') and not f.endswith('_goldstandard.xml')]
+    manifesto = carregar_manifesto(caminho_manifesto) if caminho_manifesto else None
+    if manifesto is not None:
+        chave_exec = chave_execucao_narrativas(caminho_modelo or getattr(llm, 'model_path', ''), max_tokens, temperature,
+                                               modo_saida, usar_gramatica, streaming,
+                                               n_ctx if llm is None else llm.n_ctx())
 
-    if not arquivos_xml:
+    print(f"\n\n✅ Lendo narrativas de {pasta_narrativas}. Iniciando processamento...")
+
+    # Processa cada narrativa individualmente, à medida que é lida
+    for nome_narrativa, texto in iterar_narrativas(pasta_narrativas):
+        total_narrativas += 1
+        chave = None
+        if manifesto is not None:
+            chave, entrada = consultar_manifesto_texto(manifesto, chave_exec, nome_narrativa, texto,
+                                                       saida_anterior_colunar(saida_colunar))
+            if entrada is not None:
+                adicionar_saida_registrada(saidas_individuais, entrada, nome_narrativa, retornar_caminhos, saida_colunar)
+                continue
+
+        resposta = extrair_resposta_texto(
+            texto,
+            nome_narrativa,
+            llm,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            cache_prefixo=cache_prefixo,
+            cache_completions=cache_completions,
+            modo_saida=modo_saida,
+            usar_gramatica=usar_gramatica,
+            streaming=streaming,
+            ao_extrair_entidade=ao_extrair_entidade,
+            respostas_gravadas=respostas_gravadas
+        )
+        if resposta is None:
+            continue
+
+        # Formata e salva a saída da narrativa (CSV individual ou saída colunar)
+        dataframe_resultante = formatar_saida(resposta, nome_narrativa, csv_output_folder, modo_saida, saida_colunar)
+        adicionar_saida(saidas_individuais, dataframe_resultante, nome_narrativa, csv_output_folder, retornar_caminhos,
+                        saida_colunar, chave)
+
+        # Marca a narrativa como concluída no manifesto
+        if chave is not None:
+            registrar_saida_manifesto(manifesto, caminho_manifesto, nome_narrativa, chave, resposta, dataframe_resultante,
+                                      csv_output_folder, saida_colunar)
+
+    if not total_narrativas:
         print("\n❌ Nenhum arquivo XML válido encontrado na pasta de narrativas.")
-        return []
-
-    print(f"\n\n✅ {len(arquivos_xml)} arquivos XML encontrados. Iniciando processamento...")
-
-    # Processa cada narrativa individualmente
-    for nome_narrativa in arquivos_xml:
-        caminho_narrativa = os.path.join(pasta_narrativas, nome_narrativa)
-        max_tentativas = 3
-        delay = 2
-
-        for tentativa in range(max_tentativas):
-            try:
-                if not os.path.exists(caminho_narrativa):
-                    print(f"\nTentativa {tentativa + 1}: Arquivo não encontrado: {caminho_narrativa}. Tentando novamente...")
-                    time.sleep(delay)
-                    continue
-
-                # Parse do XML
-                tree = ET.parse(caminho_narrativa)
-                root = tree.getroot()
-                elemento_texto = root.find('.//TEXT')
-
-                if elemento_texto is not None and elemento_texto.text:
-                    xml_text = elemento_texto.text
-
-                    # Chama LLaMA para processar o texto, dividindo em blocos se necessário
-                    resposta = PesquisaClin_Llama(
-                        xml_text,
-                        llm,
-                        max_tokens=max_tokens,
-                        temperature=temperature
-                    )
-                    print(f"\n\n✅ Processado {nome_narrativa} (tentativa {tentativa + 1}):\n {resposta[:100]}...")
-
-                    # Formata e salva CSV individual
-                    dataframe_resultante = formatar_saida(resposta, nome_narrativa, csv_output_folder)
-                    if dataframe_resultante is not None and not dataframe_resultante.empty:
-                        lista_dataframes_individuais.append(dataframe_resultante)
-                    break  # sucesso, sai do loop de retries
-                else:
-                    print(f"\n⚠️ Elemento TEXT não encontrado ou vazio em {nome_narrativa}. Pulando arquivo.")
-                    break
-
-            except ET.ParseError:
-                print(f"\n⚠️ Erro ao parsear XML: {nome_narrativa}. Pulando arquivo.")
-                break
-            except Exception as e:
-                print(f"\n⚠️ Erro inesperado em {nome_narrativa}: {e}. Retrying...")
-                time.sleep(delay)
+    return saidas_individuais
+
+# Chave do manifesto da extração que gravou as respostas de uma narrativa (parâmetros e hash do texto da gravação)
+# Na saída colunar, permite que a próxima extração reaproveite a narrativa reproduzida. chaves_execucao: memória
+# das chaves de execução já calculadas (cada uma lê amostras do arquivo do modelo)
+def chave_gravacao(gravacao, chaves_execucao):
+    parametros = gravacao["parametros"]
+    if gravacao["hash_texto"] is None or "modelo" not in parametros:
+        return None
+    identificacao = json.dumps(parametros, sort_keys=True)
+    if identificacao not in chaves_execucao:
+        chaves_execucao[identificacao] = chave_execucao_narrativas(
+            parametros["modelo"], parametros["max_tokens"], parametros["temperature"], parametros["modo_saida"],
+            parametros.get("usar_gramatica", False), parametros.get("streaming", False)
+        )
+    return chave_narrativa_hash(gravacao["hash_texto"], chaves_execucao[identificacao])
+
+# Refaz os CSVs individuais a partir das respostas gravadas, sem o modelo: mesmas saídas da extração que as gravou
+# Com origem_narrativas, só são reproduzidas as narrativas da origem cujo texto não mudou desde a gravação
+# Com parametros (modelo, max_tokens, temperature, usar_gramatica, streaming, modo_saida), avisa quando a gravação
+# foi feita com valores diferentes da configuração atual
+# Respostas com bloco que falhou na chamada ao modelo nunca são reproduzidas
+def reproduzir_narrativas(respostas_gravadas, csv_output_folder, retornar_caminhos=False, origem_narrativas=None,
+                          parametros=None, saida_colunar=None):
+    saidas_individuais = []
+    total_narrativas = 0
+    ignoradas = {"bloco com erro": 0, "texto alterado": 0, "fora da origem": 0}
+    divergentes = {}  # Parâmetro -> narrativas gravadas com outro valor
+    chaves_execucao = {}
+    print(f"\n\n⏯️  Reproduzindo respostas gravadas em {respostas_gravadas['caminho']} (modelo não carregado)...")
+
+    hashes_origem = None
+    if origem_narrativas is not None:
+        hashes_origem = {nome: hash_texto_narrativa(texto) for nome, texto in iterar_narrativas(origem_narrativas) if texto}
+
+    for nome_narrativa, modo_saida, resposta, gravacao in iterar_respostas_gravadas(respostas_gravadas):
+        if resposta_com_erro(resposta):
+            ignoradas["bloco com erro"] += 1
+            continue
+        if hashes_origem is not None:
+            if nome_narrativa not in hashes_origem:
+                ignoradas["fora da origem"] += 1
+                continue
+            if gravacao["hash_texto"] is not None and gravacao["hash_texto"] != hashes_origem[nome_narrativa]:
+                print(f"\n⚠️ O texto de {nome_narrativa} mudou desde a gravação. Pulando.")
+                ignoradas["texto alterado"] += 1
                 continue
+        for chave, valor in (parametros or {}).items():
+            if chave in gravacao["parametros"] and gravacao["parametros"][chave] != valor:
+                divergentes[chave] = divergentes.get(chave, 0) + 1
+
+        total_narrativas += 1
+        respostas_gravadas["reproduzidas"] += 1
+        dataframe_resultante = formatar_saida(resposta, nome_narrativa, csv_output_folder, modo_saida, saida_colunar)
+        adicionar_saida(saidas_individuais, dataframe_resultante, nome_narrativa, csv_output_folder, retornar_caminhos,
+                        saida_colunar, chave_gravacao(gravacao, chaves_execucao) if saida_colunar is not None else None)
+
+    for motivo, quantidade in ignoradas.items():
+        if quantidade:
+            print(f"\n⚠️ {quantidade} narrativas gravadas não reproduzidas ({motivo}).")
+    for chave, quantidade in divergentes.items():
+        print(f"\n⚠️ {quantidade} narrativas foram gravadas com {chave} diferente da configuração atual ({parametros[chave]}).")
+    if not total_narrativas:
+        print("\n❌ Nenhuma resposta gravada encontrada. Rode uma extração com GRAVAR_RESPOSTAS = True antes.")
+    else:
+        print(f"\n✅ {total_narrativas} narrativas reproduzidas.")
+    return saidas_individuais
+
+# Guarda a saída de uma narrativa: o DataFrame ou, com retornar_caminhos, só o caminho do CSV individual
+# Com saida_colunar, as entidades (ordenadas por termo) vão para a saída colunar com a chave do manifesto,
+# e só o DataFrame é guardado na lista (nada com retornar_caminhos)
+def adicionar_saida(saidas_individuais, dataframe_resultante, nome_narrativa, csv_output_folder, retornar_caminhos=False,
+                    saida_colunar=None, chave=None):
+    if dataframe_resultante is None or dataframe_resultante.empty:
+        return
+    if saida_colunar is not None:
+        gravar_narrativa_colunar(saida_colunar, nome_narrativa, ordenar_entidades(dataframe_resultante), chave)
+        if not retornar_caminhos:
+            saidas_individuais.append(dataframe_resultante)
+        return
+    if retornar_caminhos:
+        saidas_individuais.append(caminho_csv_individual(nome_narrativa, csv_output_folder))
+    else:
+        saidas_individuais.append(dataframe_resultante)
 
-    return lista_dataframes_individuais
+# Guarda a saída de uma narrativa reaproveitada do manifesto (sem ler o CSV quando só o caminho é necessário)
+# Com saida_colunar, as entidades são copiadas da saída anterior (ou lidas do CSV individual de registros antigos)
+def adicionar_saida_registrada(saidas_individuais, entrada, nome_narrativa, retornar_caminhos=False, saida_colunar=None):
+    if saida_colunar is not None:
+        if entrada.get("saida_colunar") and entrada.get("entidades"):
+            print(f"\n⏭️  {nome_narrativa} já processada com o mesmo texto, prompt, modelo e parâmetros. Reaproveitando saída.")
+            copiar_narrativa_anterior(saida_colunar, nome_narrativa)
+        else:
+            adicionar_saida(saidas_individuais, carregar_saida_registrada(entrada, nome_narrativa), nome_narrativa, None,
+                            retornar_caminhos, saida_colunar, entrada["chave"])
+        return
+    if retornar_caminhos:
+        print(f"\n⏭️  {nome_narrativa} já processada com o mesmo texto, prompt, modelo e parâmetros. Reaproveitando saída.")
+        if entrada.get("csv"):
+            saidas_individuais.append(entrada["csv"])
+        return
+    dataframe_resultante = carregar_saida_registrada(entrada, nome_narrativa)
+    if dataframe_resultante is not None and not dataframe_resultante.empty:
+        saidas_individuais.append(dataframe_resultante)
+
+# Indica se a saída de uma narrativa pode ser dada como concluída: nenhum bloco falhou e há entidades ou,
+# sem entidades, a resposta traz as duas listas fechadas (narrativa sem achados, e não uma saída cortada ou inválida)
+def saida_concluida(resposta, dataframe_resultante):
+    if resposta is None or resposta_com_erro(resposta):
+        return False
+    if dataframe_resultante is not None and not dataframe_resultante.empty:
+        return True
+    return listas_concluidas(resposta)
+
+# Registra no manifesto a saída de uma narrativa concluída; falhas não são registradas e voltam ao modelo na próxima execução
+# Com saida_colunar, o registro aponta para a saída colunar (onde a narrativa fica com a mesma chave), e não para um CSV
+def registrar_saida_manifesto(manifesto, caminho_manifesto, nome_narrativa, chave, resposta, dataframe_resultante,
+                              csv_output_folder, saida_colunar=None):
+    if not saida_concluida(resposta, dataframe_resultante):
+        print(f"\n⚠️ {nome_narrativa} não foi registrada no manifesto (bloco com erro ou saída fora do formato); "
+              f"será extraída de novo na próxima execução.")
+        return
+    tem_entidades = dataframe_resultante is not None and not dataframe_resultante.empty
+    caminho_csv = caminho_csv_individual(nome_narrativa, csv_output_folder) if tem_entidades and saida_colunar is None else None
+    registrar_narrativa(manifesto, caminho_manifesto, nome_narrativa, chave, caminho_csv,
+                        len(dataframe_resultante) if tem_entidades else 0,
+                        saida_colunar["caminho"] if saida_colunar is not None else None)
+
+# Caminho do CSV individual de uma narrativa (narrativas de subpastas de um arquivo compactado ou glob têm "/" no nome)
+def caminho_csv_individual(nome_narrativa, csv_output_folder):
+    return os.path.join(csv_output_folder, f"output_{nome_narrativa.replace('/', '__')}.csv")
 
 # Cria CSV individual a partir da resposta do modelo
-def formatar_saida(resposta, nome_narrativa, csv_output_folder):
+# Com saida_colunar, só monta o DataFrame: a narrativa vai para a saída colunar em adicionar_saida
+def formatar_saida(resposta, nome_narrativa, csv_output_folder, modo_saida="completo", saida_colunar=None):
     
+    definir_narrativa(nome_narrativa)
+    if saida_colunar is not None:
+        with etapa("parse_csv"):
+            return criar_dataframe(resposta, nome_narrativa, modo_saida)
+
     os.makedirs(csv_output_folder, exist_ok=True)  # Garante que a pasta de saída exista
-    nome_arquivo_csv_individual = os.path.join(csv_output_folder, f"output_{nome_narrativa}.csv")
+    nome_arquivo_csv_individual = caminho_csv_individual(nome_narrativa, csv_output_folder)
 
-    dataframe_resultante = criar_dataframe_e_exportar_csv(
-        input_text=resposta,
-        csv_filename=nome_arquivo_csv_individual,
-        narrative_name=nome_narrativa
-    )
+    with etapa("parse_csv"):
+        dataframe_resultante = criar_dataframe_e_exportar_csv(
+            input_text=resposta,
+            csv_filename=nome_arquivo_csv_individual,
+            narrative_name=nome_narrativa,
+            modo_saida=modo_saida
+        )
 
     return dataframe_resultante
 
-# Cria CSV mestre a partir dos DataFrames individuais
-def criar_csv_mestre(lista_dataframes_individuais, csv_output_folder):
-    
-    # Junta todos os CSVs individuais em um único CSV mestre, ordenado por narrativa e termo.
+# Ordena as entidades de uma narrativa pelo termo, sem diferenciar maiúsculas (ordenação estável)
+def ordenar_entidades(df):
+    return df.sort_values(by='textoAnalisado', key=lambda col: col.fillna('').str.lower(), kind='stable',
+                          ignore_index=True)
+
+# Ordena os DataFrames individuais por narrativa e termo e os entrega uma narrativa por vez: (nome, DataFrame)
+# Com caminhos dos CSVs individuais, lê um arquivo por vez (memória constante). Cada CSV individual tem uma única
+# narrativa: ordenar os arquivos pelo nome da narrativa e cada arquivo pelo termo (ordenação estável) dá o mesmo
+# resultado da ordenação do DataFrame completo
+def iterar_saidas_ordenadas(lista_dataframes_individuais):
+    if lista_dataframes_individuais and isinstance(lista_dataframes_individuais[0], str):
+        def nome_narrativa_csv(caminho):
+            nome = os.path.basename(caminho)
+            return nome[len("output_"):-len(".csv")] if nome.startswith("output_") and nome.endswith(".csv") else nome
+
+        for caminho in sorted(set(lista_dataframes_individuais), key=nome_narrativa_csv):
+            df = pd.read_csv(caminho, dtype=str, keep_default_na=False)
+            if not df.empty:
+                yield df["nomeNarrativa"].iloc[0], ordenar_entidades(df)
+        return
+
     if lista_dataframes_individuais:
         df_mestre = pd.concat(lista_dataframes_individuais, ignore_index=True)
 
@@ -100,122 +405,199 @@ def criar_csv_mestre(lista_dataframes_individuais, csv_output_folder):
             key=lambda col: col.str.lower() if col.name == 'textoAnalisado' else col,
             ignore_index=True
         )
+        yield from df_mestre_sorted.groupby('nomeNarrativa', sort=False)
+
+# Conclui a saída mestre: com saida_colunar (já preenchida pela extração), fecha a saída colunar e retorna o caminho
+# da pasta; com exportar_csv=True, exporta também o CSV mestre. Sem saída colunar (sem pyarrow), cria o CSV mestre
+# a partir dos DataFrames individuais (ou dos caminhos dos CSVs individuais) e retorna o caminho dele.
+def criar_saida_mestre(lista_dataframes_individuais, csv_output_folder, exportar_csv=False, saida_colunar=None):
+    if saida_colunar is None:
+        return criar_csv_mestre(lista_dataframes_individuais, csv_output_folder)
+
+    caminho = fechar_saida_colunar(saida_colunar)
+    if caminho is None:
+        print("\n❌ Nenhum DataFrame individual foi gerado.")
+        return None
+    print(f"\n✅ Saída mestre gerada: {caminho} ({saida_colunar['narrativas']} narrativas, "
+          f"{saida_colunar['entidades']} entidades)")
 
+    if exportar_csv:
         os.makedirs(csv_output_folder, exist_ok=True)
-        csv_mestre_filename = os.path.join(csv_output_folder, "todas_narrativas_extraidas_ordenado.csv")
-        df_mestre_sorted.to_csv(csv_mestre_filename, index=False, encoding='utf-8', sep=',')
-        print(f"\n✅ CSV mestre gerado: {csv_mestre_filename}")
-        return csv_mestre_filename
-    else:
+        csv_mestre_filename = exportar_csv_mestre(caminho, os.path.join(csv_output_folder, NOME_CSV_MESTRE))
+        print(f"\n✅ CSV mestre exportado: {csv_mestre_filename}")
+    return caminho
+
+# Extração interrompida (erro ou Ctrl+C): grava a saída colunar com as narrativas concluídas até aqui mais as da
+# saída anterior que não foram regravadas, para que o manifesto e a saída continuem coerentes
+def interromper_saida_mestre(saida_colunar):
+    try:
+        caminho = fechar_saida_colunar(saida_colunar, preservar_anteriores=True)
+    except Exception as e:
+        descartar_saida_colunar(saida_colunar)
+        print(f"\n⚠️ Extração interrompida; saída colunar anterior mantida ({e}).")
+        return None
+    if caminho is not None:
+        print(f"\n⚠️ Extração interrompida; saída colunar gravada com as narrativas concluídas: {caminho}")
+    return caminho
+
+# Cria CSV mestre a partir dos DataFrames individuais (ou dos caminhos dos CSVs individuais), um arquivo por vez
+def criar_csv_mestre(lista_dataframes_individuais, csv_output_folder):
+    
+    # Junta todos os CSVs individuais em um único CSV mestre, ordenado por narrativa e termo.
+    os.makedirs(csv_output_folder, exist_ok=True)
+    csv_mestre_filename = os.path.join(csv_output_folder, NOME_CSV_MESTRE)
+    caminho_temp = f"{csv_mestre_filename}.{os.getpid()}.tmp"
+    escritos = 0
+    with open(caminho_temp, 'w', encoding='utf-8', newline='') as f:
+        for _, df in iterar_saidas_ordenadas(lista_dataframes_individuais):
+            df.to_csv(f, index=False, header=(escritos == 0), sep=',')
+            escritos += 1
+
+    if not escritos:
+        os.remove(caminho_temp)
         print("\n❌ Nenhum DataFrame individual foi gerado.")
         return None
+    os.replace(caminho_temp, csv_mestre_filename)
+    print(f"\n✅ CSV mestre gerado: {csv_mestre_filename}")
+    return csv_mestre_filename
+
+# Achados do modelo da saída mestre (pasta colunar ou CSV mestre), com as colunas renomeadas para a comparação
+# Na saída colunar, os achados saem em ordem de narrativa e termo (como no CSV mestre), e o textoPrompt de cada
+# achado é o mesmo objeto do texto da narrativa (não há uma cópia por linha)
+def carregar_achados_mestre(saida_mestre):
+    colunas = ['nomeNarrativa', 'termo', 'textoPrompt', 'categoria', 'abreviacao', 'SCTID']
+    if e_saida_colunar(saida_mestre):
+        saida = carregar_saida_colunar(saida_mestre)
+        textos = textos_narrativas(saida)
+        achados = []
+        for tabela in iterar_entidades_ordenadas(saida):
+            achados.extend(tabela.rename_columns(
+                ['termo' if c == 'textoAnalisado' else c for c in tabela.column_names]
+            ).to_pylist())
+        for achado in achados:
+            achado['textoPrompt'] = textos.get(achado['nomeNarrativa'])
+        return achados
+
+    # Mapeia colunas do CSV mestre para o formato esperado
+    df_prompts = pd.read_csv(saida_mestre).rename(columns={'textoAnalisado': 'termo'})
+    return df_prompts[colunas].to_dict('records')
+
+# Colunas do DataFrame de avaliação (uma linha por VP, FP ou FN)
+COLUNAS_RESULTADO = [
+    "nomeNarrativa", "textoPrompt", "categoria", "termoAnalisado",
+    "abreviacao", "SCTID", "semClin_nomeNarrativa","semClin_textoAnalisado", "semClin_categoria", "classificacao"
+]
+
+# Extrai os achados do gold standard (sinais/sintomas e doenças/síndromes), ordenados por termo
+# Por padrão só os não negados; com incluir_negados=True, todos, com o campo "negado" (formato do cache)
+def extrair_achados_goldstandard(narrativa_semclin, incluir_negados=False):
+    tree = ET.parse(narrativa_semclin)
+    root = tree.getroot()
+    achados_semclin = []
+    grafo = construir_grafo_anotacoes(root)  # Índices de anotações e relações, montados uma vez por documento
+
+    for annotation in grafo["tags"]:
+        specific_annotation = annotation["tag"]
+        id = annotation["id"]
+        dado = padronizar_string(annotation["texto"])
+        dadoFinal, negado = dados_relacionados(grafo, id, dado)
+
+        if dadoFinal and ("Sign or Symptom" in specific_annotation or "Disease or Syndrome" in specific_annotation) and (incluir_negados or not negado) and "Diagnostic Procedure" not in specific_annotation:
+            categoria = "Sinal ou Sintoma" if "Sign or Symptom" in specific_annotation else "Doença ou Síndrome"
+            achado = {
+                "narrativa": narrativa_semclin[-8:],
+                "termo": dadoFinal,
+                "categoria": categoria
+            }
+            if incluir_negados:
+                achado["negado"] = negado
+            achados_semclin.append(achado)
+
+    achados_semclin.sort(key=lambda item: item['termo'])
+    return achados_semclin
+
+# Identificador das regras de extração do gold standard gravado no cache: a constante de versão mais o hash
+# do código das funções que decidem os achados. Mudou qualquer uma, o cache é descartado
+def versao_regras_goldstandard():
+    import inspect
+    sha = hashlib.sha256(str(VERSAO_REGRAS_GOLDSTANDARD).encode('utf-8'))
+    for funcao in (extrair_achados_goldstandard, dados_relacionados, tagDesejada, construir_grafo_anotacoes, padronizar_string):
+        try:
+            sha.update(inspect.getsource(funcao).encode('utf-8'))
+        except (OSError, TypeError):
+            sha.update(funcao.__qualname__.encode('utf-8'))  # Sem o código-fonte (só .pyc): vale a constante
+    return sha.hexdigest()
+
+# Achados não negados do gold standard, lidos do cache quando o XML não mudou
+def achados_goldstandard(narrativa_semclin, cache_goldstandard=None):
+    if cache_goldstandard is None:
+        return extrair_achados_goldstandard(narrativa_semclin)
+    achados = consultar_goldstandard(cache_goldstandard, narrativa_semclin)
+    if achados is None:
+        achados = extrair_achados_goldstandard(narrativa_semclin, incluir_negados=True)
+        registrar_goldstandard(cache_goldstandard, narrativa_semclin, achados)
+    # A ordenação por termo é estável, então filtrar depois dá a mesma ordem de filtrar antes
+    return [
+        {"narrativa": a["narrativa"], "termo": a["termo"], "categoria": a["categoria"]}
+        for a in achados if not a["negado"]
+    ]
+
+# Classifica os achados de uma narrativa em VP, FP e FN, retornando as linhas do resultado
+# VP: cada achado do modelo consome o primeiro achado do gold standard (na ordem por termo) com o mesmo termo
+def classificar_achados(narrativa_atual, achados_prompt, achados_semclin):
+    # Índice termo -> fila de posições do gold standard ainda não usadas
+    indice_semclin = {}
+    for j, achado_xml in enumerate(achados_semclin):
+        indice_semclin.setdefault(achado_xml["termo"], deque()).append(j)
 
-# Compara resultados do modelo com o gold standard e gera Excel de avaliação
-def comparar_com_goldstandard(csv_mestre, pasta_narrativas, excel_resultados):
+    linhas_vp, linhas_fp = [], []
+    usado_semclin = [False] * len(achados_semclin)
+    for achado in achados_prompt:
+        fila = indice_semclin.get(achado["termo"]) if isinstance(achado["termo"], str) else None
+        linha = [narrativa_atual, achado["textoPrompt"], achado["categoria"], achado["termo"], achado["abreviacao"], achado["SCTID"]]
+        if fila:
+            j = fila.popleft()
+            usado_semclin[j] = True
+            achado_xml = achados_semclin[j]
+            linhas_vp.append(linha + [achado_xml['narrativa'], achado_xml['termo'], achado_xml["categoria"], 'VP'])
+        else:
+            linhas_fp.append(linha + ["", "", "", 'FP'])
+
+    linhas_fn = [
+        ["", "", "", "", "", "", achado_xml['narrativa'], achado_xml['termo'], achado_xml["categoria"], 'FN']
+        for j, achado_xml in enumerate(achados_semclin) if not usado_semclin[j]
+    ]
+    return linhas_vp + linhas_fp + linhas_fn
+
+# Compara resultados do modelo com o gold standard; grava o Excel de avaliação só se excel_resultados for informado
+# saida_mestre: pasta da saída colunar (criar_saida_mestre) ou CSV mestre
+# Com caminho_cache_goldstandard, os achados dos XMLs que não mudaram vêm do cache em Parquet
+def comparar_com_goldstandard(saida_mestre, pasta_narrativas, excel_resultados=None, caminho_cache_goldstandard=None):
     
     # Compara os resultados extraídos pelo modelo com o gold standard e salva um Excel de avaliação.
-    df_prompts = pd.read_csv(csv_mestre)
-    df_resultado = pd.DataFrame(columns=[
-        "nomeNarrativa", "textoPrompt", "categoria", "termoAnalisado",
-        "abreviacao", "SCTID", "semClin_nomeNarrativa","semClin_textoAnalisado", "semClin_categoria", "classificacao"
-    ])
+    achados_mestre = carregar_achados_mestre(saida_mestre)
 
-    # Mapeia colunas do CSV mestre para o formato esperado
-    col_mapping = {
-        'nomeNarrativa': 'nomeNarrativa',
-        'textoPrompt': 'textoPrompt',
-        'categoria': 'categoria',
-        'textoAnalisado': 'termo',
-        'abreviacao': 'abreviacao',
-        'SCTID': 'SCTID'
-    }
-    df_prompts = df_prompts.rename(columns=col_mapping)
-    narrativas_unicas = df_prompts['nomeNarrativa'].unique()
+    # As linhas são acumuladas em uma lista e o DataFrame é montado uma única vez no fim
+    linhas_resultado = []
+    cache_goldstandard = (
+        abrir_cache_goldstandard(caminho_cache_goldstandard, versao_regras_goldstandard())
+        if caminho_cache_goldstandard else None
+    )
+
+    # Agrupa os achados do modelo por narrativa (na ordem em que aparecem no CSV mestre) em uma única passada
+    achados_por_narrativa = {}
+    for achado in achados_mestre:
+        narrativa_atual = achado.pop('nomeNarrativa')
+        if not pd.isna(narrativa_atual):
+            achados_por_narrativa.setdefault(narrativa_atual, []).append(achado)
 
     # Compara cada narrativa individual com seu gold standard
-    for narrativa_atual in narrativas_unicas:
-        df_narrativa_atual = df_prompts[df_prompts['nomeNarrativa'] == narrativa_atual].copy()
-        achados_prompt = df_narrativa_atual[['termo', 'textoPrompt', 'categoria', 'abreviacao', 'SCTID']].to_dict('records')
+    for narrativa_atual, achados_prompt in achados_por_narrativa.items():
 
-        narrativa_semclin = os.path.join(pasta_narrativas, f"{narrativa_atual[:4]}.xml")
+        narrativa_semclin = os.path.join(pasta_narrativas, f"{os.path.basename(narrativa_atual)[:4]}.xml")
         try:
-            tree = ET.parse(narrativa_semclin)
-            root = tree.getroot()
-            achados_semclin = []
-            relacao = relacoes(root)
-
-            # Extrai os achados do gold standard
-            for annotation in root.find('TAGS'):
-                specific_annotation = annotation.get('tag')
-                id = annotation.get('id')
-                dado = padronizar_string(annotation.get('text'))
-                dadoFinal, negado = dados_relacionados(relacao, id, root, dado)
-
-                if dadoFinal and ("Sign or Symptom" in specific_annotation or "Disease or Syndrome" in specific_annotation) and not negado and "Diagnostic Procedure" not in specific_annotation:
-                    categoria = "Sinal ou Sintoma" if "Sign or Symptom" in specific_annotation else "Doença ou Síndrome"
-                    achados_semclin.append({
-                        "narrativa": narrativa_semclin[-8:],
-                        "termo": dadoFinal,
-                        "categoria": categoria
-                    })
-
-            # Ordena os achados do gold standard
-            achados_semclin.sort(key=lambda item: item['termo'])
-            usado_prompt = [False] * len(achados_prompt)
-            usado_semclin = [False] * len(achados_semclin)
-
-            # Identifica Verdadeiros Positivos (VP)
-            for i, achado in enumerate(achados_prompt):
-                for j, achado_xml in enumerate(achados_semclin):
-                    if not usado_prompt[i] and not usado_semclin[j]:
-                        if achado["termo"] == achado_xml["termo"]:
-                            df_resultado = pd.concat([df_resultado, pd.DataFrame([{
-                                "nomeNarrativa": narrativa_atual,
-                                "textoPrompt": achado["textoPrompt"],
-                                "categoria": achado["categoria"],
-                                "termoAnalisado": achado["termo"],
-                                "abreviacao": achado["abreviacao"],
-                                "SCTID": achado["SCTID"],
-                                "semClin_nomeNarrativa": achado_xml['narrativa'],
-                                "semClin_textoAnalisado": achado_xml['termo'],
-                                "semClin_categoria": achado_xml["categoria"],
-                                "classificacao": 'VP'
-                            }])], ignore_index=True)
-                            usado_prompt[i] = True
-                            usado_semclin[j] = True
-                            break
-
-            # Identifica Falsos Positivos (FP)
-            for i, achado in enumerate(achados_prompt):
-                if not usado_prompt[i]:
-                    df_resultado = pd.concat([df_resultado, pd.DataFrame([{
-                        "nomeNarrativa": narrativa_atual,
-                        "textoPrompt": achado["textoPrompt"],
-                        "categoria": achado["categoria"],
-                        "termoAnalisado": achado["termo"],
-                        "abreviacao": achado["abreviacao"],
-                        "SCTID": achado["SCTID"],
-                        "semClin_nomeNarrativa": "",
-                        "semClin_textoAnalisado": "",
-                        "semClin_categoria": "",
-                        "classificacao": 'FP'
-                    }])], ignore_index=True)
-
-            # Identifica Falsos Negativos (FN)
-            for j, achado_xml in enumerate(achados_semclin):
-                if not usado_semclin[j]:
-                    df_resultado = pd.concat([df_resultado, pd.DataFrame([{
-                        "nomeNarrativa": "",
-                        "textoPrompt": "",
-                        "categoria": "",
-                        "termoAnalisado": "",
-                        "abreviacao": "",
-                        "SCTID": "",
-                        "semClin_nomeNarrativa": achado_xml['narrativa'],
-                        "semClin_textoAnalisado": achado_xml['termo'],
-                        "semClin_categoria": achado_xml["categoria"],
-                        "classificacao": 'FN'
-                    }])], ignore_index=True)
+            achados_semclin = achados_goldstandard(narrativa_semclin, cache_goldstandard)
+            linhas_resultado.extend(classificar_achados(narrativa_atual, achados_prompt, achados_semclin))
 
         except FileNotFoundError:
             print(f"\nErro: Arquivo XML não encontrado para a narrativa {narrativa_atual}")
@@ -224,6 +606,15 @@ def comparar_com_goldstandard(csv_mestre, pasta_narrativas, excel_resultados):
             print(f"\nErro ao processar narrativa {narrativa_atual}: {e}")
             continue
 
+    df_resultado = pd.DataFrame(linhas_resultado, columns=COLUNAS_RESULTADO, dtype=object)
+
+    if cache_goldstandard is not None:
+        salvar_cache_goldstandard(cache_goldstandard)
+        stats = estatisticas_cache_goldstandard(cache_goldstandard)
+        print(f"\n📚 Gold standard: {stats['acertos']} narrativas lidas do cache, {stats['falhas']} reprocessadas.")
+        registrar_cache("goldstandard", stats)
+
     # Salva o resultado da comparação em Excel
-    df_resultado.to_excel(excel_resultados, index=False, sheet_name='Resultados')
+    if excel_resultados:
+        df_resultado.to_excel(excel_resultados, index=False, sheet_name='Resultados')
     return df_resultado
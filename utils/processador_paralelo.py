@@ -0,0 +1,172 @@
+import os
+import multiprocessing
+from collections import deque
+
+from comando_llama.prompt import MODOS_SAIDA
+from .cache_prefixo import preparar_cache_prefixo
+from .manifesto import carregar_manifesto
+from .cache_completions import abrir_cache_completions
+from .respostas_gravadas import abrir_respostas_gravadas
+from .ingestao import iterar_narrativas
+from .instrumentacao import iniciar_metricas, configuracao_metricas
+from .processador_narrativa import (
+    extrair_resposta_texto, formatar_saida, chave_execucao_narrativas, consultar_manifesto_texto,
+    registrar_saida_manifesto, adicionar_saida, adicionar_saida_registrada, saida_anterior_colunar
+)
+
+# Estado de cada processo trabalhador: um modelo LLaMA, seu cache de prefixo e suas conexões ao cache de completions
+# e ao armazenamento de respostas gravadas
+_llm_trabalhador = None
+_cache_prefixo_trabalhador = None
+_cache_completions_trabalhador = None
+_respostas_gravadas_trabalhador = None
+# Erro ao inicializar o trabalhador (ex.: modelo inexistente). Se o inicializador levantasse a exceção, o Pool
+# recriaria o processo sem fim e resultado.get() nunca voltaria; o erro é guardado e levantado em cada tarefa
+_erro_inicializacao_trabalhador = None
+
+# Divide as threads disponíveis igualmente entre os trabalhadores
+def dividir_threads(n_threads_total, n_trabalhadores):
+    return max(1, n_threads_total // max(1, n_trabalhadores))
+
+# Carrega o modelo uma vez por processo; com use_mmap os pesos ficam compartilhados no page cache
+def _inicializar_trabalhador(config_modelo, caminho_snapshot_prefixo, config_cache_completions, modo_saida, config_metricas,
+                            config_respostas_gravadas):
+    global _llm_trabalhador, _cache_prefixo_trabalhador, _cache_completions_trabalhador, _respostas_gravadas_trabalhador
+    global _erro_inicializacao_trabalhador
+    try:
+        from llama_cpp import Llama
+
+        if config_metricas:
+            # Mesmo arquivo e mesma execução do processo principal; cada linha leva o pid do trabalhador
+            iniciar_metricas(**config_metricas)
+
+        _llm_trabalhador = Llama(**config_modelo)
+        _cache_prefixo_trabalhador = preparar_cache_prefixo(
+            _llm_trabalhador, MODOS_SAIDA[modo_saida]["template"], caminho_snapshot_prefixo
+        )
+        if config_cache_completions:
+            # Cada processo abre sua própria conexão SQLite (conexões não podem ser compartilhadas entre processos)
+            _cache_completions_trabalhador = abrir_cache_completions(**config_cache_completions)
+        if config_respostas_gravadas:
+            _respostas_gravadas_trabalhador = abrir_respostas_gravadas(**config_respostas_gravadas)
+    except Exception as e:
+        _erro_inicializacao_trabalhador = f"{type(e).__name__}: {e}"
+
+# Processa uma narrativa dentro do trabalhador e devolve o nome junto com a resposta
+def _processar_no_trabalhador(tarefa):
+    nome_narrativa, texto, max_tokens, temperature, modo_saida, usar_gramatica, streaming = tarefa
+    if _erro_inicializacao_trabalhador is not None:
+        raise RuntimeError(f"Falha ao inicializar o trabalhador: {_erro_inicializacao_trabalhador}")
+    resposta = extrair_resposta_texto(
+        texto,
+        nome_narrativa,
+        _llm_trabalhador,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        cache_prefixo=_cache_prefixo_trabalhador,
+        cache_completions=_cache_completions_trabalhador,
+        modo_saida=modo_saida,
+        usar_gramatica=usar_gramatica,
+        streaming=streaming,
+        respostas_gravadas=_respostas_gravadas_trabalhador
+    )
+    return nome_narrativa, resposta
+
+# Processa as narrativas em N processos que compartilham o arquivo GGUF via mmap
+def processar_narrativas_paralelo(pasta_narrativas, csv_output_folder, config_modelo, n_trabalhadores=4,
+                                  n_threads_total=None, max_tokens=256, temperature=0.7, caminho_snapshot_prefixo=None,
+                                  caminho_manifesto=None, config_cache_completions=None, modo_saida="completo",
+                                  usar_gramatica=False, retornar_caminhos=False, janela=None, streaming=False,
+                                  config_respostas_gravadas=None, saida_colunar=None):
+
+    # Retorna a lista de saídas na mesma ordem do processamento sequencial.
+    # config_cache_completions: argumentos de abrir_cache_completions (caminho e tamanho máximo), se o cache for usado.
+    # config_respostas_gravadas: argumentos de abrir_respostas_gravadas (caminho), se as respostas forem gravadas.
+    # janela: máximo de narrativas lidas e ainda não concluídas (padrão: 2 por trabalhador). A leitura da origem
+    # espera quando a janela enche, então a memória não cresce com o tamanho do corpus.
+    # saida_colunar: saída colunar aberta (abrir_saida_colunar), gravada pelo processo principal em vez dos CSVs.
+    saidas_individuais = []
+    janela = janela or 2 * n_trabalhadores
+    n_threads_total = n_threads_total or os.cpu_count() or 1
+    n_threads = dividir_threads(n_threads_total, n_trabalhadores)
+
+    manifesto = carregar_manifesto(caminho_manifesto) if caminho_manifesto else None
+    if manifesto is not None:
+        chave_exec = chave_execucao_narrativas(config_modelo.get('model_path', ''), max_tokens, temperature, modo_saida, usar_gramatica,
+                                               streaming, config_modelo.get('n_ctx'))
+
+    # Narrativas em andamento, na ordem de leitura: (nome, chave do manifesto, resultado assíncrono ou entrada reaproveitada)
+    em_andamento = deque()
+    n_enviadas = 0
+    pool = None
+
+    def concluir_mais_antiga():
+        nonlocal n_enviadas
+        nome_narrativa, chave, resultado, entrada = em_andamento.popleft()
+        if entrada is not None:
+            adicionar_saida_registrada(saidas_individuais, entrada, nome_narrativa, retornar_caminhos, saida_colunar)
+            return
+        n_enviadas -= 1
+        _, resposta = resultado.get()
+        if resposta is None:
+            return
+
+        # As saídas são escritas no processo principal, na mesma ordem do caminho sequencial
+        dataframe_resultante = formatar_saida(resposta, nome_narrativa, csv_output_folder, modo_saida, saida_colunar)
+        adicionar_saida(saidas_individuais, dataframe_resultante, nome_narrativa, csv_output_folder, retornar_caminhos,
+                        saida_colunar, chave)
+        if chave is not None:
+            registrar_saida_manifesto(manifesto, caminho_manifesto, nome_narrativa, chave, resposta, dataframe_resultante,
+                                      csv_output_folder, saida_colunar)
+
+    try:
+        total_narrativas = 0
+        for nome_narrativa, texto in iterar_narrativas(pasta_narrativas):
+            total_narrativas += 1
+            chave = None
+            if manifesto is not None:
+                chave, entrada = consultar_manifesto_texto(manifesto, chave_exec, nome_narrativa, texto,
+                                                           saida_anterior_colunar(saida_colunar))
+                if entrada is not None:
+                    em_andamento.append((nome_narrativa, chave, None, entrada))
+                    # Reaproveitadas no início da fila não esperam por nada: saem na hora
+                    while em_andamento and em_andamento[0][3] is not None:
+                        concluir_mais_antiga()
+                    continue
+
+            if pool is None:
+                # O pool só é criado quando aparece a primeira narrativa que precisa do modelo
+                # Cada trabalhador abre o mesmo GGUF com mmap e recebe sua fatia das threads
+                config_trabalhador = dict(config_modelo, use_mmap=True, n_threads=n_threads)
+                print(f"\n\n✅ Iniciando processamento com {n_trabalhadores} processos x {n_threads} threads "
+                      f"(até {janela} narrativas em andamento)...")
+                # 'spawn' evita herdar threads e estado do llama.cpp do processo principal
+                contexto = multiprocessing.get_context('spawn')
+                pool = contexto.Pool(
+                    processes=n_trabalhadores,
+                    initializer=_inicializar_trabalhador,
+                    initargs=(config_trabalhador, caminho_snapshot_prefixo, config_cache_completions, modo_saida,
+                              configuracao_metricas(), config_respostas_gravadas)
+                )
+
+            # Janela cheia: espera a narrativa mais antiga terminar antes de ler a próxima
+            while n_enviadas >= janela:
+                concluir_mais_antiga()
+
+            tarefa = (nome_narrativa, texto, max_tokens, temperature, modo_saida, usar_gramatica, streaming)
+            em_andamento.append((nome_narrativa, chave, pool.apply_async(_processar_no_trabalhador, (tarefa,)), None))
+            n_enviadas += 1
+
+        while em_andamento:
+            concluir_mais_antiga()
+
+        if not total_narrativas:
+            print("\n❌ Nenhum arquivo XML válido encontrado na pasta de narrativas.")
+        elif pool is None:
+            print("\n✅ Todas as narrativas já foram processadas. Nada a enviar ao modelo.")
+    finally:
+        if pool is not None:
+            pool.terminate()  # Todos os resultados já foram consumidos (ou houve erro)
+            pool.join()
+
+    return saidas_individuais
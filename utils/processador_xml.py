@@ -1,9 +1,23 @@
-from nltk.stem import RSLPStemmer
+from collections import OrderedDict
+import os
+import json
 import unidecode
 import xml.etree.ElementTree as ET
 
-# Inicializa o stemmer da língua portuguesa
-stemmer = RSLPStemmer()
+_stemmer = None  # Stemmer RSLP da língua portuguesa, criado no primeiro uso (importar o nltk é lento)
+
+# Retorna o stemmer RSLP, criando-o na primeira chamada
+def obter_stemmer():
+    global _stemmer
+    if _stemmer is None:
+        from nltk.stem import RSLPStemmer
+        _stemmer = RSLPStemmer()
+    return _stemmer
+
+# Memo palavra -> radical (LRU limitado); as mesmas palavras clínicas se repetem em todo o corpus
+TAMANHO_MAXIMO_MEMO_RADICAIS = 100000
+_memo_radicais = OrderedDict()
+_estatisticas_radicais = {"acertos": 0, "falhas": 0}
 
 # Função que padroniza strings: lower case, sem acentos e sem espaços extras
 def padronizar_string(string):
@@ -12,10 +26,73 @@ def padronizar_string(string):
     else:
         return str(string) if string is not None else ""
 
+# Retorna o radical de uma palavra, consultando o memo antes de chamar o RSLPStemmer
+def radical(palavra):
+    resultado = _memo_radicais.get(palavra)
+    if resultado is not None:
+        _memo_radicais.move_to_end(palavra)
+        _estatisticas_radicais["acertos"] += 1
+        return resultado
+
+    _estatisticas_radicais["falhas"] += 1
+    resultado = obter_stemmer().stem(palavra)
+    _memo_radicais[palavra] = resultado
+    if len(_memo_radicais) > TAMANHO_MAXIMO_MEMO_RADICAIS:
+        _memo_radicais.popitem(last=False)  # Remove a palavra usada há mais tempo
+    return resultado
+
+# Calcula de uma vez os radicais de um vocabulário (cada palavra distinta passa pelo stemmer no máximo uma vez)
+def radicais_vocabulario(palavras):
+    return {palavra: radical(palavra) for palavra in set(palavras)}
+
 # Aplica stemmer a cada palavra de uma frase
 def stem_frase(frase):
     frase_str = str(frase)  # garante que seja string
-    return " ".join(stemmer.stem(w) for w in frase_str.split())
+    return " ".join(radical(w) for w in frase_str.split())
+
+# Pré-carrega no memo a tabela palavra -> radical salva em execuções anteriores
+def carregar_tabela_radicais(caminho):
+    if not os.path.exists(caminho):
+        return 0
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            tabela = json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"\n⚠️ Tabela de radicais ignorada ({caminho}): {e}")
+        return 0
+    for palavra, resultado in list(tabela.items())[-TAMANHO_MAXIMO_MEMO_RADICAIS:]:
+        _memo_radicais.setdefault(palavra, resultado)
+    return len(tabela)
+
+# Salva o memo atual junto com a tabela já existente (escrita atômica)
+def salvar_tabela_radicais(caminho):
+    tabela = {}
+    if os.path.exists(caminho):
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                tabela = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            tabela = {}
+    tabela.update(_memo_radicais)
+
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+    caminho_temp = f"{caminho}.{os.getpid()}.tmp"
+    with open(caminho_temp, 'w', encoding='utf-8') as f:
+        json.dump(tabela, f, ensure_ascii=False)
+    os.replace(caminho_temp, caminho)
+    return len(tabela)
+
+# Retorna acertos, falhas, taxa de acerto e tamanho do memo de radicais
+def estatisticas_radicais():
+    consultas = _estatisticas_radicais["acertos"] + _estatisticas_radicais["falhas"]
+    return {
+        "acertos": _estatisticas_radicais["acertos"],
+        "falhas": _estatisticas_radicais["falhas"],
+        "taxa_acerto": _estatisticas_radicais["acertos"] / consultas if consultas else 0.0,
+        "tamanho": len(_memo_radicais),
+    }
 
 # Carrega XML e retorna a raiz; trata erros caso arquivo não exista ou não seja válido
 def carregar_xml(caminho):
@@ -30,14 +107,16 @@ def carregar_xml(caminho):
         print(f"\nErro ao processar {caminho}: {e}")
         return None
 
-# Extrai achados (termos e categorias) de uma narrativa XML
-def extrair_achados(root):
+# Extrai achados (termos e categorias) de uma narrativa XML (ou de um grafo já construído)
+def extrair_achados(root, grafo=None):
     achados = []
-    if root is None:
-        return achados  # Retorna lista vazia se XML não foi carregado
-    for annotation in root.find('TAGS'):
-        termo = padronizar_string(annotation.get('text'))
-        categoria = annotation.get('tag')
+    if grafo is None:
+        if root is None:
+            return achados  # Retorna lista vazia se XML não foi carregado
+        grafo = construir_grafo_anotacoes(root)
+    for anotacao in grafo["tags"]:
+        termo = padronizar_string(anotacao["texto"])
+        categoria = anotacao["tag"]
         if termo != "":
             achados.append({"termo": termo, "categoria": categoria})
     return achados
@@ -55,3 +134,27 @@ def relacoes(root):
         else:
             relacaoDicionario[an1] = [{'id_relacionado': an2, 'tipo_relacionamento': tipo}]
     return relacaoDicionario
+
+# Constrói uma única vez o grafo de anotações de um documento:
+#   anotacoes: id -> anotação (primeira ocorrência no documento, como em root.find(".//annotation[@id=...]"))
+#   tags: anotações de <TAGS> na ordem do documento
+#   entrantes: id -> [(id de origem, tipo)] das relações que apontam para a anotação, na ordem de relacoes()
+def construir_grafo_anotacoes(root):
+    anotacoes = {}
+    for annotation in root.iter('annotation'):
+        anotacoes.setdefault(annotation.get('id'), {
+            "id": annotation.get('id'), "tag": annotation.get('tag'), "texto": annotation.get('text')
+        })
+
+    tags = [
+        {"id": annotation.get('id'), "tag": annotation.get('tag'), "texto": annotation.get('text')}
+        for annotation in root.find('TAGS')
+    ]
+
+    relacaoDicionario = relacoes(root)
+    entrantes = {}
+    for origem, lista in relacaoDicionario.items():
+        for rel in lista:
+            entrantes.setdefault(rel['id_relacionado'], []).append((origem, rel['tipo_relacionamento']))
+
+    return {"anotacoes": anotacoes, "tags": tags, "relacoes": relacaoDicionario, "entrantes": entrantes}
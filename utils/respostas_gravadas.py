@@ -0,0 +1,91 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from itertools import groupby
+
+# Respostas brutas do modelo gravadas por narrativa e bloco. Com elas, CSVs, CSV mestre, métricas e relatório
+# podem ser refeitos sem carregar o modelo (main.py com REPRODUZIR_RESPOSTAS = True).
+# Cada narrativa é gravada inteira, em uma única transação: a reprodução nunca vê uma extração pela metade.
+
+# Abre (ou cria) o armazenamento em SQLite e retorna um dicionário com a conexão e os contadores
+def abrir_respostas_gravadas(caminho):
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+
+    conexao = sqlite3.connect(caminho, timeout=30)
+    conexao.execute("PRAGMA journal_mode=WAL")  # Trabalhadores paralelos gravam no mesmo arquivo
+    conexao.execute("""
+        CREATE TABLE IF NOT EXISTS narrativas (
+            nome TEXT PRIMARY KEY,
+            hash_texto TEXT,
+            modo_saida TEXT NOT NULL,
+            parametros TEXT NOT NULL,
+            n_blocos INTEGER NOT NULL,
+            gravado_em REAL NOT NULL
+        )
+    """)
+    conexao.execute("""
+        CREATE TABLE IF NOT EXISTS blocos (
+            nome TEXT NOT NULL,
+            bloco INTEGER NOT NULL,
+            resposta TEXT NOT NULL,
+            PRIMARY KEY (nome, bloco)
+        )
+    """)
+    conexao.commit()
+    return {"caminho": caminho, "conexao": conexao, "gravadas": 0, "reproduzidas": 0}
+
+# Fecha a conexão do armazenamento
+def fechar_respostas_gravadas(respostas_gravadas):
+    respostas_gravadas["conexao"].close()
+
+# Hash do texto da narrativa gravado junto com as respostas (para conferir, na reprodução, se o texto mudou)
+def hash_texto_narrativa(texto):
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+# Grava as respostas de todos os blocos de uma narrativa, substituindo uma gravação anterior da mesma narrativa
+# parametros: modelo e parâmetros de geração da extração (conferidos com a configuração atual na reprodução)
+def gravar_respostas(respostas_gravadas, nome_narrativa, respostas_blocos, modo_saida="completo", texto=None, **parametros):
+    hash_texto = hash_texto_narrativa(texto) if texto is not None else None
+    conexao = respostas_gravadas["conexao"]
+    with conexao:
+        conexao.execute("DELETE FROM blocos WHERE nome = ?", (nome_narrativa,))
+        conexao.execute(
+            "INSERT OR REPLACE INTO narrativas (nome, hash_texto, modo_saida, parametros, n_blocos, gravado_em) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (nome_narrativa, hash_texto, modo_saida, json.dumps(parametros, sort_keys=True), len(respostas_blocos), time.time())
+        )
+        conexao.executemany(
+            "INSERT INTO blocos (nome, bloco, resposta) VALUES (?, ?, ?)",
+            [(nome_narrativa, i, resposta) for i, resposta in enumerate(respostas_blocos)]
+        )
+    respostas_gravadas["gravadas"] += 1
+
+# Percorre as narrativas gravadas em ordem de nome: (nome, modo de saída, resposta completa, gravação)
+# gravação: hash do texto e parâmetros da extração que gravou a narrativa, para conferir na reprodução
+# A resposta completa junta os blocos como PesquisaClin_Llama ("\n" entre blocos), então o CSV sai igual
+def iterar_respostas_gravadas(respostas_gravadas):
+    cursor = respostas_gravadas["conexao"].execute(
+        "SELECT n.nome, n.modo_saida, n.n_blocos, n.hash_texto, n.parametros, b.resposta "
+        "FROM narrativas n JOIN blocos b ON b.nome = n.nome ORDER BY n.nome, b.bloco"
+    )
+    for (nome_narrativa, modo_saida, n_blocos, hash_texto, parametros), linhas in groupby(cursor, key=lambda linha: linha[:5]):
+        respostas = [linha[5] for linha in linhas]
+        if len(respostas) != n_blocos:
+            print(f"\n⚠️ Gravação incompleta de {nome_narrativa} ({len(respostas)}/{n_blocos} blocos). Pulando.")
+            continue
+        gravacao = {"hash_texto": hash_texto, "parametros": dict(json.loads(parametros), modo_saida=modo_saida)}
+        yield nome_narrativa, modo_saida, "\n".join(respostas), gravacao
+
+# Retorna quantas narrativas e blocos estão gravados e quantas foram gravadas/reproduzidas nesta execução
+def estatisticas_respostas_gravadas(respostas_gravadas):
+    conexao = respostas_gravadas["conexao"]
+    return {
+        "narrativas": conexao.execute("SELECT COUNT(*) FROM narrativas").fetchone()[0],
+        "blocos": conexao.execute("SELECT COUNT(*) FROM blocos").fetchone()[0],
+        "gravadas": respostas_gravadas["gravadas"],
+        "reproduzidas": respostas_gravadas["reproduzidas"],
+    }
@@ -0,0 +1,229 @@
+import os
+import sys
+from itertools import groupby
+
+# Saída mestre da extração em Parquet, normalizada em duas tabelas:
+#   narrativas.parquet: uma linha por narrativa (nomeNarrativa, textoPrompt, chave do manifesto, n_entidades)
+#   entidades.parquet:  uma linha por entidade (nomeNarrativa, categoria, textoAnalisado, abreviacao, SCTID)
+# O texto anotado da narrativa é gravado uma única vez, em vez de repetido em cada entidade como no CSV mestre.
+# A extração grava cada narrativa assim que ela termina, na ordem de conclusão; as entidades de uma narrativa ficam
+# contíguas e já ordenadas, e n_entidades localiza esse trecho. A leitura percorre as narrativas em ordem de nome.
+# nomeNarrativa e categoria são colunas categóricas (dicionário), gravadas em grupos de linhas; a leitura mapeia os
+# arquivos em memória. O CSV mestre continua disponível como exportação.
+
+NOME_SAIDA_COLUNAR = "extracao_colunar"  # Pasta da saída colunar, dentro da pasta de saída
+ARQUIVO_NARRATIVAS = "narrativas.parquet"
+ARQUIVO_ENTIDADES = "entidades.parquet"
+COLUNAS_NARRATIVAS = ["nomeNarrativa", "textoPrompt", "chave", "n_entidades"]
+COLUNAS_ENTIDADES = ["nomeNarrativa", "categoria", "textoAnalisado", "abreviacao", "SCTID"]
+COLUNAS_CSV_MESTRE = ["nomeNarrativa", "textoPrompt", "categoria", "textoAnalisado", "abreviacao", "SCTID"]
+COLUNAS_CATEGORICAS = ("nomeNarrativa", "categoria")
+LINHAS_POR_GRUPO = 65536  # Entidades acumuladas antes de gravar um grupo de linhas (row group)
+
+# Indica se o pyarrow está disponível (sem ele, a extração grava só o CSV mestre)
+def saida_colunar_disponivel():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+# Esquemas das duas tabelas (colunas categóricas como dicionário)
+def _esquemas():
+    import pyarrow as pa
+    tipos = {"n_entidades": pa.int64()}
+    tipos.update({c: pa.dictionary(pa.int32(), pa.string()) for c in COLUNAS_CATEGORICAS})
+    def esquema(colunas):
+        return pa.schema([(c, tipos.get(c, pa.string())) for c in colunas])
+    return {"narrativas": esquema(COLUNAS_NARRATIVAS), "entidades": esquema(COLUNAS_ENTIDADES)}
+
+# Texto vazio vira nulo: abreviação, SCTID e textoPrompt ausentes (como None em criar_dataframe)
+def _valor(valor):
+    if valor is None or (isinstance(valor, float) and valor != valor) or valor == "":
+        return None
+    return str(valor)
+
+# Posição de cada narrativa nas tabelas: nome -> (linha na tabela de narrativas, primeira entidade, entidades)
+# Saídas sem n_entidades (formato anterior, já ordenado por narrativa) são indexadas pelas próprias entidades
+def _intervalos(tabelas):
+    narrativas = tabelas["narrativas"]
+    if "n_entidades" in narrativas.column_names:
+        contagens = zip(narrativas.column("nomeNarrativa").to_pylist(), narrativas.column("n_entidades").to_pylist())
+    else:
+        nomes = tabelas["entidades"].column("nomeNarrativa").to_pylist()
+        contagens = ((nome, sum(1 for _ in grupo)) for nome, grupo in groupby(nomes))
+    linhas = {nome: i for i, nome in enumerate(narrativas.column("nomeNarrativa").to_pylist())}
+    intervalos, inicio = {}, 0
+    for nome, n in contagens:
+        intervalos[nome] = (linhas.get(nome), inicio, n)
+        inicio += n
+    return intervalos
+
+# Abre a saída colunar já gravada para reaproveitar narrativas: tabelas mapeadas em memória e, por narrativa,
+# a chave do manifesto com que foi gravada e sua posição. None se não existir ou não puder ser lida
+def abrir_saida_anterior(pasta_saida):
+    caminho = os.path.join(pasta_saida, NOME_SAIDA_COLUNAR)
+    if not e_saida_colunar(caminho):
+        return None
+    try:
+        tabelas = carregar_saida_colunar(caminho)
+        chaves = (tabelas["narrativas"].column("chave").to_pylist() if "chave" in tabelas["narrativas"].column_names
+                  else [None] * tabelas["narrativas"].num_rows)
+        chave_por_nome = dict(zip(tabelas["narrativas"].column("nomeNarrativa").to_pylist(), chaves))
+        indice = {nome: (chave_por_nome.get(nome),) + intervalo for nome, intervalo in _intervalos(tabelas).items()}
+    except Exception as e:
+        print(f"\n⚠️ Saída colunar anterior inválida em {caminho}: {e}. As narrativas dela serão extraídas de novo.")
+        return None
+    return {"tabelas": tabelas, "indice": indice}
+
+# Indica se a saída anterior tem as entidades da narrativa gravadas com a chave do manifesto informada
+def narrativa_na_saida_anterior(saida_anterior, nome_narrativa, chave):
+    if saida_anterior is None or nome_narrativa not in saida_anterior["indice"]:
+        return False
+    return chave is not None and saida_anterior["indice"][nome_narrativa][0] == chave
+
+# Abre a gravação incremental da saída colunar em pasta/extracao_colunar (arquivos temporários até o fechamento)
+# A saída anterior, se existir, fica aberta para copiar as narrativas reaproveitadas pelo manifesto
+def abrir_saida_colunar(pasta_saida):
+    import pyarrow.parquet as pq
+
+    caminho = os.path.join(pasta_saida, NOME_SAIDA_COLUNAR)
+    os.makedirs(caminho, exist_ok=True)
+    esquemas = _esquemas()
+    saida = {"caminho": caminho, "escritores": {}, "temporarios": {}, "esquemas": esquemas,
+             "pendentes": {tabela: {c: [] for c in esquema.names} for tabela, esquema in esquemas.items()},
+             "anterior": abrir_saida_anterior(pasta_saida), "gravadas": set(), "narrativas": 0, "entidades": 0}
+    for tabela, arquivo in (("narrativas", ARQUIVO_NARRATIVAS), ("entidades", ARQUIVO_ENTIDADES)):
+        temporario = os.path.join(caminho, f"{arquivo}.{os.getpid()}.tmp")
+        saida["temporarios"][tabela] = temporario
+        saida["escritores"][tabela] = pq.ParquetWriter(temporario, esquemas[tabela], compression="zstd")
+    return saida
+
+# Grava as linhas acumuladas como um grupo de linhas de cada tabela
+def _gravar_pendentes(saida):
+    import pyarrow as pa
+    for tabela, colunas in saida["pendentes"].items():
+        if colunas[saida["esquemas"][tabela].names[0]]:
+            saida["escritores"][tabela].write_table(pa.Table.from_pydict(colunas, schema=saida["esquemas"][tabela]))
+            for valores in colunas.values():
+                valores.clear()
+
+# Acrescenta as linhas de uma narrativa às pendentes e grava um grupo de linhas quando ele enche
+def _acrescentar_narrativa(saida, nome_narrativa, texto_prompt, chave, colunas_entidades, n_entidades):
+    narrativas, entidades = saida["pendentes"]["narrativas"], saida["pendentes"]["entidades"]
+    narrativas["nomeNarrativa"].append(nome_narrativa)
+    narrativas["textoPrompt"].append(texto_prompt)
+    narrativas["chave"].append(chave)
+    narrativas["n_entidades"].append(n_entidades)
+    entidades["nomeNarrativa"].extend([nome_narrativa] * n_entidades)
+    for coluna in COLUNAS_ENTIDADES[1:]:
+        entidades[coluna].extend(colunas_entidades[coluna])
+    saida["gravadas"].add(nome_narrativa)
+    saida["narrativas"] += 1
+    saida["entidades"] += n_entidades
+    if len(entidades["nomeNarrativa"]) >= LINHAS_POR_GRUPO:
+        _gravar_pendentes(saida)
+
+# Acrescenta uma narrativa: o texto anotado vai uma vez para a tabela de narrativas e as entidades para a outra
+# df: DataFrame de criar_dataframe (ou lido de um CSV individual antigo), já ordenado por termo
+# chave: chave do manifesto com que a narrativa foi extraída (permite reaproveitá-la na próxima execução)
+def gravar_narrativa_colunar(saida, nome_narrativa, df, chave=None):
+    if nome_narrativa in saida["gravadas"]:
+        return
+    colunas = {coluna: [_valor(valor) for valor in df[coluna].tolist()] for coluna in COLUNAS_ENTIDADES[1:]}
+    texto_prompt = _valor(df["textoPrompt"].iloc[0]) if len(df) else None
+    _acrescentar_narrativa(saida, nome_narrativa, texto_prompt, chave, colunas, len(df))
+
+# Copia uma narrativa da saída anterior, sem passar por DataFrame (as entidades já estão ordenadas)
+def copiar_narrativa_anterior(saida, nome_narrativa):
+    if nome_narrativa in saida["gravadas"]:
+        return
+    tabelas = saida["anterior"]["tabelas"]
+    chave, linha, inicio, n = saida["anterior"]["indice"][nome_narrativa]
+    texto_prompt = tabelas["narrativas"].column("textoPrompt")[linha].as_py() if linha is not None else None
+    trecho = tabelas["entidades"].slice(inicio, n)
+    colunas = {coluna: trecho.column(coluna).to_pylist() for coluna in COLUNAS_ENTIDADES[1:]}
+    _acrescentar_narrativa(saida, nome_narrativa, texto_prompt, chave, colunas, n)
+
+# Conclui a gravação e substitui a saída anterior; retorna o caminho da pasta (None se nenhuma narrativa foi gravada)
+# preservar_anteriores=True (extração interrompida): copia antes as narrativas da saída anterior que não foram
+# regravadas, então a nova saída é a anterior atualizada com o que esta execução concluiu
+def fechar_saida_colunar(saida, preservar_anteriores=False):
+    if preservar_anteriores and saida["anterior"] is not None:
+        for nome_narrativa in saida["anterior"]["indice"]:
+            copiar_narrativa_anterior(saida, nome_narrativa)
+    saida["anterior"] = None  # Solta o mapeamento dos arquivos que serão substituídos
+    _gravar_pendentes(saida)
+    for escritor in saida["escritores"].values():
+        escritor.close()
+    if not saida["narrativas"]:
+        descartar_saida_colunar(saida)
+        return None
+    # A tabela de entidades é substituída por último: um leitor nunca vê entidades sem as narrativas delas
+    os.replace(saida["temporarios"]["narrativas"], os.path.join(saida["caminho"], ARQUIVO_NARRATIVAS))
+    os.replace(saida["temporarios"]["entidades"], os.path.join(saida["caminho"], ARQUIVO_ENTIDADES))
+    return saida["caminho"]
+
+# Interrompe a gravação sem tocar na saída anterior
+def descartar_saida_colunar(saida):
+    saida["anterior"] = None
+    for tabela, escritor in saida["escritores"].items():
+        if escritor.is_open:
+            escritor.close()
+        if os.path.exists(saida["temporarios"][tabela]):
+            os.remove(saida["temporarios"][tabela])
+
+# Indica se o caminho é uma saída colunar (pasta com as duas tabelas)
+def e_saida_colunar(caminho):
+    return os.path.isfile(os.path.join(caminho, ARQUIVO_ENTIDADES))
+
+# Abre as duas tabelas mapeadas em memória (as colunas apontam para o arquivo, sem cópia)
+# colunas_entidades: lê só essas colunas da tabela de entidades
+def carregar_saida_colunar(caminho, colunas_entidades=None):
+    import pyarrow.parquet as pq
+    return {
+        "narrativas": pq.read_table(os.path.join(caminho, ARQUIVO_NARRATIVAS), memory_map=True),
+        "entidades": pq.read_table(os.path.join(caminho, ARQUIVO_ENTIDADES), columns=colunas_entidades, memory_map=True),
+    }
+
+# Texto anotado de cada narrativa (nomeNarrativa -> textoPrompt)
+def textos_narrativas(saida):
+    tabela = saida["narrativas"]
+    return dict(zip(tabela.column("nomeNarrativa").to_pylist(), tabela.column("textoPrompt").to_pylist()))
+
+# Percorre as entidades em ordem de nome da narrativa, em tabelas de até LINHAS_POR_GRUPO linhas
+# (as entidades de cada narrativa já estão ordenadas por termo); as fatias apontam para o arquivo mapeado
+def iterar_entidades_ordenadas(saida):
+    import pyarrow as pa
+
+    fatias, linhas = [], 0
+    for nome, (_, inicio, n) in sorted(_intervalos(saida).items()):
+        fatias.append(saida["entidades"].slice(inicio, n))
+        linhas += n
+        if linhas >= LINHAS_POR_GRUPO:
+            yield pa.concat_tables(fatias)
+            fatias, linhas = [], 0
+    if fatias:
+        yield pa.concat_tables(fatias)
+
+# Exporta o CSV mestre no formato antigo (textoPrompt repetido em cada linha, ordenado por narrativa e termo),
+# um grupo de linhas por vez
+def exportar_csv_mestre(caminho, csv_mestre):
+    saida = carregar_saida_colunar(caminho)
+    textos = textos_narrativas(saida)
+    caminho_temp = f"{csv_mestre}.{os.getpid()}.tmp"
+    with open(caminho_temp, 'w', encoding='utf-8', newline='') as f:
+        for i, tabela in enumerate(iterar_entidades_ordenadas(saida)):
+            df = tabela.to_pandas()
+            for coluna in COLUNAS_CATEGORICAS:
+                df[coluna] = df[coluna].astype(object)
+            df.insert(1, "textoPrompt", df["nomeNarrativa"].map(textos))
+            df[COLUNAS_CSV_MESTRE].to_csv(f, index=False, header=(i == 0), sep=',')
+    os.replace(caminho_temp, csv_mestre)
+    return csv_mestre
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Uso: python -m utils.saida_colunar <pasta extracao_colunar> <csv_mestre>")
+        sys.exit(1)
+    print(f"✅ CSV mestre exportado: {exportar_csv_mestre(sys.argv[1], sys.argv[2])}")
@@ -0,0 +1,406 @@
+import json
+import time
+import asyncio
+import argparse
+import bisect
+from concurrent.futures import ThreadPoolExecutor
+
+from .processador_llama import PesquisaClin_Llama, PesquisaClin_Llama_streaming
+from .processador_csv import criar_dataframe
+from .cache_completions import abrir_cache_completions, fechar_cache_completions
+
+# Serviço local de extração: o modelo é carregado uma única vez e atende pedidos HTTP (TCP em localhost ou socket Unix).
+# Os pedidos entram em uma fila limitada (cheia -> 503), são agrupados em micro-lotes e executados um lote por vez
+# em uma única thread, já que o modelo não aceita chamadas concorrentes. Com a API de lote do llama_cpp, os textos de
+# um micro-lote são decodificados juntos, em sequências paralelas (decodificacao_lote); sem ela, ou com gramática,
+# um por vez. Cada pedido tem seu próprio tempo limite: o que expira antes de sua vez no modelo é descartado, mas um
+# micro-lote já em decodificação vai até o fim (a resposta de quem expirou ainda vai para o cache de completions).
+#
+#   POST /extrair   {"texto": "...", "nome": "0001.xml", "timeout": 60}  -> entidades extraídas e resposta do modelo
+#   GET  /saude     estado da fila
+#   GET  /metricas  contadores e histogramas de latência (espera na fila, inferência e total)
+
+TAMANHO_FILA = 64  # Pedidos aguardando; acima disso o serviço recusa com 503
+TAMANHO_LOTE = 8  # Máximo de pedidos agrupados em um micro-lote
+ESPERA_LOTE = 0.01  # Segundos aguardando mais pedidos antes de fechar um lote
+TIMEOUT_PADRAO = 120.0  # Tempo limite de um pedido (segundos), contando a espera na fila
+TIMEOUT_MAXIMO = 600.0
+TAMANHO_MAXIMO_CORPO = 1024 * 1024  # Corpo máximo de um pedido (bytes)
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+STATUS_HTTP = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+               500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+# Histograma de latências com limites fixos (segundos); a última faixa é "acima do maior limite"
+def novo_histograma(limites=LIMITES_HISTOGRAMA):
+    return {"limites": list(limites), "contagens": [0] * (len(limites) + 1), "soma": 0.0, "total": 0}
+
+def registrar_latencia(histograma, segundos):
+    histograma["contagens"][bisect.bisect_left(histograma["limites"], segundos)] += 1
+    histograma["soma"] += segundos
+    histograma["total"] += 1
+
+# Quantil aproximado: limite superior da faixa em que ele cai (None sem observações)
+def quantil_histograma(histograma, q):
+    if not histograma["total"]:
+        return None
+    alvo = q * histograma["total"]
+    acumulado = 0
+    for limite, contagem in zip(histograma["limites"] + [float("inf")], histograma["contagens"]):
+        acumulado += contagem
+        if acumulado >= alvo:
+            return limite
+    return float("inf")
+
+def resumo_histograma(histograma):
+    total = histograma["total"]
+    faixas = {f"<={limite}": contagem for limite, contagem in zip(histograma["limites"], histograma["contagens"])}
+    faixas[f">{histograma['limites'][-1]}"] = histograma["contagens"][-1]
+    return {
+        "total": total,
+        "media": histograma["soma"] / total if total else None,
+        "p50": quantil_histograma(histograma, 0.5),
+        "p95": quantil_histograma(histograma, 0.95),
+        "p99": quantil_histograma(histograma, 0.99),
+        "faixas": faixas,
+    }
+
+# Cria o estado do serviço para um modelo já carregado (qualquer objeto com a interface do Llama)
+# config_cache_completions: argumentos de abrir_cache_completions; a conexão SQLite é aberta na thread do modelo,
+# a única que a usa
+def criar_servico(llm, max_tokens=512, temperature=0.0, modo_saida="completo", usar_gramatica=False, streaming=False,
+                  cache_prefixo=None, config_cache_completions=None, tamanho_fila=TAMANHO_FILA, tamanho_lote=TAMANHO_LOTE,
+                  espera_lote=ESPERA_LOTE, timeout=TIMEOUT_PADRAO, n_sequencias_lote=TAMANHO_LOTE, n_ctx_lote=None):
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="modelo")
+    cache_completions = None
+    if config_cache_completions:
+        cache_completions = executor.submit(abrir_cache_completions, **config_cache_completions).result()
+    return {
+        "llm": llm,
+        "parametros": {
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "cache_prefixo": cache_prefixo,
+            "cache_completions": cache_completions,
+            "modo_saida": modo_saida,
+            "usar_gramatica": usar_gramatica,
+        },
+        "streaming": streaming,
+        "tamanho_fila": tamanho_fila,
+        "tamanho_lote": tamanho_lote,
+        "espera_lote": espera_lote,
+        "timeout": timeout,
+        "n_sequencias_lote": n_sequencias_lote,  # Sequências paralelas da decodificação em lote (< 2 desativa)
+        "n_ctx_lote": n_ctx_lote,
+        "contexto_lote": None,  # Criado no primeiro micro-lote, na thread do modelo
+        "fila": None,  # asyncio.Queue, criada dentro do laço de eventos
+        "executor": executor,
+        "contadores": {"aceitos": 0, "recusados": 0, "expirados": 0, "erros": 0, "concluidos": 0, "lotes": 0,
+                       "descartados_antes_do_modelo": 0, "descartados_no_lote": 0, "repetidos_no_lote": 0,
+                       "lotes_decodificados_juntos": 0},
+        "histogramas": {"espera_fila": novo_histograma(), "inferencia": novo_histograma(), "total": novo_histograma()},
+        "tamanhos_lote": {},
+    }
+
+# Extrai as entidades de um texto (executa na thread do modelo)
+def extrair_entidades(servico, nome, texto):
+    inicio = time.perf_counter()
+    parametros = servico["parametros"]
+    if servico["streaming"]:
+        fluxo = PesquisaClin_Llama_streaming(texto, servico["llm"], **parametros)
+        while True:
+            try:
+                next(fluxo)
+            except StopIteration as fim:
+                resposta = fim.value
+                break
+    else:
+        resposta = PesquisaClin_Llama(texto, servico["llm"], **parametros)
+    return resultado_extracao(nome, resposta, parametros["modo_saida"], time.perf_counter() - inicio)
+
+# Resultado de um pedido: entidades extraídas da resposta do modelo (valores ausentes como None)
+def resultado_extracao(nome, resposta, modo_saida, tempo_inferencia):
+    df = criar_dataframe(resposta, nome, modo_saida)
+    entidades = []
+    if df is not None:
+        for registro in df.drop(columns=["nomeNarrativa", "textoPrompt"]).to_dict("records"):
+            entidades.append({chave: (None if valor != valor else valor) for chave, valor in registro.items()})
+    return {"nome": nome, "entidades": entidades, "resposta": resposta, "tempo_inferencia": tempo_inferencia}
+
+# Indica se os micro-lotes podem ser decodificados juntos (API de lote do llama_cpp, sem gramática)
+def decodificacao_em_lote_ativa(servico):
+    from .decodificacao_lote import decodificacao_em_lote_disponivel
+    return (servico["n_sequencias_lote"] > 1 and not servico["parametros"]["usar_gramatica"]
+            and decodificacao_em_lote_disponivel(servico["llm"]))
+
+# Decodifica os textos juntos, em sequências paralelas de um único contexto; o tempo de inferência é o do lote
+def extrair_entidades_em_lote(servico, nomes, textos):
+    from .decodificacao_lote import criar_contexto_lote, PesquisaClin_Llama_lote
+
+    parametros = servico["parametros"]
+    if servico["contexto_lote"] is None:
+        servico["contexto_lote"] = criar_contexto_lote(servico["llm"], servico["n_sequencias_lote"], servico["n_ctx_lote"])
+    inicio = time.perf_counter()
+    respostas = PesquisaClin_Llama_lote(
+        textos, servico["llm"], servico["contexto_lote"], max_tokens=parametros["max_tokens"],
+        temperature=parametros["temperature"], cache_completions=parametros["cache_completions"],
+        modo_saida=parametros["modo_saida"], parada_antecipada=servico["streaming"], nomes=nomes
+    )
+    tempo = time.perf_counter() - inicio
+    servico["contadores"]["lotes_decodificados_juntos"] += 1
+    return [resultado_extracao(nome, resposta, parametros["modo_saida"], tempo) for nome, resposta in zip(nomes, respostas)]
+
+# Executa um micro-lote na thread do modelo; textos repetidos no lote são extraídos uma única vez
+# Textos cujos pedidos todos já expiraram não vão ao modelo (resultado: TimeoutError, que ninguém mais aguarda)
+def processar_lote(servico, pedidos):
+    pedidos_por_texto = {}
+    for pedido in pedidos:
+        if pedido["texto"] in pedidos_por_texto:
+            servico["contadores"]["repetidos_no_lote"] += 1
+        pedidos_por_texto.setdefault(pedido["texto"], []).append(pedido)
+
+    def expirado(texto):
+        return all(pedido["futuro"].done() for pedido in pedidos_por_texto[texto])
+
+    resultados = {}
+    textos = list(pedidos_por_texto)
+    if len(textos) > 1 and decodificacao_em_lote_ativa(servico):
+        textos = [texto for texto in textos if not expirado(texto)]
+        try:
+            extraidos = extrair_entidades_em_lote(servico, [pedidos_por_texto[t][0]["nome"] for t in textos], textos)
+            resultados.update(zip(textos, extraidos))
+        except Exception as e:
+            print(f"\n⚠️ Erro na decodificação em lote: {e}. Processando o micro-lote um pedido por vez.")
+
+    for texto in pedidos_por_texto:
+        if texto in resultados:
+            continue
+        if expirado(texto):
+            servico["contadores"]["descartados_no_lote"] += 1
+            resultados[texto] = asyncio.TimeoutError("pedido expirado antes da extração")
+            continue
+        try:
+            resultados[texto] = extrair_entidades(servico, pedidos_por_texto[texto][0]["nome"], texto)
+        except Exception as e:
+            resultados[texto] = e
+    return resultados
+
+# Tarefa que consome a fila: junta até tamanho_lote pedidos (ou o que chegar em espera_lote segundos) e os executa
+async def _consumir_fila(servico):
+    laco = asyncio.get_running_loop()
+    fila = servico["fila"]
+    while True:
+        lote = [await fila.get()]
+        prazo = laco.time() + servico["espera_lote"]
+        while len(lote) < servico["tamanho_lote"]:
+            restante = prazo - laco.time()
+            if restante <= 0:
+                break
+            try:
+                lote.append(await asyncio.wait_for(fila.get(), restante))
+            except asyncio.TimeoutError:
+                break
+
+        # Pedidos que expiraram (ou cujo cliente desistiu) enquanto esperavam não chegam ao modelo
+        ativos = [pedido for pedido in lote if not pedido["futuro"].done()]
+        servico["contadores"]["descartados_antes_do_modelo"] += len(lote) - len(ativos)
+        if not ativos:
+            continue
+
+        inicio = time.perf_counter()
+        for pedido in ativos:
+            registrar_latencia(servico["histogramas"]["espera_fila"], inicio - pedido["chegada"])
+        servico["contadores"]["lotes"] += 1
+        servico["tamanhos_lote"][len(ativos)] = servico["tamanhos_lote"].get(len(ativos), 0) + 1
+
+        resultados = await laco.run_in_executor(servico["executor"], processar_lote, servico, ativos)
+        for texto, resultado in resultados.items():
+            if not isinstance(resultado, Exception):
+                registrar_latencia(servico["histogramas"]["inferencia"], resultado["tempo_inferencia"])
+        for pedido in ativos:
+            resultado = resultados[pedido["texto"]]
+            if pedido["futuro"].done():
+                continue
+            if isinstance(resultado, Exception):
+                pedido["futuro"].set_exception(resultado)
+            else:
+                pedido["futuro"].set_result({**resultado, "nome": pedido["nome"]})
+
+# Enfileira um pedido e aguarda o resultado; levanta asyncio.QueueFull (fila cheia) ou asyncio.TimeoutError
+async def submeter_pedido(servico, texto, nome="pedido", timeout=None):
+    futuro = asyncio.get_running_loop().create_future()
+    pedido = {"nome": nome, "texto": texto, "futuro": futuro, "chegada": time.perf_counter()}
+    try:
+        servico["fila"].put_nowait(pedido)
+    except asyncio.QueueFull:
+        servico["contadores"]["recusados"] += 1
+        raise
+    servico["contadores"]["aceitos"] += 1
+
+    try:
+        resultado = await asyncio.wait_for(futuro, timeout or servico["timeout"])  # Cancela o futuro ao expirar
+    except asyncio.TimeoutError:
+        servico["contadores"]["expirados"] += 1
+        raise
+    except Exception:
+        servico["contadores"]["erros"] += 1
+        raise
+    servico["contadores"]["concluidos"] += 1
+    registrar_latencia(servico["histogramas"]["total"], time.perf_counter() - pedido["chegada"])
+    return resultado
+
+# Contadores, ocupação da fila e resumo dos histogramas
+def estatisticas_servico(servico):
+    fila = servico["fila"]
+    return {
+        "fila": fila.qsize() if fila is not None else 0,
+        "capacidade_fila": servico["tamanho_fila"],
+        "contadores": dict(servico["contadores"]),
+        "tamanhos_lote": {str(tamanho): n for tamanho, n in sorted(servico["tamanhos_lote"].items())},
+        "latencias": {nome: resumo_histograma(h) for nome, h in servico["histogramas"].items()},
+    }
+
+# Trata um pedido já lido e retorna (status, corpo JSON, cabeçalhos extras)
+async def _rotear(servico, metodo, caminho, corpo):
+    caminho = caminho.split('?', 1)[0]
+    if caminho == "/saude":
+        return 200, {"status": "ok", "fila": servico["fila"].qsize(), "capacidade_fila": servico["tamanho_fila"]}, {}
+    if caminho == "/metricas":
+        return 200, estatisticas_servico(servico), {}
+    if caminho != "/extrair":
+        return 404, {"erro": f"Rota desconhecida: {caminho}"}, {}
+    if metodo != "POST":
+        return 405, {"erro": "Use POST em /extrair"}, {"Allow": "POST"}
+
+    try:
+        dados = json.loads(corpo or b"{}")
+        texto = dados["texto"]
+        if not isinstance(texto, str) or not texto.strip():
+            raise ValueError("texto vazio")
+        timeout = min(float(dados.get("timeout") or servico["timeout"]), TIMEOUT_MAXIMO)
+    except (ValueError, KeyError, TypeError) as e:
+        return 400, {"erro": f"Pedido inválido (esperado {{\"texto\": \"...\"}}): {e}"}, {}
+
+    try:
+        resultado = await submeter_pedido(servico, texto, str(dados.get("nome") or "pedido"), timeout)
+    except asyncio.QueueFull:
+        return 503, {"erro": "Fila cheia, tente novamente."}, {"Retry-After": "1"}
+    except asyncio.TimeoutError:
+        return 504, {"erro": f"Tempo limite de {timeout:.0f}s excedido."}, {}
+    except Exception as e:
+        return 500, {"erro": f"Erro na extração: {e}"}, {}
+    return 200, resultado, {}
+
+# Lê um pedido HTTP/1.1 simples (uma requisição por conexão) e escreve a resposta JSON
+async def _atender_conexao(servico, leitor, escritor):
+    try:
+        try:
+            linha = (await leitor.readline()).decode('latin-1').strip()
+            metodo, caminho, _ = linha.split(' ', 2)
+            cabecalhos = {}
+            while True:
+                linha_cabecalho = (await leitor.readline()).decode('latin-1')
+                if linha_cabecalho in ('\r\n', '\n', ''):
+                    break
+                chave, _, valor = linha_cabecalho.partition(':')
+                cabecalhos[chave.strip().lower()] = valor.strip()
+            tamanho = int(cabecalhos.get('content-length', 0))
+        except ValueError:
+            status, resposta, extras = 400, {"erro": "Pedido HTTP inválido"}, {}
+        else:
+            if tamanho > TAMANHO_MAXIMO_CORPO:
+                status, resposta, extras = 413, {"erro": f"Corpo maior que {TAMANHO_MAXIMO_CORPO} bytes"}, {}
+            else:
+                corpo = await leitor.readexactly(tamanho) if tamanho else b""
+                status, resposta, extras = await _rotear(servico, metodo.upper(), caminho, corpo)
+
+        conteudo = json.dumps(resposta, ensure_ascii=False).encode('utf-8')
+        cabecalhos_resposta = {"Content-Type": "application/json; charset=utf-8", "Content-Length": str(len(conteudo)),
+                               "Connection": "close", **extras}
+        escritor.write(f"HTTP/1.1 {status} {STATUS_HTTP[status]}\r\n".encode('latin-1'))
+        escritor.write("".join(f"{chave}: {valor}\r\n" for chave, valor in cabecalhos_resposta.items()).encode('latin-1'))
+        escritor.write(b"\r\n" + conteudo)
+        await escritor.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass  # Cliente desconectou
+    finally:
+        escritor.close()
+
+# Inicia o servidor (TCP ou socket Unix) e a tarefa que consome a fila; retorna o asyncio.Server
+async def iniciar_servico(servico, host="127.0.0.1", porta=8765, caminho_unix=None):
+    servico["fila"] = asyncio.Queue(maxsize=servico["tamanho_fila"])
+    servico["consumidor"] = asyncio.create_task(_consumir_fila(servico))
+
+    async def atender(leitor, escritor):
+        await _atender_conexao(servico, leitor, escritor)
+
+    if caminho_unix:
+        return await asyncio.start_unix_server(atender, path=caminho_unix)
+    return await asyncio.start_server(atender, host, porta)
+
+# Para o servidor e a tarefa da fila
+async def encerrar_servico(servico, servidor):
+    servidor.close()
+    await servidor.wait_closed()
+    servico["consumidor"].cancel()
+    try:
+        await servico["consumidor"]
+    except asyncio.CancelledError:
+        pass
+    if servico["contexto_lote"] is not None:
+        from .decodificacao_lote import fechar_contexto_lote
+        servico["executor"].submit(fechar_contexto_lote, servico["contexto_lote"]).result()
+    cache_completions = servico["parametros"]["cache_completions"]
+    if cache_completions is not None:
+        servico["executor"].submit(fechar_cache_completions, cache_completions).result()
+    servico["executor"].shutdown(wait=True)
+
+async def _executar(servico, host, porta, caminho_unix):
+    servidor = await iniciar_servico(servico, host, porta, caminho_unix)
+    endereco = caminho_unix or f"http://{host}:{servidor.sockets[0].getsockname()[1]}"
+    print(f"\n🚀 Serviço de extração ouvindo em {endereco} (POST /extrair, GET /saude, GET /metricas)")
+    try:
+        await servidor.serve_forever()
+    finally:
+        await encerrar_servico(servico, servidor)
+
+if __name__ == "__main__":
+    from comando_llama.prompt import MODOS_SAIDA
+    from .cache_prefixo import preparar_cache_prefixo
+
+    parser = argparse.ArgumentParser(description="Serviço local de extração de termos clínicos (modelo carregado uma vez).")
+    parser.add_argument("--modelo", default="modelo/Llama-3.2-3B-Instruct-Q4_K_M.gguf", help="Arquivo GGUF")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--unix", help="Caminho de um socket Unix (substitui host/porta)")
+    parser.add_argument("--n-ctx", type=int, default=8192)
+    parser.add_argument("--n-threads", type=int, default=8)
+    parser.add_argument("--n-gpu-layers", type=int, default=20)
+    parser.add_argument("--max-tokens", type=int, default=512)
+    parser.add_argument("--modo-saida", choices=sorted(MODOS_SAIDA), default="completo")
+    parser.add_argument("--gramatica", action="store_true", help="Restringe a saída com a gramática GBNF")
+    parser.add_argument("--streaming", action="store_true", help="Decodifica em fluxo, com parada antecipada")
+    parser.add_argument("--tamanho-fila", type=int, default=TAMANHO_FILA)
+    parser.add_argument("--tamanho-lote", type=int, default=TAMANHO_LOTE)
+    parser.add_argument("--sequencias-lote", type=int, default=TAMANHO_LOTE,
+                        help="Sequências paralelas na decodificação do micro-lote (0 ou 1: um pedido por vez)")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_PADRAO)
+    parser.add_argument("--cache-prefixo", default="data/cache/prefixo_prompt.pkl", help="Snapshot do prefixo do prompt")
+    parser.add_argument("--cache-completions", default="data/cache/completions.sqlite", help="Cache de respostas ('' desativa)")
+    args = parser.parse_args()
+
+    from llama_cpp import Llama
+
+    llm = Llama(model_path=args.modelo, n_ctx=args.n_ctx, n_threads=args.n_threads, n_gpu_layers=args.n_gpu_layers)
+    servico = criar_servico(
+        llm, max_tokens=args.max_tokens, temperature=0.0, modo_saida=args.modo_saida, usar_gramatica=args.gramatica,
+        streaming=args.streaming,
+        config_cache_completions={"caminho": args.cache_completions} if args.cache_completions else None,
+        cache_prefixo=preparar_cache_prefixo(llm, MODOS_SAIDA[args.modo_saida]["template"], args.cache_prefixo or None),
+        tamanho_fila=args.tamanho_fila, tamanho_lote=args.tamanho_lote, timeout=args.timeout,
+        n_sequencias_lote=args.sequencias_lote
+    )
+    try:
+        asyncio.run(_executar(servico, args.host, args.porta, args.unix))
+    except KeyboardInterrupt:
+        print("\n🛑 Serviço encerrado.")
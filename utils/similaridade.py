@@ -1,9 +1,14 @@
-from .processador_xml import stem_frase
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+import numpy as np
+
+from .processador_xml import stem_frase, radicais_vocabulario
+
+# scikit-learn e scipy são importados dentro das funções: só a etapa de similaridade paga pelo tempo de importação
 
 # Calcula similaridade entre dois textos usando TF-IDF e cosine similarity
 def medir_similaridade(t1, t2):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
     # Aplica stemmer para reduzir palavras à raiz
     doc1 = stem_frase(t1)
     doc2 = stem_frase(t2)
@@ -28,3 +33,35 @@ def medir_similaridade(t1, t2):
 
     # Retorna o valor máximo entre comparação com stemmer e sem stemmer
     return max(resultado_radical, resultado)
+
+# Similaridade cosseno TF-IDF entre todos os termos de duas listas, com um único ajuste do vetorizador
+def _matriz_cosseno(docs_a, docs_b):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    try:
+        matriz = TfidfVectorizer().fit_transform(docs_a + docs_b)
+    except ValueError:
+        return np.zeros((len(docs_a), len(docs_b)))  # Vocabulário vazio
+    # Linhas do TF-IDF já saem com norma L2, então o produto esparso é a similaridade cosseno
+    return (matriz[:len(docs_a)] @ matriz[len(docs_a):].T).toarray()
+
+# Matriz de similaridade (termos_a x termos_b): máximo entre a comparação com stemmer e sem stemmer
+def matriz_similaridade(termos_a, termos_b):
+    termos_a = [str(t) for t in termos_a]
+    termos_b = [str(t) for t in termos_b]
+    # Radicais do vocabulário das duas listas calculados uma única vez
+    vocabulario = radicais_vocabulario(w for t in termos_a + termos_b for w in t.split())
+    radicais_a = [" ".join(vocabulario[w] for w in t.split()) for t in termos_a]
+    radicais_b = [" ".join(vocabulario[w] for w in t.split()) for t in termos_b]
+    radicais = _matriz_cosseno(radicais_a, radicais_b)
+    return np.maximum(radicais, _matriz_cosseno(termos_a, termos_b))
+
+# Pareia termos das duas listas maximizando a similaridade total (cada termo entra em no máximo um par)
+# Retorna [(i, j, similaridade)] apenas para pares acima do limiar, em ordem de i
+def parear_similares(termos_a, termos_b, limiar=0.7):
+    if not termos_a or not termos_b:
+        return []
+    from scipy.optimize import linear_sum_assignment
+    similaridades = matriz_similaridade(termos_a, termos_b)
+    pesos = np.where(similaridades > limiar, similaridades, 0.0)
+    linhas, colunas = linear_sum_assignment(pesos, maximize=True)
+    return [(int(i), int(j), float(similaridades[i, j])) for i, j in zip(linhas, colunas) if pesos[i, j] > 0]
@@ -0,0 +1,98 @@
+import os
+import re
+import time
+import sqlite3
+
+from .processador_xml import padronizar_string
+from .processador_excel import carregar_dicionario
+
+# Abre (ou cria) o armazenamento de verificações SNOMED: (SCTID, termo normalizado) -> veredito 0, 1 ou 2
+def abrir_verificacoes(caminho, caminho_dicionario_legado=None):
+    pasta = os.path.dirname(caminho)
+    if pasta:
+        os.makedirs(pasta, exist_ok=True)
+
+    conexao = sqlite3.connect(caminho, timeout=30)
+    conexao.execute("PRAGMA journal_mode=WAL")
+    conexao.execute("""
+        CREATE TABLE IF NOT EXISTS verificacoes (
+            sctid TEXT NOT NULL,
+            termo TEXT NOT NULL,
+            veredito INTEGER NOT NULL,
+            atualizado_em REAL NOT NULL,
+            PRIMARY KEY (sctid, termo)
+        )
+    """)
+    conexao.commit()
+
+    verificacoes = {"conexao": conexao, "acertos": 0, "falhas": 0}
+
+    # Importa o dicionario.json antigo (SCTID -> termos que correspondem, ou seja, veredito 2)
+    if caminho_dicionario_legado:
+        importar_dicionario_legado(verificacoes, caminho_dicionario_legado)
+    return verificacoes
+
+# Fecha a conexão do armazenamento
+def fechar_verificacoes(verificacoes):
+    verificacoes["conexao"].close()
+
+# Normaliza o SCTID para texto sem perder precisão (SCTIDs podem ter até 18 dígitos)
+def normalizar_sctid(valor):
+    if isinstance(valor, float):
+        return str(int(valor))
+    texto = str(valor).strip()
+    if texto.endswith('.0'):
+        texto = texto[:-2]
+    return str(int(texto))  # Levanta ValueError se não for numérico
+
+# Normaliza o termo: minúsculas, sem acentos e com espaços simples
+def normalizar_termo(termo):
+    return re.sub(r'\s+', ' ', padronizar_string(termo)).strip()
+
+# Importa os pares do dicionário JSON legado como veredito 2, sem sobrescrever vereditos já registrados
+def importar_dicionario_legado(verificacoes, caminho_dicionario):
+    dicionario = carregar_dicionario(caminho_dicionario)
+    linhas = []
+    agora = time.time()
+    for sctid, termos in dicionario.items():
+        try:
+            chave_sctid = normalizar_sctid(sctid)
+        except ValueError:
+            continue
+        for termo in termos:
+            linhas.append((chave_sctid, normalizar_termo(termo), 2, agora))
+    if linhas:
+        with verificacoes["conexao"]:
+            verificacoes["conexao"].executemany(
+                "INSERT OR IGNORE INTO verificacoes (sctid, termo, veredito, atualizado_em) VALUES (?, ?, ?, ?)",
+                linhas
+            )
+
+# Busca o veredito já registrado para o par (SCTID, termo); retorna None se o par nunca foi verificado
+def buscar_veredito(verificacoes, sctid, termo):
+    linha = verificacoes["conexao"].execute(
+        "SELECT veredito FROM verificacoes WHERE sctid = ? AND termo = ?",
+        (normalizar_sctid(sctid), normalizar_termo(termo))
+    ).fetchone()
+    if linha is None:
+        verificacoes["falhas"] += 1
+        return None
+    verificacoes["acertos"] += 1
+    return linha[0]
+
+# Registra um veredito (0, 1 ou 2); cada escrita é uma transação, então o arquivo nunca fica pela metade
+def registrar_veredito(verificacoes, sctid, termo, veredito):
+    with verificacoes["conexao"]:
+        verificacoes["conexao"].execute(
+            "INSERT OR REPLACE INTO verificacoes (sctid, termo, veredito, atualizado_em) VALUES (?, ?, ?, ?)",
+            (normalizar_sctid(sctid), normalizar_termo(termo), int(veredito), time.time())
+        )
+
+# Retorna acertos, falhas e taxa de acerto das consultas
+def estatisticas_verificacoes(verificacoes):
+    consultas = verificacoes["acertos"] + verificacoes["falhas"]
+    return {
+        "acertos": verificacoes["acertos"],
+        "falhas": verificacoes["falhas"],
+        "taxa_acerto": verificacoes["acertos"] / consultas if consultas else 0.0,
+    }